@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for embed formatting and payload serialization
+
+Formats large synthetic notifications (payloads.py) into Discord payloads
+the way a sender thread does (format, pack, serialize) and reports embeds
+per second for:
+
+    before           the old field-by-field formatter, clamping every embed,
+                     json.dumps
+    after/stdlib     compiled templates, clamping only oversized embeds,
+                     json.dumps
+    after/orjson     compiled templates, clamping only oversized embeds,
+                     orjson (skipped if not installed)
+
+It also checks that the compiled formatter produces the same embeds as the
+old one (timestamps aside), so a speed-up cannot hide a layout change.
+Pure CPU, no relay process or network needed.
+
+Usage:
+    python3 bench/format_bench.py
+    python3 bench/format_bench.py --notifications 500 --alerts 40 --repeat 5
+    python3 bench/format_bench.py --templates templates.json
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import payloads
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+
+def legacy_format_discord_embed(alert_data):
+    """format_discord_embed() as it was before compiled templates (the "before" side)"""
+    embeds = []
+
+    status = alert_data.get('status', 'unknown')
+
+    for alert in alert_data.get('alerts', []):
+        labels = alert.get('labels', {})
+        annotations = alert.get('annotations', {})
+
+        # Determine color based on status and severity
+        if status == 'firing':
+            severity = labels.get('severity', 'warning')
+            color = 15158332 if severity == 'critical' else 16753920  # Red for critical, orange for warning
+            title = f"🚨 {labels.get('alertname', 'Alert')}"
+        else:
+            color = 3066993  # Green for resolved
+            title = f"✅ {labels.get('alertname', 'Alert')} - RESOLVED"
+
+        # Build description
+        description = annotations.get('summary', annotations.get('description', 'No description available'))
+
+        # Build fields
+        fields = []
+
+        # Add severity
+        if 'severity' in labels:
+            fields.append({
+                'name': 'Severity',
+                'value': labels['severity'].upper(),
+                'inline': True
+            })
+
+        # Add instance
+        if 'instance' in labels:
+            fields.append({
+                'name': 'Instance',
+                'value': labels['instance'],
+                'inline': True
+            })
+
+        # Add service
+        if 'service' in labels:
+            fields.append({
+                'name': 'Service',
+                'value': labels['service'],
+                'inline': True
+            })
+
+        # Add job
+        if 'job' in labels:
+            fields.append({
+                'name': 'Job',
+                'value': labels['job'],
+                'inline': True
+            })
+
+        # Add description if different from summary
+        if 'description' in annotations and annotations['description'] != description:
+            fields.append({
+                'name': 'Details',
+                'value': annotations['description'],
+                'inline': False
+            })
+
+        # Add timestamps
+        starts_at = alert.get('startsAt', '')
+        if starts_at:
+            try:
+                dt = datetime.fromisoformat(starts_at.replace('Z', '+00:00'))
+                fields.append({
+                    'name': 'Started',
+                    'value': dt.strftime('%Y-%m-%d %H:%M:%S UTC'),
+                    'inline': True
+                })
+            except:
+                pass
+
+        embed = {
+            'title': title,
+            'description': description,
+            'color': color,
+            'fields': fields,
+            'footer': {
+                'text': f"Homelab Monitoring • {alert_data.get('externalURL', 'Alertmanager')}"
+            },
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+        embeds.append(embed)
+
+    return embeds
+
+
+def legacy_pack_embeds(relay, embeds):
+    """pack_embeds() as it was: every embed copied through clamp_embed()"""
+    payloads, current, current_len = [], [], 0
+    for embed in embeds:
+        embed = relay.clamp_embed(embed)
+        length = relay.embed_length(embed)
+        if current and (len(current) >= relay.MAX_EMBEDS_PER_MESSAGE or
+                        current_len + length > relay.MAX_EMBED_CHARS_PER_MESSAGE):
+            payloads.append({'embeds': current})
+            current, current_len = [], 0
+        current.append(embed)
+        current_len += length
+    if current:
+        payloads.append({'embeds': current})
+    return payloads
+
+
+def run(notifications, formatter, encoder, pack_embeds):
+    """Format, pack and serialize every notification; returns (embeds, bytes, seconds)"""
+    embeds = size = 0
+    started = time.perf_counter()
+    for data in notifications:
+        formatted = formatter(data)
+        embeds += len(formatted)
+        for payload in pack_embeds(formatted):
+            size += len(encoder(payload))
+    return embeds, size, time.perf_counter() - started
+
+
+def same_layout(relay, notifications):
+    """True if compiled and legacy embeds match apart from the timestamp"""
+    for data in notifications:
+        new = relay.format_discord_embed(data)
+        old = legacy_format_discord_embed(data)
+        for a, b in zip(new, old):
+            if dict(a, timestamp=None) != dict(b, timestamp=None):
+                return False
+        if len(new) != len(old):
+            return False
+    return True
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Embed formatting and serialization micro-benchmark')
+    ap.add_argument('--notifications', type=int, default=200)
+    ap.add_argument('--alerts', type=int, default=40, help='alerts per notification')
+    ap.add_argument('--annotation-size', type=int, default=600)
+    ap.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    ap.add_argument('--templates', help='RELAY_TEMPLATES_FILE to benchmark (skips the layout check)')
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args(argv)
+
+    if args.templates:
+        os.environ['RELAY_TEMPLATES_FILE'] = args.templates
+    os.environ.setdefault('RELAY_SPOOL_DIR', '')
+    import relay
+
+    notifications = [p for _, p in payloads.generate(
+        args.notifications, seed=args.seed, alerts=(args.alerts, args.alerts),
+        label_cardinality=8, annotation_size=args.annotation_size, resolved_ratio=0.2)]
+
+    variants = [
+        ('before', legacy_format_discord_embed, relay.stdlib_json_bytes,
+         lambda embeds: legacy_pack_embeds(relay, embeds)),
+        ('after/stdlib', relay.format_discord_embed, relay.stdlib_json_bytes, relay.pack_embeds),
+    ]
+    if relay.orjson is not None:
+        variants.append(('after/orjson', relay.format_discord_embed, relay.orjson.dumps, relay.pack_embeds))
+
+    print(f"{args.notifications} notifications x {args.alerts} alerts, "
+          f"annotations ~{args.annotation_size} chars, best of {args.repeat}")
+    if not args.templates:
+        print(f"  layout matches the old formatter: {same_layout(relay, notifications[:20])}")
+    baseline = None
+    for name, formatter, encoder, pack_embeds in variants:
+        embeds, size, seconds = min((run(notifications, formatter, encoder, pack_embeds)
+                                     for _ in range(args.repeat)), key=lambda r: r[2])
+        rate = embeds / seconds
+        baseline = baseline or rate
+        print(f"  {name:<13} {rate:>10,.0f} embeds/s  {size / seconds / 1e6:6.1f} MB/s  "
+              f"{size / len(notifications) / 1024:6.1f} KiB/notification  x{rate / baseline:.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
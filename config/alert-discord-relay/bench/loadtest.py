@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Load-test and benchmark harness for the Alertmanager -> Discord relay
+
+Starts a local stub Discord (stub_discord.py), launches relay.py under
+gunicorn pointed at it, fires synthetic Alertmanager notifications
+(payloads.py) at the relay and reports:
+
+    inbound    webhook POST throughput, p50/p95/p99 latency, status codes
+    delivery   notifications that reached the stub, end-to-end latency
+               (POST sent -> first embed at the stub), messages/embeds/bytes
+               and the stub's response mix
+
+Everything binds to 127.0.0.1; no network access is needed.
+
+Results are written to data/alert-relay-bench/<UTC timestamp>-<scenario>.json
+and compared with the previous run of the same scenario and server mode, so a
+relay change that costs throughput or latency shows up as a regression.
+
+Usage:
+    python3 bench/loadtest.py                          # baseline scenario
+    python3 bench/loadtest.py --scenario flaky --mode asyncio
+    python3 bench/loadtest.py --scenario burst --relay-env RELAY_QUEUE_MAXSIZE=1024
+    python3 bench/loadtest.py --list                   # show scenarios
+
+Exit codes:
+    0  run completed
+    1  regression beyond --regress-pct (with --fail-on-regression)
+    2  relay did not start
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import payloads
+from stub_discord import StubBehaviour, StubDiscord
+
+BENCH_DIR = Path(__file__).resolve().parent
+RELAY_DIR = BENCH_DIR.parent
+REPO_ROOT = RELAY_DIR.parent.parent
+RESULTS_DIR = REPO_ROOT / 'data' / 'alert-relay-bench'
+
+# Each scenario: load shape, payload shape and stub behaviour
+SCENARIOS = {
+    'baseline': {
+        'description': 'steady mixed traffic against a healthy Discord',
+        'notifications': 500, 'concurrency': 16,
+        'shape': {'alerts': (1, 3), 'label_cardinality': 4, 'annotation_size': 120, 'resolved_ratio': 0.2},
+        'stub': {'latency_ms': 50, 'jitter_ms': 20},
+    },
+    'burst': {
+        'description': 'alert storm: many single-alert notifications at once',
+        'notifications': 2000, 'concurrency': 64,
+        'shape': {'alerts': (1, 1), 'label_cardinality': 2, 'annotation_size': 80},
+        'stub': {'latency_ms': 50, 'jitter_ms': 20},
+    },
+    'large': {
+        'description': 'big groups, high label cardinality, long annotations',
+        'notifications': 200, 'concurrency': 8,
+        'shape': {'alerts': (20, 60), 'label_cardinality': 20, 'annotation_size': 1500},
+        'stub': {'latency_ms': 50, 'jitter_ms': 20},
+    },
+    'ratelimited': {
+        'description': "Discord's real webhook bucket (5 per 2s)",
+        'notifications': 300, 'concurrency': 16,
+        'shape': {'alerts': (1, 3), 'label_cardinality': 4, 'annotation_size': 120},
+        'stub': {'latency_ms': 50, 'jitter_ms': 20, 'rate_limit': 5, 'rate_window': 2.0},
+    },
+    'priority': {
+        'description': 'info-heavy flood behind a rate-limited Discord; critical should still arrive first',
+        'notifications': 600, 'concurrency': 32,
+        'shape': {'alerts': (1, 1), 'label_cardinality': 2, 'annotation_size': 80,
+                  'severity_weights': (0.75, 0.2, 0.05)},
+        'stub': {'latency_ms': 50, 'jitter_ms': 20, 'rate_limit': 5, 'rate_window': 2.0},
+    },
+    'fanout': {
+        'description': 'every alert routed to 3 webhooks; should drain about as fast as baseline',
+        'notifications': 500, 'concurrency': 16, 'destinations': 3,
+        'shape': {'alerts': (1, 3), 'label_cardinality': 4, 'annotation_size': 120, 'resolved_ratio': 0.2},
+        'stub': {'latency_ms': 50, 'jitter_ms': 20},
+    },
+    'flaky': {
+        'description': 'slow Discord with random 429s and 5xx errors',
+        'notifications': 300, 'concurrency': 16,
+        'shape': {'alerts': (1, 3), 'label_cardinality': 4, 'annotation_size': 120},
+        'stub': {'latency_ms': 150, 'jitter_ms': 100, 'rate_429': 0.05, 'rate_5xx': 0.05},
+    },
+}
+
+# Metrics compared between runs: (section, key, True if higher is better)
+TRACKED = (
+    ('inbound', 'throughput_rps', True),
+    ('inbound', 'latency_ms.p50', False),
+    ('inbound', 'latency_ms.p95', False),
+    ('inbound', 'latency_ms.p99', False),
+    ('inbound', 'error_rate', False),
+    ('delivery', 'delivery_ratio', True),
+    ('delivery', 'latency_ms.p50', False),
+    ('delivery', 'latency_ms.p95', False),
+    ('delivery', 'latency_ms.p99', False),
+    ('delivery', 'latency_by_severity.critical.p95', False),
+)
+
+SEVERITY_ORDER = {severity: rank for rank, severity in enumerate(payloads.SEVERITIES)}
+
+
+def percentile(ordered, q):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not ordered:
+        return None
+    pos = (len(ordered) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def latency_summary(seconds):
+    """p50/p95/p99/mean/max in milliseconds"""
+    ordered = sorted(s * 1000 for s in seconds)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'p50': round(percentile(ordered, 50), 2),
+        'p95': round(percentile(ordered, 95), 2),
+        'p99': round(percentile(ordered, 99), 2),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'max': round(ordered[-1], 2),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_head():
+    try:
+        head = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--', str(RELAY_DIR)], cwd=REPO_ROOT,
+                               capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return f'{head}-dirty' if dirty else head
+
+
+# ---------------------------------------------------------------------------
+# Relay process
+# ---------------------------------------------------------------------------
+
+
+class RelayProcess:
+    """relay.py under gunicorn with its Discord URL pointed at the stub
+
+    With destinations > 1 the relay gets a routing table that sends every
+    alert to that many webhooks on the stub.
+    """
+
+    def __init__(self, webhook_url, mode, extra_env, destinations=1):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self._tmp = tempfile.TemporaryDirectory(prefix='relay-bench-')
+        self.log_path = Path(self._tmp.name) / 'relay.log'
+        self.env = {
+            'DISCORD_WEBHOOK_URL': webhook_url,
+            'RELAY_SERVER_MODE': mode,
+            # Every synthetic notification is unique, but keep dedup out of the measurement
+            'RELAY_DEDUP_TTL': '0',
+            # Storm digests replace per-alert embeds, so the stub could no longer
+            # match deliveries to notifications by title
+            'RELAY_STORM_ALERTS': '0',
+            'RELAY_STORM_WINDOW_ALERTS': '0',
+            'PROMETHEUS_MULTIPROC_DIR': str(Path(self._tmp.name) / 'metrics'),
+        }
+        if destinations > 1:
+            base = webhook_url.rsplit('/api/', 1)[0]
+            names = [f'fan{i}' for i in range(destinations)]
+            routes = {
+                'destinations': {name: {'url': f'{base}/api/webhooks/{i + 1}/bench'} for i, name in enumerate(names)},
+                'default': names,
+            }
+            routes_path = Path(self._tmp.name) / 'routes.json'
+            routes_path.write_text(json.dumps(routes))
+            self.env['RELAY_ROUTES_FILE'] = str(routes_path)
+        self.env.update(extra_env)
+        self._proc = None
+
+    def start(self, timeout=20):
+        cmd = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{self.port}']
+        self._log = open(self.log_path, 'wb')
+        self._proc = subprocess.Popen(cmd, cwd=RELAY_DIR, env={**os.environ, **self.env},
+                                      stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._proc.poll() is not None:
+                break
+            try:
+                status, _ = http_get(self.url + '/health')
+                if status == 200:
+                    return True
+            except OSError:
+                pass
+            time.sleep(0.2)
+        return False
+
+    def log_tail(self, lines=20):
+        try:
+            return '\n'.join(self.log_path.read_text(errors='replace').splitlines()[-lines:])
+        except OSError:
+            return ''
+
+    def stop(self):
+        if self._proc and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+        if self._proc:
+            self._log.close()
+        self._tmp.cleanup()
+
+
+def http_get(url, timeout=5):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+    try:
+        conn.request('GET', parts.path or '/')
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+
+def fire(relay_url, bodies, concurrency, timeout=30):
+    """
+    POST every (seq, body) with concurrency keep-alive clients (closed loop)
+
+    Returns ({seq: sent_at}, [(latency_s, status)], wall seconds).
+    """
+    parts = urlsplit(relay_url)
+    pending = iter(bodies)
+    pending_lock = threading.Lock()
+    sent_at = {}
+    results = []
+    results_lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        local = []
+        while True:
+            with pending_lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            seq, body = item
+            start = time.monotonic()
+            try:
+                conn.request('POST', '/webhook', body=body, headers={'Content-Type': 'application/json'})
+                resp = conn.getresponse()
+                resp.read()
+                status = resp.status
+                if resp.will_close:
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = 0
+            local.append((seq, start, time.monotonic() - start, status))
+        conn.close()
+        with results_lock:
+            results.extend(local)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, name=f'bench-client-{i}') for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - started
+
+    for seq, start, _, status in results:
+        if 200 <= status < 300:
+            sent_at[seq] = start
+    return sent_at, [(latency, status) for _, _, latency, status in results], wall
+
+
+def drain(stub, expected, idle_timeout, fanout=1):
+    """Wait until the stub has seen every expected seq (on fanout webhooks)
+    or stops making progress"""
+    started = time.monotonic()
+    last_count, last_progress = -1, started
+    while True:
+        count = sum(1 for seq in expected if len(stub.webhooks.get(seq, ())) >= fanout)
+        now = time.monotonic()
+        if count >= len(expected):
+            return now - started
+        if count != last_count:
+            last_count, last_progress = count, now
+        elif now - last_progress > idle_timeout:
+            return now - started
+        time.sleep(0.1)
+
+
+def run_scenario(name, scenario, mode, relay_env, relay_url=None, stub_port=0, seed=0, idle_timeout=15):
+    behaviour = StubBehaviour(seed=seed, **scenario['stub'])
+    stub = StubDiscord(behaviour, port=stub_port).start()
+    relay = None
+    try:
+        if relay_url is None:
+            relay = RelayProcess(stub.url, mode, relay_env, scenario.get('destinations', 1))
+            if not relay.start():
+                print(f'relay failed to start:\n{relay.log_tail()}', file=sys.stderr)
+                return None
+            relay_url = relay.url
+
+        bodies = [(seq, json.dumps(p).encode())
+                  for seq, p in payloads.generate(scenario['notifications'], seed=seed, **scenario['shape'])]
+        alerts = 0
+        severity_of = {}
+        for seq, body in bodies:
+            items = json.loads(body)['alerts']
+            alerts += len(items)
+            # The relay files a notification under its most severe alert
+            severity_of[seq] = max((a['labels']['severity'] for a in items), key=SEVERITY_ORDER.get)
+
+        sent_at, samples, wall = fire(relay_url, bodies, scenario['concurrency'])
+        fanout = scenario.get('destinations', 1)
+        drain_s = drain(stub, sent_at, idle_timeout, fanout)
+
+        statuses = {}
+        for _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        accepted = sum(c for s, c in statuses.items() if s.startswith('2'))
+        e2e = [stub.first_seen[seq] - t for seq, t in sent_at.items() if seq in stub.first_seen]
+        e2e_by_severity = {}
+        for seq, t in sent_at.items():
+            if seq in stub.first_seen:
+                e2e_by_severity.setdefault(severity_of[seq], []).append(stub.first_seen[seq] - t)
+        # Fan-out: until the last webhook has it
+        e2e_all = [stub.last_seen[seq] - t for seq, t in sent_at.items()
+                   if len(stub.webhooks.get(seq, ())) >= fanout]
+        delivered_wall = wall + drain_s
+        stub_stats = stub.snapshot()
+        upstream_total = sum(stub_stats['responses'].values())
+        upstream_errors = sum(c for s, c in stub_stats['responses'].items() if s >= 300)
+
+        health = None
+        try:
+            status, body = http_get(relay_url + '/health')
+            health = json.loads(body)
+        except (OSError, ValueError):
+            pass
+
+        return {
+            'meta': {
+                'generated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'git_head': git_head(),
+                'python': platform.python_version(),
+                'host': platform.node(),
+                'scenario': name,
+                'description': scenario['description'],
+                'mode': mode,
+                'seed': seed,
+                'notifications': scenario['notifications'],
+                'alerts': alerts,
+                'concurrency': scenario['concurrency'],
+                'shape': scenario['shape'],
+                'stub': behaviour.as_dict(),
+                'relay_env': {k: v for k, v in (relay.env if relay else {}).items()
+                              if k.startswith('RELAY_')},
+            },
+            'inbound': {
+                'requests': len(samples),
+                'duration_s': round(wall, 3),
+                'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+                'latency_ms': latency_summary([latency for latency, _ in samples]),
+                'status': statuses,
+                'error_rate': round(1 - accepted / len(samples), 4) if samples else None,
+            },
+            'delivery': {
+                'expected': len(sent_at),
+                'delivered': len(e2e),
+                'delivery_ratio': round(len(e2e) / len(sent_at), 4) if sent_at else None,
+                'drain_s': round(drain_s, 3),
+                'throughput_nps': round(len(e2e) / delivered_wall, 1) if delivered_wall else None,
+                'latency_ms': latency_summary(e2e),
+                'latency_by_severity': {severity: latency_summary(e2e_by_severity[severity])
+                                        for severity in payloads.SEVERITIES if severity in e2e_by_severity},
+                'fanout': fanout,
+                'delivered_all': len(e2e_all),
+                'latency_all_ms': latency_summary(e2e_all),
+                'messages': stub_stats['messages'],
+                'edits': stub_stats['edits'],
+                'embeds': stub_stats['embeds'],
+                'bytes': stub_stats['bytes'],
+                'upstream_responses': {str(k): v for k, v in sorted(stub_stats['responses'].items())},
+                'upstream_error_rate': round(upstream_errors / upstream_total, 4) if upstream_total else None,
+            },
+            'relay_health': health,
+        }
+    finally:
+        if relay:
+            relay.stop()
+        stub.stop()
+
+
+# ---------------------------------------------------------------------------
+# Results store and comparison
+# ---------------------------------------------------------------------------
+
+
+def _lookup(result, section, dotted):
+    value = result.get(section, {})
+    for part in dotted.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def previous_result(result):
+    """Latest stored result for the same scenario and server mode"""
+    if not RESULTS_DIR.is_dir():
+        return None, None
+    name, mode = result['meta']['scenario'], result['meta']['mode']
+    for path in sorted(RESULTS_DIR.glob(f'*-{name}.json'), reverse=True):
+        try:
+            prev = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if prev.get('meta', {}).get('mode') == mode:
+            return path, prev
+    return None, None
+
+
+def compare(result, prev, regress_pct):
+    """Rows of (metric, previous, current, delta %, regressed)"""
+    rows = []
+    for section, key, higher_is_better in TRACKED:
+        old, new = _lookup(prev, section, key), _lookup(result, section, key)
+        if old is None or new is None:
+            continue
+        delta = ((new - old) / old * 100) if old else (0.0 if new == old else float('inf'))
+        worse = -delta if higher_is_better else delta
+        rows.append((f'{section}.{key}', old, new, delta, worse > regress_pct))
+    return rows
+
+
+def print_report(result, rows, prev_path):
+    meta, inbound, delivery = result['meta'], result['inbound'], result['delivery']
+    lat_in, lat_e2e = inbound['latency_ms'], delivery['latency_ms']
+    print(f"{meta['scenario']} ({meta['mode']}) @ {meta['git_head']}: "
+          f"{meta['notifications']} notifications / {meta['alerts']} alerts, concurrency {meta['concurrency']}")
+    print(f"  inbound   {inbound['throughput_rps']} req/s  "
+          f"p50={lat_in.get('p50')}ms p95={lat_in.get('p95')}ms p99={lat_in.get('p99')}ms  "
+          f"errors={inbound['error_rate']:.2%}  status={inbound['status']}")
+    print(f"  delivery  {delivery['delivered']}/{delivery['expected']} in {delivery['drain_s']}s drain  "
+          f"p50={lat_e2e.get('p50')}ms p95={lat_e2e.get('p95')}ms p99={lat_e2e.get('p99')}ms  "
+          f"messages={delivery['messages']} edits={delivery['edits']} embeds={delivery['embeds']}  "
+          f"upstream={delivery['upstream_responses']}")
+    if delivery.get('fanout', 1) > 1:
+        lat_all = delivery['latency_all_ms']
+        print(f"  fan-out   {delivery['delivered_all']}/{delivery['expected']} reached all {delivery['fanout']} webhooks  "
+              f"p50={lat_all.get('p50')}ms p95={lat_all.get('p95')}ms p99={lat_all.get('p99')}ms")
+    print('  by severity ' + '  '.join(
+        f"{severity} p50={lat.get('p50')}ms p95={lat.get('p95')}ms (n={lat['count']})"
+        for severity, lat in delivery['latency_by_severity'].items()))
+    if not rows:
+        print('  no previous run of this scenario/mode to compare with')
+        return
+    print(f'  vs {prev_path.name}:')
+    for metric, old, new, delta, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f'    {metric:<26} {old:>10} -> {new:<10} ({delta:+.1f}%){flag}')
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Load-test the relay against a local stub Discord')
+    ap.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='repeatable; default baseline')
+    ap.add_argument('--mode', choices=('sync', 'asyncio'), default='sync', help='RELAY_SERVER_MODE')
+    ap.add_argument('--relay-env', action='append', default=[], metavar='KEY=VALUE',
+                    help='extra environment for the relay, repeatable')
+    ap.add_argument('--relay-url', help='use an already running relay (its Discord URL must be the stub)')
+    ap.add_argument('--stub-port', type=int, default=0, help='fixed stub port, for use with --relay-url')
+    ap.add_argument('--notifications', type=int, help='override the scenario count')
+    ap.add_argument('--concurrency', type=int, help='override the scenario concurrency')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--regress-pct', type=float, default=20.0, help='flag changes worse than this')
+    ap.add_argument('--fail-on-regression', action='store_true')
+    ap.add_argument('--no-save', action='store_true', help="don't write the result file")
+    ap.add_argument('--list', action='store_true', help='list scenarios and exit')
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<12} {scenario['description']}")
+        return 0
+
+    relay_env = dict(item.split('=', 1) for item in args.relay_env)
+    regressed = False
+    for name in args.scenario or ['baseline']:
+        scenario = dict(SCENARIOS[name])
+        if args.notifications:
+            scenario['notifications'] = args.notifications
+        if args.concurrency:
+            scenario['concurrency'] = args.concurrency
+
+        result = run_scenario(name, scenario, args.mode, relay_env, args.relay_url, args.stub_port, args.seed)
+        if result is None:
+            return 2
+
+        prev_path, prev = previous_result(result)
+        rows = compare(result, prev, args.regress_pct) if prev else []
+        regressed |= any(r[4] for r in rows)
+        print_report(result, rows, prev_path)
+
+        if not args.no_save:
+            RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+            ts = result['meta']['generated_at'].replace(':', '-')
+            out_path = RESULTS_DIR / f'{ts}-{name}.json'
+            out_path.write_text(json.dumps(result, indent=2) + '\n')
+            print(f'  wrote {out_path.relative_to(REPO_ROOT)}')
+
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
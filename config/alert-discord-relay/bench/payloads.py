@@ -0,0 +1,90 @@
+"""
+Synthetic Alertmanager webhook payloads for load-testing the relay
+
+Shapes follow Alertmanager's webhook v4 body. Every alert in notification
+<seq> is named Bench<seq>, so a receiver can match a Discord embed title back
+to the notification it came from.
+"""
+
+import hashlib
+import random
+from datetime import datetime, timedelta, timezone
+
+SEVERITIES = ('info', 'warning', 'critical')
+
+
+def _text(rng, size):
+    """Filler prose of roughly size characters"""
+    words = []
+    length = 0
+    while length < size:
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def make_alert(rng, seq, index, status, label_cardinality, annotation_size, severity_weights=None):
+    """One alert with label_cardinality extra labels and annotations of ~annotation_size chars
+
+    severity_weights, if given, are relative weights for SEVERITIES.
+    """
+    severity = rng.choices(SEVERITIES, severity_weights)[0] if severity_weights else rng.choice(SEVERITIES)
+    labels = {
+        'alertname': f'Bench{seq}',
+        'severity': severity,
+        'instance': f'bench-host-{index}:9100',
+        'job': 'bench',
+        'service': f'svc-{rng.randrange(32)}',
+    }
+    for n in range(label_cardinality):
+        labels[f'label_{n}'] = f'value-{rng.randrange(1000)}'
+
+    starts_at = datetime.now(timezone.utc) - timedelta(seconds=rng.randrange(3600))
+    fingerprint = hashlib.sha256(repr(sorted(labels.items())).encode()).hexdigest()[:16]
+    return {
+        'status': status,
+        'labels': labels,
+        'annotations': {
+            'summary': _text(rng, min(annotation_size, 120)),
+            'description': _text(rng, annotation_size),
+        },
+        'startsAt': starts_at.isoformat().replace('+00:00', 'Z'),
+        'endsAt': '0001-01-01T00:00:00Z' if status == 'firing' else datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'generatorURL': f'http://prometheus:9090/graph?g0.expr=bench_{seq}',
+        'fingerprint': fingerprint,
+    }
+
+
+def make_notification(rng, seq, alerts=(1, 1), label_cardinality=0, annotation_size=80, resolved_ratio=0.0,
+                      severity_weights=None):
+    """
+    One webhook body for notification seq
+
+    alerts is an inclusive (min, max) range for the number of alerts grouped
+    into the notification.
+    """
+    status = 'resolved' if rng.random() < resolved_ratio else 'firing'
+    count = rng.randint(*alerts)
+    items = [make_alert(rng, seq, i, status, label_cardinality, annotation_size, severity_weights)
+             for i in range(count)]
+    common = {'alertname': f'Bench{seq}', 'job': 'bench'}
+    return {
+        'version': '4',
+        'groupKey': f'{{}}:{{alertname="Bench{seq}"}}',
+        'truncatedAlerts': 0,
+        'status': status,
+        'receiver': 'discord',
+        'groupLabels': {'alertname': f'Bench{seq}'},
+        'commonLabels': common,
+        'commonAnnotations': {},
+        'externalURL': 'http://alertmanager:9093',
+        'alerts': items,
+    }
+
+
+def generate(count, seed=0, **shape):
+    """Yield (seq, payload) for count notifications; same seed, same payloads"""
+    rng = random.Random(seed)
+    for seq in range(count):
+        yield seq, make_notification(rng, seq, **shape)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Replay captured Alertmanager notifications through the relay
+
+Reads the NDJSON captures the relay writes with RELAY_CAPTURE_DIR set (one
+{"ts", "data"} record per inbound webhook), in recorded order, and runs them
+through relay.py in-process:
+
+    format     format_discord_embed(), pack_embeds() and serialization over
+               the whole capture, best of --repeat runs: notifications, alerts,
+               embeds and messages per second
+    pipeline   every notification POSTed to /webhook (Flask test client) and
+               delivered by the relay's sender threads to a local stub Discord
+               (stub_discord.py), as fast as possible or at --speed times the
+               recorded pace: messages, edits, embeds and bytes the stub got
+
+--save writes the report together with the rendered embeds; --compare runs
+again and diffs against such a file (counts, then the embeds of every
+notification whose output changed, timestamps aside). Run --save before a
+formatter or packing change and --compare after it to check the change
+against the real alert mix instead of synthetic payloads.
+
+Fast replay squeezes hours of traffic into seconds, so dedup and storm
+windows see a much denser stream than production; use --speed 1, or turn
+them off with --relay-env RELAY_DEDUP_TTL=0 --relay-env RELAY_STORM_WINDOW_ALERTS=0.
+
+Usage:
+    python3 bench/replay.py /path/to/capture-dir
+    python3 bench/replay.py capture-1234.ndjson --speed 1
+    python3 bench/replay.py captures/ --save before.json
+    python3 bench/replay.py captures/ --compare before.json
+
+Exit codes:
+    0  replay completed (and matched the --compare file)
+    1  rendered embeds differ from the --compare file
+    2  no captured notifications found
+"""
+
+import argparse
+import difflib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from stub_discord import StubBehaviour, StubDiscord
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+# Report entries compared by --compare, as (section, key)
+COMPARED = (
+    ('format', 'embeds'), ('format', 'messages'), ('format', 'bytes'), ('format', 'notifications_per_s'),
+    ('pipeline', 'messages'), ('pipeline', 'edits'), ('pipeline', 'embeds'), ('pipeline', 'bytes'),
+    ('pipeline', 'drain_s'),
+)
+
+
+def capture_files(paths):
+    """Capture files named by paths; a directory stands for its capture-*.ndjson"""
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob('capture-*.ndjson')) if path.is_dir() else [path])
+    return files
+
+
+def read_capture(files):
+    """(ts, notification) records from all files, oldest first; torn lines are skipped"""
+    records = []
+    for path in files:
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(record, dict) and isinstance(record.get('data'), dict):
+                    records.append((float(record.get('ts') or 0), record['data']))
+    records.sort(key=lambda r: r[0])
+    return records
+
+
+def strip_timestamps(embeds):
+    return [{k: v for k, v in embed.items() if k != 'timestamp'} for embed in embeds]
+
+
+def run_format(relay, notifications, repeat):
+    """Format, pack and serialize every notification; report of the fastest run plus the embeds"""
+    best = None
+    for _ in range(repeat):
+        rendered, messages, size = [], 0, 0
+        started = time.perf_counter()
+        for data in notifications:
+            embeds = relay.format_discord_embed(data)
+            for payload in relay.pack_embeds(embeds):
+                messages += 1
+                size += len(relay.json_bytes(payload))
+            rendered.append(embeds)
+        seconds = time.perf_counter() - started
+        if best is None or seconds < best[0]:
+            best = (seconds, rendered, messages, size)
+
+    seconds, rendered, messages, size = best
+    embeds = sum(len(e) for e in rendered)
+    return {
+        'notifications': len(notifications),
+        'alerts': sum(len(d.get('alerts', [])) for d in notifications),
+        'embeds': embeds,
+        'messages': messages,
+        'bytes': size,
+        'seconds': round(seconds, 4),
+        'notifications_per_s': round(len(notifications) / seconds, 1) if seconds else None,
+        'embeds_per_s': round(embeds / seconds, 1) if seconds else None,
+    }, [strip_timestamps(e) for e in rendered]
+
+
+def run_pipeline(relay, stub, records, speed, drain_timeout):
+    """POST records to /webhook, recorded gaps divided by speed (0 = no gaps), and wait for delivery"""
+    client = relay.app.test_client()
+    statuses = {}
+    lag = 0.0
+    first_ts = records[0][0] if records else 0
+    started = time.monotonic()
+    for ts, data in records:
+        if speed:
+            due = started + (ts - first_ts) / speed
+            now = time.monotonic()
+            if due > now:
+                time.sleep(due - now)
+            else:
+                lag = max(lag, now - due)
+        status = str(client.post('/webhook', json=data).status_code)
+        statuses[status] = statuses.get(status, 0) + 1
+    posted = time.monotonic()
+    settled = all(d.queue.join(drain_timeout) for d in relay.destinations.values())
+    finished = time.monotonic()
+
+    received = stub.snapshot()
+    return {
+        'posted': len(records),
+        'status': statuses,
+        'post_s': round(posted - started, 3),
+        'max_lag_s': round(lag, 3),
+        'drain_s': round(finished - posted, 3),
+        'settled': settled,
+        'messages': received['messages'],
+        'edits': received['edits'],
+        'embeds': received['embeds'],
+        'bytes': received['bytes'],
+        'upstream_responses': {str(k): v for k, v in received['responses'].items()},
+    }
+
+
+def diff_outputs(old, new, limit):
+    """(number of notifications whose embeds changed, unified diffs of the first limit)"""
+    changed, diffs = 0, []
+    for index in range(max(len(old), len(new))):
+        a = old[index] if index < len(old) else None
+        b = new[index] if index < len(new) else None
+        if a == b:
+            continue
+        changed += 1
+        if len(diffs) < limit:
+            diffs.append(''.join(difflib.unified_diff(
+                json.dumps(a, indent=1, sort_keys=True, ensure_ascii=False).splitlines(keepends=True),
+                json.dumps(b, indent=1, sort_keys=True, ensure_ascii=False).splitlines(keepends=True),
+                f'saved #{index}', f'now #{index}')))
+    return changed, diffs
+
+
+def print_report(report):
+    fmt, pipe = report['format'], report['pipeline']
+    print(f"{len(report['files'])} capture files: {fmt['notifications']} notifications / {fmt['alerts']} alerts")
+    print(f"  format    {fmt['notifications_per_s']} notifications/s  {fmt['embeds_per_s']} embeds/s  "
+          f"embeds={fmt['embeds']} messages={fmt['messages']} bytes={fmt['bytes']}")
+    if pipe:
+        speed = f"x{report['speed']} recorded pace" if report['speed'] else 'as fast as possible'
+        print(f"  pipeline  {pipe['posted']} posted in {pipe['post_s']}s ({speed}, max lag {pipe['max_lag_s']}s)  "
+              f"status={pipe['status']}")
+        print(f"            drained in {pipe['drain_s']}s{'' if pipe['settled'] else ' (TIMED OUT)'}  "
+              f"messages={pipe['messages']} edits={pipe['edits']} embeds={pipe['embeds']} bytes={pipe['bytes']}  "
+              f"upstream={pipe['upstream_responses']}")
+
+
+def print_comparison(saved, report, outputs, max_diffs):
+    print('  vs saved run:')
+    for section, key in COMPARED:
+        old = (saved.get(section) or {}).get(key)
+        new = (report.get(section) or {}).get(key)
+        if old is None or new is None:
+            continue
+        delta = f' ({(new - old) / old * 100:+.1f}%)' if old else ''
+        print(f'    {section}.{key:<20} {old:>12} -> {new:<12}{delta}')
+    changed, diffs = diff_outputs(saved.get('outputs', []), outputs, max_diffs)
+    print(f'  rendered embeds: {changed} of {len(outputs)} notifications differ')
+    for diff in diffs:
+        print(diff)
+    return changed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Replay captured Alertmanager notifications through the relay')
+    ap.add_argument('captures', nargs='+', help='capture files or directories holding capture-*.ndjson')
+    ap.add_argument('--speed', type=float, default=0.0,
+                    help='multiple of the recorded pace for the pipeline replay, 0 = as fast as possible')
+    ap.add_argument('--repeat', type=int, default=3, help='format phase: best of this many runs')
+    ap.add_argument('--no-pipeline', action='store_true', help='only run the format phase')
+    ap.add_argument('--drain-timeout', type=float, default=120.0, help='seconds to wait for delivery')
+    ap.add_argument('--latency-ms', type=float, default=0.0, help='stub Discord response latency')
+    ap.add_argument('--rate-limit', type=int, default=0, help='stub messages per 2s window, 0 = unlimited')
+    ap.add_argument('--relay-env', action='append', default=[], metavar='KEY=VALUE',
+                    help='extra environment for the relay, repeatable')
+    ap.add_argument('--save', help='write the report and rendered embeds to this JSON file')
+    ap.add_argument('--compare', help='diff against a file written by --save')
+    ap.add_argument('--max-diffs', type=int, default=5, help='changed notifications to print in full')
+    args = ap.parse_args(argv)
+
+    files = capture_files(args.captures)
+    records = read_capture(files)
+    if not records:
+        print('no captured notifications found', file=sys.stderr)
+        return 2
+
+    stub = StubDiscord(StubBehaviour(latency_ms=args.latency_ms, rate_limit=args.rate_limit)).start()
+    # Configure the relay before it is imported: in-process, pointed at the
+    # stub, nothing written to disk and no capture of the replay itself
+    os.environ.update({
+        'DISCORD_WEBHOOK_URL': stub.url,
+        'RELAY_SPOOL_DIR': '',
+        'RELAY_CAPTURE_DIR': '',
+        'RELAY_ROUTES_FILE': '',
+    })
+    os.environ.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    os.environ.update(dict(item.split('=', 1) for item in args.relay_env))
+    import logging
+    import relay
+    logging.getLogger().setLevel(logging.WARNING)
+
+    notifications = [data for _, data in records]
+    format_report, outputs = run_format(relay, notifications, args.repeat)
+    report = {
+        'files': [str(f) for f in files],
+        'speed': args.speed,
+        'format': format_report,
+        'pipeline': None if args.no_pipeline else run_pipeline(relay, stub, records, args.speed, args.drain_timeout),
+    }
+    stub.stop()
+    print_report(report)
+
+    changed = 0
+    if args.compare:
+        saved = json.loads(Path(args.compare).read_text())
+        changed = print_comparison(saved, report, outputs, args.max_diffs)
+    if args.save:
+        Path(args.save).write_text(json.dumps(dict(report, outputs=outputs), ensure_ascii=False) + '\n')
+        print(f'  wrote {args.save}')
+    return 1 if changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a Discord webhook endpoint
+
+Accepts the relay's webhook POSTs and can inject response latency, a real
+per-window rate limit, random 429s and random 5xx errors. 429 and 2xx
+responses carry Discord's X-RateLimit-* headers so the relay's rate limiter
+runs its normal code path. Every accepted message is recorded with its
+arrival time so a harness can compute end-to-end latency, including which
+webhook paths a notification reached when the relay fans out.
+
+POST ...?wait=true answers 200 with a message ID, and PATCH
+.../messages/<id> edits a message it issued (404 Unknown Message for any
+other ID), like Discord's execute/edit webhook message endpoints. GET on the
+webhook answers with the webhook object, as the relay's readiness probe
+expects.
+
+Standalone:
+    python3 stub_discord.py --port 18080 --latency-ms 80 --rate-429 0.02
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TITLE_SEQ = re.compile(r'Bench(\d+)')
+MESSAGE_PATH = re.compile(r'/messages/(\d+)')
+
+
+class StubBehaviour:
+    """Knobs for how the stub answers"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, rate_limit=0, rate_window=2.0,
+                 rate_429=0.0, rate_5xx=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Real bucket: rate_limit messages per rate_window seconds (0 = unlimited).
+        # Discord's webhook limit is 5 per 2s.
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        # Fractions of requests answered with a random 429 / 5xx regardless of the bucket
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+class StubDiscord:
+    """Threaded HTTP server plus the record of what it received"""
+
+    def __init__(self, behaviour=None, host='127.0.0.1', port=0):
+        self.behaviour = behaviour or StubBehaviour()
+        self._rng = random.Random(self.behaviour.seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_used = 0
+        self._message_ids = itertools.count(1)
+        self._issued = set()
+        self.probes = 0     # GETs of the webhook (readiness probes)
+        self.responses = {}
+        self.messages = []
+        self.first_seen = {}
+        self.last_seen = {}
+        self.webhooks = {}    # seq -> webhook paths it arrived on
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/api/webhooks/0/bench'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='stub-discord', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.responses.clear()
+            self.messages.clear()
+            self.first_seen.clear()
+            self.last_seen.clear()
+            self.webhooks.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'responses': dict(self.responses),
+                'messages': sum(1 for m in self.messages if m['method'] == 'POST'),
+                'edits': sum(1 for m in self.messages if m['method'] == 'PATCH'),
+                'embeds': sum(m['embeds'] for m in self.messages),
+                'bytes': sum(m['bytes'] for m in self.messages),
+            }
+
+    def _decide(self):
+        """Status code and rate-limit headers for the next request"""
+        b = self.behaviour
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= b.rate_window:
+                self._window_start = now
+                self._window_used = 0
+            reset_after = max(b.rate_window - (now - self._window_start), 0.0)
+
+            roll = self._rng.random()
+            if b.rate_limit and self._window_used >= b.rate_limit:
+                status = 429
+            elif roll < b.rate_429:
+                status = 429
+                reset_after = max(reset_after, 0.25)
+            elif roll < b.rate_429 + b.rate_5xx:
+                status = self._rng.choice((500, 502, 503))
+            else:
+                status = 204
+                self._window_used += 1
+
+            limit = b.rate_limit or 1000
+            headers = {
+                'X-RateLimit-Limit': str(limit),
+                'X-RateLimit-Remaining': str(max(limit - self._window_used, 0)),
+                'X-RateLimit-Reset-After': f'{reset_after:.3f}',
+                'X-RateLimit-Bucket': 'bench',
+            }
+            delay = max(b.latency_ms + self._rng.uniform(-b.jitter_ms, b.jitter_ms), 0.0) / 1000
+        return status, headers, reset_after, delay
+
+    def _record(self, method, path, body, arrived):
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return
+        embeds = payload.get('embeds') or []
+        webhook = MESSAGE_PATH.split(path.partition('?')[0])[0]
+        with self._lock:
+            self.messages.append({'method': method, 'at': arrived, 'embeds': len(embeds), 'bytes': len(body)})
+            for embed in embeds:
+                match = TITLE_SEQ.search(embed.get('title', ''))
+                if match:
+                    seq = int(match.group(1))
+                    self.first_seen.setdefault(seq, arrived)
+                    self.last_seen[seq] = max(self.last_seen.get(seq, arrived), arrived)
+                    self.webhooks.setdefault(seq, set()).add(webhook)
+
+    def _count(self, status):
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, headers, body=b''):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if body:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def _message(self):
+                arrived = time.monotonic()
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.command == 'PATCH':
+                    match = MESSAGE_PATH.search(self.path)
+                    with stub._lock:
+                        known = match and match.group(1) in stub._issued
+                    if not known:
+                        stub._count(404)
+                        self._reply(404, {}, b'{"message": "Unknown Message", "code": 10008}')
+                        return
+                status, headers, reset_after, delay = stub._decide()
+                if delay:
+                    time.sleep(delay)
+                stub._count(status)
+
+                if status == 429:
+                    headers['Retry-After'] = str(max(int(reset_after + 0.999), 1))
+                    reply = {'message': 'You are being rate limited.', 'retry_after': round(reset_after, 3), 'global': False}
+                    self._reply(429, headers, json.dumps(reply).encode())
+                elif status >= 500:
+                    self._reply(status, {}, b'{"message": "stub upstream error", "code": 0}')
+                else:
+                    stub._record(self.command, self.path, body, arrived)
+                    if 'wait=true' in self.path:
+                        with stub._lock:
+                            message_id = str(next(stub._message_ids))
+                            stub._issued.add(message_id)
+                        message = {'id': message_id, 'channel_id': '0'}
+                        self._reply(200, headers, json.dumps(message).encode())
+                    else:
+                        self._reply(204, headers)
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.probes += 1
+                webhook = {'id': '0', 'type': 1, 'name': 'bench', 'channel_id': '0', 'token': 'bench'}
+                self._reply(200, {}, json.dumps(webhook).encode())
+
+            def do_POST(self):
+                self._message()
+
+            def do_PATCH(self):
+                self._message()
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Local Discord webhook stand-in')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=18080)
+    ap.add_argument('--latency-ms', type=float, default=0.0)
+    ap.add_argument('--jitter-ms', type=float, default=0.0)
+    ap.add_argument('--rate-limit', type=int, default=0, help='messages per window, 0 = unlimited')
+    ap.add_argument('--rate-window', type=float, default=2.0)
+    ap.add_argument('--rate-429', type=float, default=0.0, help='fraction answered with a random 429')
+    ap.add_argument('--rate-5xx', type=float, default=0.0, help='fraction answered with a random 5xx')
+    args = ap.parse_args()
+
+    behaviour = StubBehaviour(args.latency_ms, args.jitter_ms, args.rate_limit, args.rate_window,
+                              args.rate_429, args.rate_5xx)
+    stub = StubDiscord(behaviour, args.host, args.port).start()
+    print(f'stub Discord listening on {stub.url}')
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(stub.snapshot()))
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
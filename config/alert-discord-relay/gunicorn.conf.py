@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for the relay
+
+RELAY_SERVER_MODE picks the serving model:
+    sync     Flask app (relay:app) under 2 prefork sync workers
+    asyncio  aiohttp app (relay:create_async_app) in one event-loop worker
+
+Prometheus multiprocess mode: each worker writes its samples to
+PROMETHEUS_MULTIPROC_DIR. The directory is wiped when the master starts so
+counters don't carry over from a previous container run, and a worker's live
+gauges are dropped when it exits.
+
+Each sync worker opens the spool and starts its sender threads right after
+it boots (post_worker_init), which replays what a previous run left behind.
+
+Restarts: on SIGTERM each worker stops taking webhooks and drains its
+delivery queues for up to RELAY_DRAIN_TIMEOUT seconds (relay.drain()) before
+it exits. graceful_timeout leaves the drain room before the master kills
+workers; the quadlet's StopTimeout must in turn cover graceful_timeout.
+"""
+
+import os
+import shutil
+import sys
+
+from prometheus_client import multiprocess
+
+bind = '0.0.0.0:9095'
+timeout = 30
+graceful_timeout = int(float(os.environ.get('RELAY_DRAIN_TIMEOUT', '20'))) + 5
+
+if os.environ.get('RELAY_SERVER_MODE', 'sync') == 'asyncio':
+    worker_class = 'aiohttp.GunicornWebWorker'
+    workers = 1
+    wsgi_app = 'relay:create_async_app'
+else:
+    workers = 2
+    wsgi_app = 'relay:app'
+
+
+def post_worker_init(worker):
+    # Open the spool and start the sender threads as soon as the worker is
+    # up, so spooled notifications are replayed after a restart even before
+    # the next webhook arrives. The asyncio app starts its own on startup.
+    if os.environ.get('RELAY_SERVER_MODE', 'sync') != 'asyncio':
+        sys.modules['relay'].start_workers()
+
+
+def on_starting(server):
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Runs in the worker after it stopped accepting requests. In asyncio mode
+    # the app's shutdown already drained and this returns at once.
+    relay = sys.modules.get('relay')
+    if relay is not None:
+        relay.drain()
@@ -4,153 +4,3382 @@ Alertmanager to Discord Webhook Relay
 Transforms Alertmanager webhook payloads to Discord embed format
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 import requests
 import os
 import logging
+import asyncio
+import fcntl
+import glob
+import hashlib
+import heapq
+import itertools
+import json
+import queue
+import re
+import signal
+import string
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
+from functools import lru_cache
+
+import urllib3
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
 DISCORD_WEBHOOK_URL = os.environ.get('DISCORD_WEBHOOK_URL')
 
-def format_discord_embed(alert_data):
-    """Convert Alertmanager alert to Discord embed format"""
-    embeds = []
+# Label-based routing to several Discord webhooks. RELAY_ROUTES_FILE points
+# at a JSON routing table (format in load_routes()); without it every alert
+# goes to DISCORD_WEBHOOK_URL. Each destination gets its own delivery queue,
+# sender threads, connection pool, rate-limit state and circuit breaker.
+ROUTES_FILE = os.environ.get('RELAY_ROUTES_FILE', '')
 
-    status = alert_data.get('status', 'unknown')
+# Serving mode, picked up by gunicorn.conf.py:
+#   sync     Flask app under prefork gunicorn workers (default)
+#   asyncio  aiohttp app in a single event-loop process; outbound sends run
+#            concurrently on the loop, up to RELAY_ASYNC_MAX_INFLIGHT batches
+SERVER_MODE = os.environ.get('RELAY_SERVER_MODE', 'sync')
+ASYNC_MAX_INFLIGHT = int(os.environ.get('RELAY_ASYNC_MAX_INFLIGHT', '100'))
 
-    for alert in alert_data.get('alerts', []):
+# Outbound HTTP client (keep-alive pool shared by the sender threads)
+HTTP_POOL_SIZE = int(os.environ.get('RELAY_HTTP_POOL_SIZE', '4'))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('RELAY_HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('RELAY_HTTP_READ_TIMEOUT', '10'))
+# Drop pooled connections idle longer than this; Discord's edge closes idle
+# keep-alive sockets and the first POST on a dead socket would fail.
+HTTP_IDLE_TIMEOUT = float(os.environ.get('RELAY_HTTP_IDLE_TIMEOUT', '60'))
+
+# Discord rate limits: how many 429s to wait out per payload before giving up
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get('RELAY_RATE_LIMIT_MAX_RETRIES', '5'))
+
+# Circuit breaker around Discord sends. After this many consecutive failed
+# sends (5xx, timeouts, connection errors) the breaker opens and sending stops
+# for RELAY_BREAKER_RESET_TIMEOUT seconds, then half-open probes test Discord
+# again. 0 disables the breaker.
+BREAKER_FAILURES = int(os.environ.get('RELAY_BREAKER_FAILURES', '5'))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('RELAY_BREAKER_RESET_TIMEOUT', '30'))
+BREAKER_HALF_OPEN_PROBES = int(os.environ.get('RELAY_BREAKER_HALF_OPEN_PROBES', '1'))
+# While the breaker is open, notifications below this severity are shed: parked
+# in the spool for replay after recovery, or without a spool held in the
+# in-memory retry (RELAY_RETRY_ATTEMPTS) until the breaker half-opens, without
+# using up an attempt. Dropped only when both are off.
+BREAKER_SHED_BELOW = os.environ.get('RELAY_BREAKER_SHED_BELOW', 'critical')
+
+# Delivery queue (in-process, one per gunicorn worker). /webhook only validates
+# and enqueues; background sender threads do the Discord round-trip.
+QUEUE_MAXSIZE = int(os.environ.get('RELAY_QUEUE_MAXSIZE', '256'))
+# What to do when the queue is full:
+#   drop-oldest  evict the oldest queued notification to make room (default)
+#   drop-newest  discard the incoming notification, still ack Alertmanager
+#   reject       answer 503 so Alertmanager retries later
+QUEUE_DROP_POLICY = os.environ.get('RELAY_QUEUE_DROP_POLICY', 'drop-oldest')
+# The queue keeps one lane per severity. How senders drain them:
+#   strict    always the most severe non-empty lane first (default)
+#   weighted  smooth weighted round-robin using RELAY_QUEUE_WEIGHTS
+QUEUE_SCHEDULING = os.environ.get('RELAY_QUEUE_SCHEDULING', 'strict')
+QUEUE_WEIGHTS = os.environ.get('RELAY_QUEUE_WEIGHTS', 'critical=8,warning=3,info=1')
+# Per-lane latency budget in seconds for time spent queued. Overruns are
+# counted in relay_queue_budget_exceeded_total and shown in /health.
+QUEUE_BUDGETS = os.environ.get('RELAY_QUEUE_BUDGETS', 'critical=5,warning=60,info=300')
+SENDER_WORKERS = int(os.environ.get('RELAY_SENDER_WORKERS', '2'))
+# Extra sender threads that only take from the critical lane, so a page never
+# waits for a sender stuck on a batch of lower-severity notifications
+CRITICAL_SENDERS = int(os.environ.get('RELAY_CRITICAL_SENDERS', '1'))
+# Notifications that arrive within this many seconds of each other are merged
+# into as few Discord messages as possible (0 disables coalescing). Alertmanager
+# fans several receivers out to this relay, so bursts are common.
+COALESCE_WINDOW = float(os.environ.get('RELAY_COALESCE_WINDOW', '1.0'))
+COALESCE_MAX_NOTIFICATIONS = int(os.environ.get('RELAY_COALESCE_MAX_NOTIFICATIONS', '50'))
+
+# Durable spool: accepted notifications are written to disk until Discord has
+# them, and replayed after a restart. Empty RELAY_SPOOL_DIR disables it.
+SPOOL_DIR = os.environ.get('RELAY_SPOOL_DIR', '')
+SPOOL_MAX_BYTES = int(os.environ.get('RELAY_SPOOL_MAX_BYTES', str(16 * 1024 * 1024)))
+# Group commit: appends are fsynced together at most this often (seconds)
+SPOOL_FSYNC_INTERVAL = float(os.environ.get('RELAY_SPOOL_FSYNC_INTERVAL', '0.05'))
+# How often undelivered spool entries are put back on the delivery queue
+SPOOL_RETRY_INTERVAL = float(os.environ.get('RELAY_SPOOL_RETRY_INTERVAL', '30'))
+SPOOL_COMPACT_MIN_BYTES = 1024 * 1024
+# Without a spool, a notification whose delivery failed is retried from memory
+# up to RELAY_RETRY_ATTEMPTS times: RELAY_RETRY_BACKOFF seconds after the first
+# failure, doubling up to RELAY_RETRY_BACKOFF_MAX. After that, or on restart,
+# it is lost; set RELAY_SPOOL_DIR for durable delivery. 0 disables retries.
+RETRY_ATTEMPTS = int(os.environ.get('RELAY_RETRY_ATTEMPTS', '5'))
+RETRY_BACKOFF = float(os.environ.get('RELAY_RETRY_BACKOFF', '2'))
+RETRY_BACKOFF_MAX = float(os.environ.get('RELAY_RETRY_BACKOFF_MAX', '60'))
+
+# Alert storms: instead of one embed per alert, send a single digest embed
+# (counts by alertname, severity, instance and service plus a few examples)
+#   - for any notification carrying at least RELAY_STORM_ALERTS alerts
+#   - for every delivery batch while at least RELAY_STORM_WINDOW_ALERTS alerts
+#     arrived within the last RELAY_STORM_WINDOW seconds
+# 0 disables either trigger.
+STORM_ALERTS = int(os.environ.get('RELAY_STORM_ALERTS', '20'))
+STORM_WINDOW = float(os.environ.get('RELAY_STORM_WINDOW', '60'))
+STORM_WINDOW_ALERTS = int(os.environ.get('RELAY_STORM_WINDOW_ALERTS', '50'))
+STORM_EXAMPLES = int(os.environ.get('RELAY_STORM_EXAMPLES', '5'))
+
+# Edit-in-place resolution: messages are posted with ?wait=true so Discord
+# returns their ID, and a resolved alert edits the message that announced it
+# instead of posting a new one. The index keeps the last this-many messages
+# (LRU); 0 disables edit-in-place. It is saved to RELAY_MESSAGE_INDEX_PATH
+# (default: message-index.json in the spool directory) every
+# RELAY_MESSAGE_INDEX_FLUSH_INTERVAL seconds and shared by gunicorn workers.
+MESSAGE_INDEX_SIZE = int(os.environ.get('RELAY_MESSAGE_INDEX_SIZE', '2000'))
+MESSAGE_INDEX_PATH = os.environ.get(
+    'RELAY_MESSAGE_INDEX_PATH', os.path.join(SPOOL_DIR, 'message-index.json') if SPOOL_DIR else '')
+MESSAGE_INDEX_FLUSH_INTERVAL = float(os.environ.get('RELAY_MESSAGE_INDEX_FLUSH_INTERVAL', '5'))
+
+# Alert latency. For every alert Discord acknowledged the relay records
+#   alertmanager  startsAt -> webhook received (group_wait, group_interval)
+#   relay         webhook received -> Discord 2xx
+#   end_to_end    startsAt -> Discord 2xx
+# as histograms and in a rolling window of RELAY_SLO_WINDOW seconds behind
+# /slo (0 disables the window). The alertmanager and end_to_end stages only
+# count the first delivery of a firing alert, not Alertmanager's repeats.
+# Targets are per-severity seconds for end_to_end and for the relay stage.
+SLO_WINDOW = float(os.environ.get('RELAY_SLO_WINDOW', '3600'))
+SLO_TARGETS = os.environ.get('RELAY_SLO_TARGETS', 'critical=60,warning=600,info=1800')
+SLO_RELAY_TARGETS = os.environ.get('RELAY_SLO_RELAY_TARGETS', 'critical=5,warning=60,info=300')
+SLO_MAX_SAMPLES = int(os.environ.get('RELAY_SLO_MAX_SAMPLES', '10000'))
+
+# Per-alertname embed templates (JSON, format in load_templates()), compiled
+# once at startup. Empty means the built-in layout for every alert.
+TEMPLATES_FILE = os.environ.get('RELAY_TEMPLATES_FILE', '')
+# JSON encoder for Discord payloads and spool records:
+#   auto     orjson when it is installed, else the stdlib json module
+#   orjson   require orjson
+#   stdlib   always the json module
+JSON_BACKEND = os.environ.get('RELAY_JSON_BACKEND', 'auto')
+
+# Suppress exact repeats of an alert (same fingerprint, startsAt, status and
+# labels) seen within this many seconds. Keep it below the shortest
+# repeat_interval in alertmanager.yml so intended reminders still get through.
+# A re-fire has a new startsAt and always goes out. 0 disables.
+DEDUP_TTL = float(os.environ.get('RELAY_DEDUP_TTL', '600'))
+DEDUP_MAX_ENTRIES = int(os.environ.get('RELAY_DEDUP_MAX_ENTRIES', '4096'))
+
+# Capture inbound notifications for offline replay (bench/replay.py). Every
+# valid webhook body is appended as {"ts", "data"} to capture-<pid>.ndjson in
+# RELAY_CAPTURE_DIR (empty disables). At RELAY_CAPTURE_MAX_BYTES the file is
+# rotated to capture-<pid>-<unix ms>.ndjson and only the newest
+# RELAY_CAPTURE_FILES rotated files are kept. Captures hold the full alert
+# text, so keep them on the host.
+CAPTURE_DIR = os.environ.get('RELAY_CAPTURE_DIR', '')
+CAPTURE_MAX_BYTES = int(os.environ.get('RELAY_CAPTURE_MAX_BYTES', str(8 * 1024 * 1024)))
+CAPTURE_FILES = int(os.environ.get('RELAY_CAPTURE_FILES', '10'))
+
+# Restarts and readiness. On SIGTERM the relay answers new webhooks with 503
+# (Alertmanager retries them against the restarted relay) and waits up to
+# RELAY_DRAIN_TIMEOUT seconds for queued and in-flight sends to settle;
+# anything still pending stays in the spool. /ready fails while draining,
+# while a destination's queue is above RELAY_READY_QUEUE_RATIO of
+# RELAY_QUEUE_MAXSIZE, or while its webhook is unreachable. Reachability
+# comes from the last send Discord answered or a GET of the webhook, reused
+# for RELAY_READY_PROBE_INTERVAL seconds.
+DRAIN_TIMEOUT = float(os.environ.get('RELAY_DRAIN_TIMEOUT', '20'))
+READY_QUEUE_RATIO = float(os.environ.get('RELAY_READY_QUEUE_RATIO', '0.8'))
+READY_PROBE_INTERVAL = float(os.environ.get('RELAY_READY_PROBE_INTERVAL', '30'))
+
+SEVERITY_RANK = {'info': 0, 'warning': 1, 'critical': 2}
+
+# Prometheus metrics. Under gunicorn, PROMETHEUS_MULTIPROC_DIR (set in the
+# Dockerfile, wiped by gunicorn.conf.py) makes every worker write its samples
+# to shared files and /metrics aggregates them.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+INBOUND_LATENCY = Histogram(
+    'relay_http_request_duration_seconds', 'Inbound request handling time',
+    ['endpoint'], buckets=LATENCY_BUCKETS)
+INBOUND_REQUESTS = Counter(
+    'relay_http_requests_total', 'Inbound requests by endpoint and status code',
+    ['endpoint', 'code'])
+DISCORD_LATENCY = Histogram(
+    'relay_discord_request_duration_seconds', 'Discord webhook POST round-trip time',
+    buckets=LATENCY_BUCKETS)
+DISCORD_RESPONSES = Counter(
+    'relay_discord_responses_total', 'Discord responses by status code', ['code'])
+FORMAT_LATENCY = Histogram(
+    'relay_format_duration_seconds', 'Time to format and pack one delivery batch',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+EMBEDS_PER_MESSAGE = Histogram(
+    'relay_discord_message_embeds', 'Embeds per Discord message',
+    buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10))
+PAYLOAD_BYTES = Histogram(
+    'relay_discord_payload_bytes', 'Serialized Discord payload size',
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768))
+ALERTS_PER_NOTIFICATION = Histogram(
+    'relay_notification_alerts', 'Alerts per inbound Alertmanager notification',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250))
+ALERTS_RECEIVED = Counter(
+    'relay_alerts_received_total', 'Alerts received by severity and status',
+    ['severity', 'status'])
+EXCEPTIONS = Counter(
+    'relay_exceptions_total', 'Exceptions caught by stage', ['stage'])
+QUEUE_DEPTH = Gauge(
+    'relay_queue_depth', 'Notifications waiting in the delivery queue, by destination and severity lane',
+    ['destination', 'lane'], multiprocess_mode='livesum')
+QUEUE_DROPS = Counter(
+    'relay_queue_dropped_total', 'Notifications dropped by the queue overflow policy, by severity lane',
+    ['lane'])
+QUEUE_DELAY = Histogram(
+    'relay_queue_delay_seconds', 'Time notifications waited in the delivery queue, by severity lane',
+    ['lane'], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+QUEUE_BUDGET_EXCEEDED = Counter(
+    'relay_queue_budget_exceeded_total', 'Notifications that left the queue after their lane latency budget',
+    ['lane'])
+CONNECTION_EVENTS = Counter(
+    'relay_discord_connection_events_total', 'Outbound connection events (handshakes, requests, stale_reconnects)',
+    ['event'])
+RATE_LIMIT_EVENTS = Counter(
+    'relay_discord_rate_limit_events_total', 'Sends delayed by the scheduler (throttled) or answered with 429',
+    ['event'])
+DEDUP_EVENTS = Counter(
+    'relay_dedup_events_total', 'Dedup cache hits, misses, evictions and expirations', ['event'])
+SPOOL_EVICTIONS = Counter(
+    'relay_spool_evicted_total', 'Spool entries dropped because the size cap was hit')
+STORM_DIGESTS = Counter(
+    'relay_storm_digests_total', 'Digest embeds sent in place of per-alert embeds, by trigger', ['trigger'])
+STORM_DIGESTED_ALERTS = Counter(
+    'relay_storm_digested_alerts_total', 'Alerts summarised into storm digests')
+ALERT_LATENCY = Histogram(
+    'relay_alert_latency_seconds',
+    'Alert delivery latency by stage (alertmanager: startsAt to receipt, relay: receipt to Discord 2xx, '
+    'end_to_end: startsAt to Discord 2xx)',
+    ['stage', 'severity', 'alertname'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+MESSAGE_EDITS = Counter(
+    'relay_discord_message_edits_total', 'Resolutions applied to the original Discord message, by outcome',
+    ['outcome'])
+MESSAGE_INDEX_EVENTS = Counter(
+    'relay_message_index_events_total', 'Message index lookups (hit, miss) and evictions', ['event'])
+BREAKER_STATE = Gauge(
+    'relay_discord_breaker_state', 'Discord circuit breaker state by destination (0 closed, 1 half-open, 2 open)',
+    ['destination'], multiprocess_mode='livemax')
+BREAKER_TRANSITIONS = Counter(
+    'relay_discord_breaker_transitions_total', 'Circuit breaker state changes by destination and new state',
+    ['destination', 'state'])
+DESTINATION_SENDS = Counter(
+    'relay_destination_sends_total', 'Discord sends by destination and result (sent, failed, rejected)',
+    ['destination', 'result'])
+SHED_NOTIFICATIONS = Counter(
+    'relay_shed_notifications_total',
+    'Notifications shed while the breaker was open (deferred to the spool, retried from memory, or dropped)',
+    ['severity', 'action'])
+
+DROP_POLICIES = ('drop-oldest', 'drop-newest', 'reject')
+if QUEUE_DROP_POLICY not in DROP_POLICIES:
+    raise ValueError(f"RELAY_QUEUE_DROP_POLICY must be one of {', '.join(DROP_POLICIES)}")
+QUEUE_SCHEDULINGS = ('strict', 'weighted')
+if QUEUE_SCHEDULING not in QUEUE_SCHEDULINGS:
+    raise ValueError(f"RELAY_QUEUE_SCHEDULING must be one of {', '.join(QUEUE_SCHEDULINGS)}")
+SERVER_MODES = ('sync', 'asyncio')
+if SERVER_MODE not in SERVER_MODES:
+    raise ValueError(f"RELAY_SERVER_MODE must be one of {', '.join(SERVER_MODES)}")
+if BREAKER_SHED_BELOW not in SEVERITY_RANK:
+    raise ValueError(f"RELAY_BREAKER_SHED_BELOW must be one of {', '.join(SEVERITY_RANK)}")
+if not 0 < READY_QUEUE_RATIO <= 1:
+    raise ValueError("RELAY_READY_QUEUE_RATIO must be in (0, 1]")
+JSON_BACKENDS = ('auto', 'orjson', 'stdlib')
+if JSON_BACKEND not in JSON_BACKENDS:
+    raise ValueError(f"RELAY_JSON_BACKEND must be one of {', '.join(JSON_BACKENDS)}")
+if JSON_BACKEND == 'orjson' and orjson is None:
+    raise ValueError("RELAY_JSON_BACKEND=orjson but the orjson package is not installed")
+
+
+
+def stdlib_json_bytes(obj):
+    # Default arguments keep json's cached C encoder; custom separators
+    # would build a new encoder per call and cost more than they save
+    return json.dumps(obj).encode()
+
+
+# UTF-8 JSON for payloads and spool records
+json_bytes = orjson.dumps if orjson is not None and JSON_BACKEND != 'stdlib' else stdlib_json_bytes
+
+def parse_lane_map(name, value, cast):
+    """Parse 'critical=5,warning=30' style per-severity settings"""
+    result = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        lane, _, setting = item.partition('=')
+        lane = lane.strip()
+        if lane not in SEVERITY_RANK:
+            raise ValueError(f"{name}: unknown severity lane '{lane}'")
+        try:
+            result[lane] = cast(setting)
+        except ValueError:
+            raise ValueError(f"{name}: bad value for '{lane}': {setting!r}") from None
+    return result
+
+
+COLOR_CRITICAL = 15158332   # red
+COLOR_WARNING = 16753920    # orange
+COLOR_RESOLVED = 3066993    # green
+
+
+def compile_text(text):
+    """Compile a '{alertname} on {instance}: {annotations.summary}' template
+
+    {name} and {labels.name} read a label, {annotations.name} an annotation;
+    missing values render as ''. Returns render(labels, annotations).
+    """
+    parts = []
+    for literal, field, _, _ in string.Formatter().parse(text):
+        if literal:
+            parts.append((literal, None))
+        if field is not None:
+            source, _, key = field.rpartition('.')
+            if source not in ('', 'labels', 'annotations') or not key:
+                raise ValueError(f"bad placeholder {{{field}}} in {text!r}")
+            parts.append((key, 1 if source == 'annotations' else 0))
+
+    if all(source is None for _, source in parts):
+        constant = ''.join(literal for literal, _ in parts)
+        return lambda labels, annotations: constant
+
+    def render(labels, annotations):
+        sources = (labels, annotations)
+        return ''.join(value if source is None else str(sources[source].get(value, ''))
+                       for value, source in parts)
+    return render
+
+
+@lru_cache(maxsize=4096)
+def _started_value(starts_at):
+    """'Started' field text for a startsAt timestamp (None if unparseable)"""
+    try:
+        dt = datetime.fromisoformat(starts_at.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if len(starts_at) >= 19 and starts_at[13] == starts_at[16] == ':':
+        # Valid RFC 3339 already spells the wall time out; strftime is slow
+        return f'{starts_at[:10]} {starts_at[11:19]} UTC'
+    return dt.strftime('%Y-%m-%d %H:%M:%S UTC')
+
+
+class EmbedTemplate:
+    """Compiled embed layout for one alertname
+
+    Keys of the spec (all optional; leaving one out keeps the built-in
+    behaviour):
+        title           firing title, default '🚨 {alertname}'
+        resolved_title  default '✅ {alertname} - RESOLVED'
+        description     default the summary annotation, else description
+        color           firing color; default red for critical, else orange
+        fields          extra [{"name", "value", "inline"}] fields, added
+                        after the label fields; empty values are skipped
+        label_fields    false drops the Severity/Instance/Service/Job fields
+    """
+
+    LABEL_FIELDS = (('severity', 'Severity'), ('instance', 'Instance'), ('service', 'Service'), ('job', 'Job'))
+
+    def __init__(self, spec=None):
+        spec = spec or {}
+        self.title = compile_text(spec.get('title', '🚨 {alertname}'))
+        self.resolved_title = compile_text(spec.get('resolved_title', '✅ {alertname} - RESOLVED'))
+        self.description = compile_text(spec['description']) if 'description' in spec else None
+        self.color = spec.get('color')
+        self.label_fields = spec.get('label_fields', True)
+        self.fields = [(compile_text(f['name']), compile_text(f['value']), bool(f.get('inline', False)))
+                       for f in spec.get('fields', [])]
+
+    def render(self, alert, status, footer, timestamp):
         labels = alert.get('labels', {})
+        if 'alertname' not in labels:
+            labels = dict(labels, alertname='Alert')
         annotations = alert.get('annotations', {})
 
-        # Determine color based on status and severity
         if status == 'firing':
-            severity = labels.get('severity', 'warning')
-            color = 15158332 if severity == 'critical' else 16753920  # Red for critical, orange for warning
-            title = f"🚨 {labels.get('alertname', 'Alert')}"
+            if self.color is not None:
+                color = self.color
+            else:
+                color = COLOR_CRITICAL if labels.get('severity', 'warning') == 'critical' else COLOR_WARNING
+            title = self.title(labels, annotations)
         else:
-            color = 3066993  # Green for resolved
-            title = f"✅ {labels.get('alertname', 'Alert')} - RESOLVED"
+            color = COLOR_RESOLVED
+            title = self.resolved_title(labels, annotations)
 
-        # Build description
-        description = annotations.get('summary', annotations.get('description', 'No description available'))
+        summary = annotations.get('summary', annotations.get('description', 'No description available'))
+        description = (self.description(labels, annotations) or summary) if self.description else summary
 
-        # Build fields
         fields = []
-
-        # Add severity
-        if 'severity' in labels:
-            fields.append({
-                'name': 'Severity',
-                'value': labels['severity'].upper(),
-                'inline': True
-            })
-
-        # Add instance
-        if 'instance' in labels:
-            fields.append({
-                'name': 'Instance',
-                'value': labels['instance'],
-                'inline': True
-            })
-
-        # Add service
-        if 'service' in labels:
-            fields.append({
-                'name': 'Service',
-                'value': labels['service'],
-                'inline': True
-            })
-
-        # Add job
-        if 'job' in labels:
-            fields.append({
-                'name': 'Job',
-                'value': labels['job'],
-                'inline': True
-            })
-
-        # Add description if different from summary
-        if 'description' in annotations and annotations['description'] != description:
-            fields.append({
-                'name': 'Details',
-                'value': annotations['description'],
-                'inline': False
-            })
-
-        # Add timestamps
+        if self.label_fields:
+            for label, name in self.LABEL_FIELDS:
+                if label in labels:
+                    value = labels[label].upper() if label == 'severity' else labels[label]
+                    fields.append({'name': name, 'value': value, 'inline': True})
+        for name, value, inline in self.fields:
+            text = value(labels, annotations)
+            if text:
+                fields.append({'name': name(labels, annotations), 'value': text, 'inline': inline})
+        if 'description' in annotations and annotations['description'] != summary:
+            fields.append({'name': 'Details', 'value': annotations['description'], 'inline': False})
         starts_at = alert.get('startsAt', '')
-        if starts_at:
-            try:
-                dt = datetime.fromisoformat(starts_at.replace('Z', '+00:00'))
-                fields.append({
-                    'name': 'Started',
-                    'value': dt.strftime('%Y-%m-%d %H:%M:%S UTC'),
-                    'inline': True
-                })
-            except:
-                pass
+        if starts_at and isinstance(starts_at, str):
+            started = _started_value(starts_at)
+            if started:
+                fields.append({'name': 'Started', 'value': started, 'inline': True})
 
-        embed = {
+        return {
             'title': title,
             'description': description,
             'color': color,
             'fields': fields,
-            'footer': {
-                'text': f"Homelab Monitoring • {alert_data.get('externalURL', 'Alertmanager')}"
-            },
-            'timestamp': datetime.utcnow().isoformat()
+            'footer': {'text': footer},
+            'timestamp': timestamp,
         }
 
-        embeds.append(embed)
 
+def load_templates(path):
+    """Compile the templates file: {"<alertname>": {spec}, "*": {spec for the rest}}
+
+    See EmbedTemplate for the spec keys. Returns {alertname: EmbedTemplate}.
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    if not isinstance(specs, dict):
+        raise ValueError(f"{path}: expected an object keyed by alertname")
+    templates = {}
+    for alertname, spec in specs.items():
+        try:
+            templates[alertname] = EmbedTemplate(spec)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"{path}: template {alertname!r}: {e!r}") from None
+    return templates
+
+
+DEFAULT_TEMPLATE = EmbedTemplate()
+EMBED_TEMPLATES = load_templates(TEMPLATES_FILE) if TEMPLATES_FILE else {}
+FALLBACK_TEMPLATE = EMBED_TEMPLATES.get('*', DEFAULT_TEMPLATE)
+
+
+def format_discord_embed(alert_data):
+    """Convert Alertmanager alert to Discord embed format"""
+    status = alert_data.get('status', 'unknown')
+    footer = f"Homelab Monitoring • {alert_data.get('externalURL', 'Alertmanager')}"
+    timestamp = datetime.utcnow().isoformat()
+    templates = EMBED_TEMPLATES
+    embeds = []
+    for alert in alert_data.get('alerts', []):
+        template = templates.get(alert.get('labels', {}).get('alertname'), FALLBACK_TEMPLATE) if templates \
+            else DEFAULT_TEMPLATE
+        embeds.append(template.render(alert, status, footer, timestamp))
     return embeds
 
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    """Receive Alertmanager webhook and forward to Discord"""
+
+# Discord message limits (https://discord.com/developers/docs/resources/message#embed-object-embed-limits)
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_TITLE_CHARS = 256
+MAX_DESCRIPTION_CHARS = 4096
+MAX_FIELDS = 25
+MAX_FIELD_NAME_CHARS = 256
+MAX_FIELD_VALUE_CHARS = 1024
+MAX_FOOTER_CHARS = 2048
+
+
+def _truncate(text, limit):
+    text = str(text)
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def clamp_embed(embed):
+    """Truncate an embed so it fits Discord's per-embed limits on its own"""
+    embed = dict(embed)
+    if 'title' in embed:
+        embed['title'] = _truncate(embed['title'], MAX_TITLE_CHARS)
+    if 'description' in embed:
+        embed['description'] = _truncate(embed['description'], MAX_DESCRIPTION_CHARS)
+    if 'fields' in embed:
+        embed['fields'] = [
+            dict(field,
+                 name=_truncate(field['name'], MAX_FIELD_NAME_CHARS),
+                 value=_truncate(field['value'], MAX_FIELD_VALUE_CHARS))
+            for field in embed['fields'][:MAX_FIELDS]
+        ]
+    if 'footer' in embed:
+        embed['footer'] = dict(embed['footer'], text=_truncate(embed['footer'].get('text', ''), MAX_FOOTER_CHARS))
+
+    # An embed alone may still exceed the per-message total: drop trailing
+    # fields first, then shorten the description
+    while embed.get('fields') and embed_length(embed) > MAX_EMBED_CHARS_PER_MESSAGE:
+        embed['fields'] = embed['fields'][:-1]
+    excess = embed_length(embed) - MAX_EMBED_CHARS_PER_MESSAGE
+    if excess > 0 and embed.get('description'):
+        embed['description'] = _truncate(embed['description'], max(len(embed['description']) - excess, 1))
+    return embed
+
+
+def _length_if_within_limits(embed):
+    """embed_length() of an embed that needs no clamping, else None"""
+    title = embed.get('title', '')
+    description = embed.get('description', '')
+    footer = (embed.get('footer') or {}).get('text', '')
+    if len(title) > MAX_TITLE_CHARS or len(description) > MAX_DESCRIPTION_CHARS or len(footer) > MAX_FOOTER_CHARS:
+        return None
+    length = len(title) + len(description) + len(footer) + len((embed.get('author') or {}).get('name', ''))
+    fields = embed.get('fields', ())
+    if len(fields) > MAX_FIELDS:
+        return None
+    for field in fields:
+        name, value = field.get('name', ''), field.get('value', '')
+        if len(name) > MAX_FIELD_NAME_CHARS or len(value) > MAX_FIELD_VALUE_CHARS:
+            return None
+        length += len(name) + len(value)
+    return length if length <= MAX_EMBED_CHARS_PER_MESSAGE else None
+
+
+def embed_length(embed):
+    """Characters Discord counts toward the 6000-per-message embed total"""
+    length = len(embed.get('title', '')) + len(embed.get('description', ''))
+    length += len((embed.get('footer') or {}).get('text', ''))
+    length += len((embed.get('author') or {}).get('name', ''))
+    for field in embed.get('fields', []):
+        length += len(field.get('name', '')) + len(field.get('value', ''))
+    return length
+
+
+def pack_embeds(embeds):
+    """Split embeds into Discord payloads that respect the per-message limits
+
+    Embeds keep their order; each payload holds at most 10 embeds and 6000
+    embed characters.
+    """
+    payloads = []
+    current, current_len = [], 0
+    for embed in embeds:
+        # Most embeds already fit; only copy and truncate the ones that don't
+        length = _length_if_within_limits(embed)
+        if length is None:
+            embed = clamp_embed(embed)
+            length = embed_length(embed)
+        if current and (len(current) >= MAX_EMBEDS_PER_MESSAGE or
+                        current_len + length > MAX_EMBED_CHARS_PER_MESSAGE):
+            payloads.append({'embeds': current})
+            current, current_len = [], 0
+        current.append(embed)
+        current_len += length
+    if current:
+        payloads.append({'embeds': current})
+    return payloads
+
+
+def _tally(values, limit):
+    """'value × count' lines, most common first, capped at limit"""
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    lines = [f'{value} × {count}' for value, count in ranked[:limit]]
+    if len(ranked) > limit:
+        lines.append(f'… and {len(ranked) - limit} more')
+    return '\n'.join(lines) or 'none'
+
+
+def format_storm_digest(notifications_data, examples=STORM_EXAMPLES):
+    """Collapse the alerts of one or more notifications into a single digest embed"""
+    alerts = []
+    for alert_data in notifications_data:
+        for alert in alert_data.get('alerts', []):
+            alerts.append((alert, alert.get('status', alert_data.get('status', 'unknown'))))
+
+    firing = [(a, s) for a, s in alerts if s == 'firing']
+    labels = [a.get('labels', {}) for a, _ in alerts]
+    if any(a.get('labels', {}).get('severity') == 'critical' for a, _ in firing):
+        color = 15158332
+    elif firing:
+        color = 16753920
+    else:
+        color = 3066993
+
+    # Examples: firing before resolved, most severe first
+    ranked = sorted(alerts, key=lambda item: (
+        item[1] != 'firing',
+        -SEVERITY_RANK.get(item[0].get('labels', {}).get('severity'), 1)))
+    lines = []
+    for alert, status in ranked[:examples]:
+        alert_labels = alert.get('labels', {})
+        annotations = alert.get('annotations', {})
+        icon = '🚨' if status == 'firing' else '✅'
+        where = f" on {alert_labels['instance']}" if 'instance' in alert_labels else ''
+        summary = annotations.get('summary', annotations.get('description', ''))
+        line = f"{icon} **{alert_labels.get('alertname', 'Alert')}**{where}"
+        lines.append(_truncate(f'{line}: {summary}' if summary else line, 200))
+
+    external_url = notifications_data[0].get('externalURL', 'Alertmanager') if notifications_data else 'Alertmanager'
+    return {
+        'title': f'🌩️ Alert storm: {len(alerts)} alerts ({len(firing)} firing, {len(alerts) - len(firing)} resolved)',
+        'description': 'Too many alerts at once to list individually. Full detail is in Alertmanager.',
+        'color': color,
+        'fields': [
+            {'name': 'Severity', 'value': _tally((l.get('severity', 'none') for l in labels), 5), 'inline': True},
+            {'name': 'Alertname', 'value': _tally((l.get('alertname', 'none') for l in labels), 10), 'inline': True},
+            {'name': 'Instance', 'value': _tally((l['instance'] for l in labels if 'instance' in l), 10), 'inline': True},
+            {'name': 'Service', 'value': _tally((l['service'] for l in labels if 'service' in l), 10), 'inline': True},
+            {'name': f'Examples ({min(examples, len(alerts))} of {len(alerts)})', 'value': '\n'.join(lines) or 'none', 'inline': False},
+        ],
+        'footer': {'text': f'Homelab Monitoring • {external_url}'},
+        'timestamp': datetime.utcnow().isoformat(),
+    }
+
+
+class StormDetector:
+    """Sliding count of alerts received over the last window seconds
+
+    Storm mode is on while the count is at or above threshold. Like the
+    delivery queue, the count is per process.
+    """
+
+    def __init__(self, window, threshold):
+        self.window = window
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._events = deque()   # (time.monotonic(), alerts)
+        self._count = 0
+
+    def _expire_locked(self, now):
+        while self._events and now - self._events[0][0] > self.window:
+            self._count -= self._events.popleft()[1]
+
+    def observe(self, alerts):
+        with self._lock:
+            now = time.monotonic()
+            self._expire_locked(now)
+            self._events.append((now, alerts))
+            self._count += alerts
+
+    def active(self):
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            return self._count >= self.threshold
+
+    def snapshot(self):
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            return {
+                'active': self._count >= self.threshold,
+                'window_alerts': self._count,
+                'threshold': self.threshold,
+                'window': self.window,
+            }
+
+
+def parse_alert_time(value):
+    """Epoch seconds for an Alertmanager RFC 3339 timestamp, None if unset or bad"""
+    if not value or value.startswith('0001-'):
+        return None
     try:
-        alert_data = request.json
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        # Python < 3.11 rejects nanosecond fractions; seconds precision will do
+        try:
+            return datetime.fromisoformat(value[:19] + '+00:00').timestamp()
+        except ValueError:
+            return None
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class LatencyTracker:
+    """Per-alert delivery latency: Prometheus histograms plus a rolling window
+
+    observe() is called once per leg Discord acknowledged. The window of
+    recent samples feeds summary() (the /slo endpoint). Under gunicorn each
+    worker saves its window to slo-<pid>.json in share_dir (the Prometheus
+    multiprocess directory) and summary() merges the other workers' files.
+    """
+
+    def __init__(self, window, max_samples, targets, relay_targets, share_dir=None, save_interval=10):
+        self.window = window
+        self.targets = targets
+        self.relay_targets = relay_targets
+        self.share_dir = share_dir
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        # (acked_at, severity, alertname, alertmanager, relay, end_to_end)
+        self._samples = deque(maxlen=max_samples)
+        self._first = OrderedDict()   # (destination, fingerprint, startsAt) already measured
+        self._dirty = False
+        self._started = False
+
+    def observe(self, leg, acked_at):
+        received_at = leg.notification.received_at
+        status = leg.data.get('status', 'unknown')
+        rows = []
+        with self._lock:
+            for alert in leg.data.get('alerts', []):
+                labels = alert.get('labels', {})
+                severity = labels.get('severity', 'none')
+                alertname = labels.get('alertname', 'none')
+                relay = max(acked_at - received_at, 0.0)
+                alertmanager = end_to_end = None
+                starts_at = alert.get('startsAt', '')
+                if alert.get('status', status) == 'firing' and self._first_delivery_locked(
+                        (leg.destination.name, alert_fingerprint(alert), starts_at)):
+                    started = parse_alert_time(starts_at)
+                    if started is not None:
+                        alertmanager = max(received_at - started, 0.0)
+                        end_to_end = max(acked_at - started, 0.0)
+                rows.append((severity, alertname, alertmanager, relay, end_to_end))
+                self._samples.append((acked_at, severity, alertname, alertmanager, relay, end_to_end))
+            self._dirty = True
+        for severity, alertname, alertmanager, relay, end_to_end in rows:
+            ALERT_LATENCY.labels(stage='relay', severity=severity, alertname=alertname).observe(relay)
+            if end_to_end is not None:
+                ALERT_LATENCY.labels(stage='alertmanager', severity=severity, alertname=alertname).observe(alertmanager)
+                ALERT_LATENCY.labels(stage='end_to_end', severity=severity, alertname=alertname).observe(end_to_end)
+
+    def _first_delivery_locked(self, key):
+        if key in self._first:
+            self._first.move_to_end(key)
+            return False
+        self._first[key] = True
+        while len(self._first) > self._samples.maxlen:
+            self._first.popitem(last=False)
+        return True
+
+    def start(self):
+        """Start saving the window for other workers (idempotent)"""
+        with self._lock:
+            if self._started or not self.share_dir:
+                return
+            self._started = True
+        threading.Thread(target=self._saver, name='slo-saver', daemon=True).start()
+
+    def _saver(self):
+        path = os.path.join(self.share_dir, f'slo-{os.getpid()}.json')
+        while True:
+            time.sleep(self.save_interval)
+            with self._lock:
+                if not self._dirty:
+                    continue
+                samples = list(self._samples)
+                self._dirty = False
+            try:
+                with open(path + '.tmp', 'w') as f:
+                    json.dump(samples, f, separators=(',', ':'))
+                os.replace(path + '.tmp', path)
+            except OSError as e:
+                logging.error(f"Could not save SLO samples to {path}: {e}")
+
+    def _all_samples(self, since):
+        with self._lock:
+            samples = [tuple(sample) for sample in self._samples if sample[0] >= since]
+        if self.share_dir:
+            own = f'slo-{os.getpid()}.json'
+            for path in glob.glob(os.path.join(self.share_dir, 'slo-*.json')):
+                if os.path.basename(path) == own:
+                    continue
+                try:
+                    with open(path) as f:
+                        samples.extend(tuple(sample) for sample in json.load(f) if sample[0] >= since)
+                except (OSError, ValueError, TypeError, IndexError):
+                    continue
+        return samples
+
+    def _stage(self, values, target=None):
+        ordered = sorted(v for v in values if v is not None)
+        stats = {
+            'count': len(ordered),
+            'p50': _percentile(ordered, 0.50),
+            'p95': _percentile(ordered, 0.95),
+            'p99': _percentile(ordered, 0.99),
+        }
+        stats = {k: round(v, 3) if isinstance(v, float) else v for k, v in stats.items()}
+        if target is not None:
+            stats['target'] = target
+            stats['within_target'] = round(sum(1 for v in ordered if v <= target) / len(ordered), 4) if ordered else None
+        return stats
+
+    def summary(self, top=10):
+        """Latency percentiles and target compliance over the window, by severity"""
+        now = time.time()
+        samples = self._all_samples(now - self.window)
+        by_severity = {}
+        for sample in samples:
+            by_severity.setdefault(sample[1], []).append(sample)
+
+        severities = {}
+        for severity, rows in sorted(by_severity.items(), key=lambda item: -SEVERITY_RANK.get(item[0], -1)):
+            severities[severity] = {
+                'alertmanager': self._stage(r[3] for r in rows),
+                'relay': self._stage((r[4] for r in rows), self.relay_targets.get(severity)),
+                'end_to_end': self._stage((r[5] for r in rows), self.targets.get(severity)),
+            }
+
+        by_alertname = {}
+        for sample in samples:
+            if sample[5] is not None:
+                by_alertname.setdefault(sample[2], []).append(sample)
+        slowest = sorted(
+            ({'alertname': name,
+              'count': len(rows),
+              'end_to_end_p95': self._stage(r[5] for r in rows)['p95'],
+              'alertmanager_p95': self._stage(r[3] for r in rows)['p95'],
+              'relay_p95': self._stage(r[4] for r in rows)['p95']}
+             for name, rows in by_alertname.items()),
+            key=lambda row: -row['end_to_end_p95'])[:top]
+
+        # Where the time goes: Alertmanager's grouping or the relay
+        alertmanager = self._stage(s[3] for s in samples)
+        relay = self._stage(s[4] for s in samples if s[3] is not None)
+        dominant = None
+        if alertmanager['count']:
+            dominant = 'alertmanager' if alertmanager['p50'] >= relay['p50'] else 'relay'
+        return {
+            'window': self.window,
+            'samples': len(samples),
+            'dominant_stage': dominant,
+            'severities': severities,
+            'slowest_alertnames': slowest,
+        }
+
+
+def notification_severity(alert_data):
+    """Highest severity across a notification's alerts (unknown counts as warning)"""
+    best = None
+    for alert in alert_data.get('alerts', []):
+        severity = alert.get('labels', {}).get('severity', 'warning')
+        if severity not in SEVERITY_RANK:
+            severity = 'warning'
+        if best is None or SEVERITY_RANK[severity] > SEVERITY_RANK[best]:
+            best = severity
+    return best or 'warning'
+
+
+class DedupCache:
+    """LRU + TTL set of recently relayed alerts
+
+    Keyed on (fingerprint, startsAt, status, label hash); startsAt tells a
+    re-fire apart from the episode that resolved before it, even when the
+    receiver never sends the resolution. Entries expire ttl seconds
+    after they were first seen; re-sightings don't extend the window, so a
+    steadily repeated alert still goes out once per ttl. The cache is per
+    worker process, so a repeat landing on the other gunicorn worker is
+    not caught.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> first seen (monotonic)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(alert, status):
+        labels = alert.get('labels', {})
+        label_hash = hashlib.sha1(
+            json.dumps(labels, sort_keys=True, separators=(',', ':')).encode()
+        ).hexdigest()
+        return (alert.get('fingerprint', ''), alert.get('startsAt', ''), alert.get('status', status), label_hash)
+
+    def seen(self, key):
+        """True if key was seen within ttl; records it otherwise"""
+        now = time.monotonic()
+        with self._lock:
+            first_seen = self._entries.get(key)
+            if first_seen is not None:
+                if now - first_seen < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    DEDUP_EVENTS.labels(event='hit').inc()
+                    return True
+                self.expirations += 1
+                DEDUP_EVENTS.labels(event='expiration').inc()
+                del self._entries[key]
+
+            self.misses += 1
+            DEDUP_EVENTS.labels(event='miss').inc()
+            self._entries[key] = now
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+                DEDUP_EVENTS.labels(event='eviction').inc()
+            return False
+
+    def filter(self, alert_data):
+        """Copy of alert_data without alerts that are exact recent repeats"""
+        status = alert_data.get('status', 'unknown')
+        fresh = [a for a in alert_data.get('alerts', []) if not self.seen(self.key(a, status))]
+        if len(fresh) == len(alert_data.get('alerts', [])):
+            return alert_data
+        return dict(alert_data, alerts=fresh)
+
+    def forget(self, alert_data):
+        """Drop the keys of alert_data's alerts, so a retry of a notification
+        that was not accepted after all is not taken for a repeat"""
+        status = alert_data.get('status', 'unknown')
+        with self._lock:
+            for alert in alert_data.get('alerts', []):
+                self._entries.pop(self.key(alert, status), None)
 
-        if not alert_data:
-            return jsonify({'error': 'No data received'}), 400
+    def snapshot(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
 
-        logging.info(f"Received alert: {alert_data.get('status')} - {len(alert_data.get('alerts', []))} alerts")
 
-        # Format for Discord
-        embeds = format_discord_embed(alert_data)
+class Notification:
+    """One accepted Alertmanager notification on its way to Discord
 
-        # Send to Discord
-        discord_payload = {
-            'embeds': embeds
+    It is routed into one Leg per destination. delivered remembers which
+    destinations already have it, so a retry only goes to the others
+    (in memory only: after a restart the spool replays to all of them).
+    """
+
+    __slots__ = ('data', 'severity', 'received_at', 'spool_id', 'delivered', 'pending', 'failed', 'shed',
+                 'attempts')
+
+    def __init__(self, data, received_at=None, spool_id=None):
+        self.data = data
+        self.severity = notification_severity(data)
+        self.received_at = received_at or time.time()
+        self.spool_id = spool_id
+        self.delivered = set()   # destination names
+        self.pending = 0         # legs not settled yet
+        self.failed = False      # a leg of the current attempt failed
+        self.shed = False        # a leg of the current attempt was shed
+        self.attempts = 0        # failed delivery attempts (in-memory retry)
+
+
+class Leg:
+    """The alerts of one notification that are routed to one destination
+
+    Legs are what destination queues hold and senders format; they look
+    enough like a Notification (data, severity) for the delivery code.
+    """
+
+    __slots__ = ('notification', 'destination', 'data', 'severity', 'acked_at')
+
+    def __init__(self, notification, destination, data):
+        self.notification = notification
+        self.destination = destination
+        self.data = data
+        self.acked_at = None     # last Discord 2xx for one of its messages
+        self.severity = notification.severity if data is notification.data else notification_severity(data)
+
+
+class Spool:
+    """Append-only on-disk log of notifications not yet accepted by Discord
+
+    Each worker process owns spool-<pid>.ndjson, guarded by an flock on a
+    sidecar .lock file. Lines are {"op": "add"} or {"op": "ack"} records.
+    A flusher thread fsyncs appends in batches and append() returns once its
+    line is durable. When acked records outweigh live ones the file is
+    compacted by rewriting the live entries and renaming over it. Above
+    max_bytes the lowest-severity (then oldest) entries are dropped. Spools
+    whose lock is free were left by a dead worker and are adopted on open();
+    the adopter unlinks the lock file, so an owner re-checks after flock that
+    it still holds the file on disk.
+    """
+
+    def __init__(self, directory, max_bytes, fsync_interval):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.fsync_interval = fsync_interval
+        self.path = None
+        self._file = None
+        self._lock_file = None
+        self._cond = threading.Condition()
+        self._entries = {}        # spool_id -> [notification, record bytes, parked]
+        self._live_bytes = 0
+        self._dead_bytes = 0
+        self._written = 0
+        self._synced = 0
+        self.evicted = 0
+
+    def open(self):
+        """Claim this process's spool file and adopt spools left by dead workers
+
+        Returns the number of undelivered notifications found on disk; they
+        are parked and handed out by take_parked().
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f'spool-{os.getpid()}')
+        while True:
+            self._lock_file = open(base + '.lock', 'w')
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            # Another worker may have adopted a previous run's spool-<pid>
+            # and unlinked the lock between our open() and flock()
+            try:
+                if os.stat(base + '.lock').st_ino == os.fstat(self._lock_file.fileno()).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            self._lock_file.close()
+        self.path = base + '.ndjson'
+
+        # PIDs repeat across container restarts, so our own file may hold a
+        # previous run's backlog
+        recovered = self._read(self.path)
+        self._file = open(self.path, 'ab')
+        for notification in recovered:
+            size = len(self._add_line(notification))
+            self._entries[notification.spool_id] = [notification, size, True]
+            self._live_bytes += size
+        self._compact()
+
+        for orphan in sorted(glob.glob(os.path.join(self.directory, 'spool-*.ndjson'))):
+            if orphan != self.path:
+                recovered.extend(self._adopt(orphan))
+
+        threading.Thread(target=self._flusher, name='spool-flusher', daemon=True).start()
+        return len(recovered)
+
+    def _adopt(self, orphan):
+        # The sidecar may be gone if its owner died before creating it or
+        # after an earlier adopter unlinked it; lock a fresh one then
+        lock_path = orphan[:-len('.ndjson')] + '.lock'
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return []  # a live worker owns it
+            try:
+                if os.stat(lock_path).st_ino != os.fstat(fd).st_ino:
+                    return []  # adopted and unlinked by another worker meanwhile
+            except FileNotFoundError:
+                return []
+            adopted = self._read(orphan)
+            with self._cond:
+                for notification in adopted:
+                    self._append_locked(notification, parked=True)
+                self._sync_locked()
+            # Only forget the orphan once its entries are durable in our file
+            for path in (orphan, lock_path):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            if adopted:
+                logging.info(f"Adopted {len(adopted)} undelivered notifications from {orphan}")
+            return adopted
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _read(path):
+        live = {}
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return []
+        with f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn write from a crash
+                if record.get('op') == 'add':
+                    live[record['id']] = record
+                elif record.get('op') == 'ack':
+                    live.pop(record.get('id'), None)
+        return [Notification(r['data'], received_at=r.get('ts'), spool_id=r['id']) for r in live.values()]
+
+    @staticmethod
+    def _add_line(notification):
+        record = {
+            'op': 'add',
+            'id': notification.spool_id,
+            'ts': notification.received_at,
+            'data': notification.data,
         }
+        return json_bytes(record) + b'\n'
+
+    def _append_locked(self, notification, parked=False):
+        if notification.spool_id is None:
+            notification.spool_id = uuid.uuid4().hex
+        line = self._add_line(notification)
+        self._file.write(line)
+        self._written += 1
+        self._entries[notification.spool_id] = [notification, len(line), parked]
+        self._live_bytes += len(line)
+        self._enforce_cap_locked()
+
+    def _remove_locked(self, spool_id):
+        entry = self._entries.pop(spool_id, None)
+        if entry is None:
+            return
+        line = (json.dumps({'op': 'ack', 'id': spool_id}) + '\n').encode()
+        self._file.write(line)
+        self._written += 1
+        self._live_bytes -= entry[1]
+        self._dead_bytes += entry[1] + len(line)
+
+    def _enforce_cap_locked(self):
+        while self._live_bytes > self.max_bytes and len(self._entries) > 1:
+            victim = min(
+                self._entries.values(),
+                key=lambda e: (SEVERITY_RANK[e[0].severity], e[0].received_at)
+            )[0]
+            self._remove_locked(victim.spool_id)
+            self.evicted += 1
+            SPOOL_EVICTIONS.inc()
+            logging.warning(f"Spool over {self.max_bytes} bytes, dropped {victim.severity} notification {victim.spool_id}")
+
+    def _sync_locked(self):
+        if self._written != self._synced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._cond.notify_all()
+
+    def _compact(self):
+        """Rewrite only live entries (caller holds the lock or is single-threaded)"""
+        tmp = self.path + '.tmp'
+        live_bytes = 0
+        with open(tmp, 'wb') as out:
+            for entry in self._entries.values():
+                line = self._add_line(entry[0])
+                out.write(line)
+                entry[1] = len(line)
+                live_bytes += len(line)
+            out.flush()
+            os.fsync(out.fileno())
+        self._file.close()
+        os.replace(tmp, self.path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        self._file = open(self.path, 'ab')
+        self._live_bytes = live_bytes
+        self._dead_bytes = 0
+        self._synced = self._written
+
+    def _flusher(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            with self._cond:
+                try:
+                    self._sync_locked()
+                    if self._dead_bytes > max(self._live_bytes, SPOOL_COMPACT_MIN_BYTES):
+                        self._compact()
+                except OSError as e:
+                    logging.error(f"Spool write failed: {e}")
+
+    def sync(self):
+        """fsync pending appends and acks now instead of on the flusher's next tick"""
+        with self._cond:
+            self._sync_locked()
+
+    def append(self, notification):
+        """Persist a notification; returns once it is fsynced"""
+        with self._cond:
+            self._append_locked(notification)
+            target = self._written
+            while self._synced < target:
+                self._cond.wait()
+
+    def ack(self, notifications):
+        """Forget notifications that Discord accepted (or that must not be retried)"""
+        with self._cond:
+            for notification in notifications:
+                if notification.spool_id:
+                    self._remove_locked(notification.spool_id)
+
+    def park(self, notifications):
+        """Mark notifications as waiting for a later retry"""
+        with self._cond:
+            for notification in notifications:
+                entry = self._entries.get(notification.spool_id)
+                if entry:
+                    entry[2] = True
+
+    def take_parked(self, limit):
+        """Hand out up to limit parked notifications, most severe and oldest first"""
+        with self._cond:
+            parked = [e for e in self._entries.values() if e[2]]
+            parked.sort(key=lambda e: (-SEVERITY_RANK[e[0].severity], e[0].received_at))
+            taken = parked[:max(limit, 0)]
+            for entry in taken:
+                entry[2] = False
+            return [e[0] for e in taken]
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'entries': len(self._entries),
+                'parked': sum(1 for e in self._entries.values() if e[2]),
+                'live_bytes': self._live_bytes,
+                'file_bytes': self._live_bytes + self._dead_bytes,
+                'evicted': self.evicted,
+            }
+
+
+class RetryQueue:
+    """Failed notifications waiting in memory for another delivery attempt
+
+    The spool's stand-in when RELAY_SPOOL_DIR is unset: each notification is
+    retried with exponential backoff up to attempts times, then given up on.
+    Nothing survives a restart.
+    """
+
+    def __init__(self, attempts, backoff, backoff_max):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._heap = []     # (due, seq, notification)
+        self._seq = itertools.count()
+        self.retried = 0
+        self.lost = 0
+
+    def park(self, notifications, delay=None):
+        """Schedule notifications for a retry; returns those out of attempts
+
+        With delay, they are retried after it without using up an attempt
+        (nothing was tried: the breaker shed them).
+        """
+        lost = []
+        now = time.monotonic()
+        with self._cond:
+            for notification in notifications:
+                if delay is None:
+                    notification.attempts += 1
+                    if notification.attempts > self.attempts:
+                        lost.append(notification)
+                        continue
+                    due = min(self.backoff * 2 ** (notification.attempts - 1), self.backoff_max)
+                else:
+                    due = delay
+                heapq.heappush(self._heap, (now + due, next(self._seq), notification))
+            self.lost += len(lost)
+            self._cond.notify()
+        return lost
+
+    def take_due(self, timeout):
+        """Notifications whose retry is due, waiting up to timeout for one"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        due.append(heapq.heappop(self._heap)[2])
+                    self.retried += len(due)
+                    return due
+                if now >= deadline:
+                    return []
+                wake = self._heap[0][0] if self._heap else deadline
+                self._cond.wait(min(wake, deadline) - now)
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def snapshot(self):
+        with self._cond:
+            return {'pending': len(self._heap), 'retried': self.retried, 'lost': self.lost}
+
+
+class PayloadCapture:
+    """Rotating NDJSON log of inbound notifications, for offline replay
+
+    Each worker process appends to its own capture-<pid>.ndjson, opened on
+    the first write (after gunicorn forks). Lines are written unbuffered but
+    not fsynced: a capture is a sample of traffic, nothing depends on it.
+    """
+
+    def __init__(self, directory, max_bytes, keep):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.path = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self.captured = 0
+        self.rotations = 0
+
+    def _open_locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'capture-{os.getpid()}.ndjson')
+        self._file = open(self.path, 'ab', buffering=0)
+        self._size = self._file.tell()
+
+    def _rotate_locked(self):
+        self._file.close()
+        self._file = None
+        os.replace(self.path, os.path.join(self.directory, f'capture-{os.getpid()}-{time.time_ns() // 1_000_000}.ndjson'))
+        self.rotations += 1
+        rotated = sorted(glob.glob(os.path.join(self.directory, 'capture-*-*.ndjson')), key=os.path.getmtime)
+        for path in rotated[:max(len(rotated) - self.keep, 0)]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass  # another worker pruned it first
+
+    def write(self, alert_data, received_at=None):
+        line = json_bytes({'ts': received_at or time.time(), 'data': alert_data}) + b'\n'
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._open_locked()
+                self._file.write(line)
+                self._size += len(line)
+                self.captured += 1
+                if self._size >= self.max_bytes:
+                    self._rotate_locked()
+            except OSError as e:
+                logging.error(f"Capture write failed: {e}")
+                EXCEPTIONS.labels(stage='capture').inc()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'captured': self.captured,
+                'bytes': self._size,
+                'rotations': self.rotations,
+            }
+
+
+def alert_fingerprint(alert):
+    """Alertmanager's fingerprint, or a hash of the labels when it is missing"""
+    if alert.get('fingerprint'):
+        return alert['fingerprint']
+    labels = json.dumps(alert.get('labels', {}), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(labels.encode()).hexdigest()[:16]
+
+
+class MessageIndex:
+    """Bounded map from alert fingerprint to the Discord message showing it
+
+    For every posted message the index keeps its embeds (a PATCH has to send
+    the whole message) and the position of each firing alert's embed in it.
+    Past max_messages the least recently used message is evicted together
+    with its fingerprints.
+
+    With a path, the index is saved there at most every flush_interval
+    seconds. Saves take an flock and merge with what other workers saved
+    (newest entry per message wins), and a lookup miss re-reads the file if
+    it changed, so an edit works whichever worker receives the resolution.
+    """
+
+    def __init__(self, path, max_messages, flush_interval):
+        self.path = path
+        self.max_messages = max_messages
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # message ID -> {'embeds': [...], 'fingerprints': {fp: position}, 'used': epoch}
+        self._messages = OrderedDict()
+        self._fingerprints = {}
+        self._forgotten = set()
+        self._dirty = False
+        self._mtime = None
+        self._started = False
+        self.evictions = 0
+
+    def open(self):
+        """Load the saved index and start the flusher (idempotent)"""
+        with self._lock:
+            if self._started or not self.path:
+                return
+            self._started = True
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._reload_locked()
+        threading.Thread(target=self._flusher, name='message-index-flusher', daemon=True).start()
+
+    def _merge_locked(self, messages):
+        for message_id, entry in messages.items():
+            if message_id in self._forgotten:
+                continue
+            current = self._messages.get(message_id)
+            if current is None or entry['used'] > current['used']:
+                self._messages[message_id] = entry
+        ordered = sorted(self._messages.items(), key=lambda item: item[1]['used'])
+        self._messages = OrderedDict(ordered)
+        self._fingerprints = {}
+        for message_id, entry in ordered:
+            for fingerprint in entry['fingerprints']:
+                self._fingerprints[fingerprint] = message_id
+        self._evict_locked()
+
+    def _evict_locked(self):
+        while len(self._messages) > self.max_messages:
+            message_id, entry = self._messages.popitem(last=False)
+            for fingerprint in entry['fingerprints']:
+                if self._fingerprints.get(fingerprint) == message_id:
+                    del self._fingerprints[fingerprint]
+            self.evictions += 1
+            MESSAGE_INDEX_EVENTS.labels(event='evicted').inc()
+
+    def _read_file(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get('messages', {})
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"Ignoring unreadable message index {self.path}: {e}")
+            return {}
+
+    def _reload_locked(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._merge_locked(self._read_file())
+
+    def lookup(self, fingerprint):
+        """(message ID, embed position) of the message announcing fingerprint, or None"""
+        with self._lock:
+            message_id = self._fingerprints.get(fingerprint)
+            if message_id is None and self._started:
+                self._reload_locked()
+                message_id = self._fingerprints.get(fingerprint)
+            if message_id is None:
+                MESSAGE_INDEX_EVENTS.labels(event='miss').inc()
+                return None
+            MESSAGE_INDEX_EVENTS.labels(event='hit').inc()
+            return message_id, self._messages[message_id]['fingerprints'][fingerprint]
+
+    def embeds(self, message_id):
+        """Copy of a message's current embeds, or None if it is not indexed"""
+        with self._lock:
+            entry = self._messages.get(message_id)
+            return list(entry['embeds']) if entry else None
+
+    def record(self, message_id, embeds, fingerprints):
+        """Index a posted message; fingerprints[i] is embed i's alert or None"""
+        positions = {fp: i for i, fp in enumerate(fingerprints) if fp}
+        if not positions:
+            return
+        with self._lock:
+            self._forgotten.discard(message_id)
+            self._messages[message_id] = {'embeds': embeds, 'fingerprints': positions, 'used': time.time()}
+            self._messages.move_to_end(message_id)
+            for fingerprint in positions:
+                self._fingerprints[fingerprint] = message_id
+            self._evict_locked()
+            self._dirty = True
+
+    def edited(self, message_id, embeds, resolved):
+        """Store a message's embeds after an edit and drop the resolved fingerprints"""
+        with self._lock:
+            entry = self._messages.get(message_id)
+            if entry is None:
+                return
+            entry['embeds'] = embeds
+            entry['used'] = time.time()
+            for fingerprint in resolved:
+                entry['fingerprints'].pop(fingerprint, None)
+                if self._fingerprints.get(fingerprint) == message_id:
+                    del self._fingerprints[fingerprint]
+            self._messages.move_to_end(message_id)
+            self._dirty = True
+
+    def forget(self, message_id):
+        """Drop a message Discord no longer has"""
+        with self._lock:
+            entry = self._messages.pop(message_id, None)
+            self._forgotten.add(message_id)
+            if entry:
+                for fingerprint in entry['fingerprints']:
+                    if self._fingerprints.get(fingerprint) == message_id:
+                        del self._fingerprints[fingerprint]
+            self._dirty = True
+
+    def save(self):
+        """Merge with the file on disk and write the index back atomically"""
+        if not self.path:
+            return
+        with open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            with self._lock:
+                self._merge_locked(self._read_file())
+                data = {'messages': dict(self._messages)}
+                self._dirty = False
+                self._forgotten.clear()
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            with self._lock:
+                self._mtime = os.stat(self.path).st_mtime_ns
+
+    def flush(self):
+        """save() if anything changed since the last save, logging failures"""
+        if self._dirty:
+            try:
+                self.save()
+            except OSError as e:
+                logging.error(f"Could not save message index {self.path}: {e}")
+                EXCEPTIONS.labels(stage='message_index').inc()
+
+    def _flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'messages': len(self._messages),
+                'fingerprints': len(self._fingerprints),
+                'evictions': self.evictions,
+                'path': self.path or None,
+            }
+
+
+class DeliveryQueue:
+    """Bounded priority queue of accepted notifications, one FIFO lane per severity
+
+    Lanes drain by strict priority (critical first) or by smooth weighted
+    round-robin over the non-empty lanes, which keeps lower lanes moving
+    under sustained load. Each lane has a latency budget; time spent queued
+    is observed per lane and entries that leave after their budget are
+    counted.
+
+    maxsize bounds all lanes together. When full, drop-oldest and
+    drop-newest evict the oldest/newest entry of the lowest-severity lane
+    that does not outrank the incoming notification; if every queued
+    notification outranks it, the incoming one is dropped instead. reject
+    refuses the incoming notification. on_drop is called with every
+    notification the policy discards.
+    """
+
+    def __init__(self, maxsize, policy, on_drop=None, scheduling='strict', weights=None, budgets=None,
+                 name='default'):
+        self._cond = threading.Condition()
+        self.name = name
+        # Lanes in priority order, most severe first
+        self.lanes = sorted(SEVERITY_RANK, key=SEVERITY_RANK.get, reverse=True)
+        self._lanes = {lane: deque() for lane in self.lanes}   # (enqueued_at, item)
+        self._credit = {lane: 0 for lane in self.lanes}
+        self._size = 0
+        self._unfinished = 0
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_drop = on_drop
+        self.scheduling = scheduling
+        self.weights = weights or {}
+        self.budgets = budgets or {}
+        self.dropped = 0
+        self.over_budget = {lane: 0 for lane in self.lanes}
+
+    @staticmethod
+    def _lane_of(item):
+        severity = getattr(item, 'severity', 'warning')
+        return severity if severity in SEVERITY_RANK else 'warning'
+
+    def _update_depth_locked(self, lane):
+        QUEUE_DEPTH.labels(destination=self.name, lane=lane).set(len(self._lanes[lane]))
+
+    def _drop_locked(self, lane, item):
+        self.dropped += 1
+        QUEUE_DROPS.labels(lane=lane).inc()
+        if self.on_drop:
+            self.on_drop(item)
+
+    def _victim_lane_locked(self, incoming):
+        """Lowest-severity non-empty lane that does not outrank incoming"""
+        for lane in reversed(self.lanes):
+            if SEVERITY_RANK[lane] > SEVERITY_RANK[incoming]:
+                return None
+            if self._lanes[lane]:
+                return lane
+        return None
+
+    def put(self, item):
+        """Enqueue item; returns 'queued', 'dropped' or 'rejected'"""
+        lane = self._lane_of(item)
+        with self._cond:
+            if self._size >= self.maxsize:
+                if self.policy == 'reject':
+                    return 'rejected'
+                victim_lane = self._victim_lane_locked(lane)
+                if victim_lane is None or (self.policy == 'drop-newest' and victim_lane == lane):
+                    # Everything queued outranks the newcomer, or drop-newest
+                    # within the same lane: the newcomer goes
+                    self._drop_locked(lane, item)
+                    return 'dropped'
+                victims = self._lanes[victim_lane]
+                _, victim = victims.popleft() if self.policy == 'drop-oldest' else victims.pop()
+                self._size -= 1
+                self._unfinished -= 1
+                self._update_depth_locked(victim_lane)
+                logging.warning(f"Delivery queue for {self.name} full, dropped a queued {victim_lane} notification")
+                self._drop_locked(victim_lane, victim)
+
+            self._lanes[lane].append((time.monotonic(), item))
+            self._size += 1
+            self._unfinished += 1
+            self._update_depth_locked(lane)
+            # Lane-restricted getters share the condition, so wake them all
+            self._cond.notify_all()
+            return 'queued'
+
+    def _next_lane_locked(self, lanes):
+        ready = [lane for lane in (lanes or self.lanes) if self._lanes[lane]]
+        if self.scheduling == 'strict' or len(ready) == 1:
+            return ready[0]
+        # Smooth weighted round-robin: every ready lane earns its weight, the
+        # richest is served and pays back the round's total
+        total = 0
+        for lane in ready:
+            weight = self.weights.get(lane, 1)
+            self._credit[lane] += weight
+            total += weight
+        chosen = max(ready, key=lambda lane: self._credit[lane])
+        self._credit[chosen] -= total
+        return chosen
+
+    def _available_locked(self, lanes):
+        if lanes is None:
+            return self._size
+        return sum(len(self._lanes[lane]) for lane in lanes)
+
+    def get(self, timeout=None, lanes=None):
+        """Next item, only from the given lanes if set; raises queue.Empty if
+        timeout (seconds) expires first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._available_locked(lanes):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._cond.wait(remaining)
+            lane = self._next_lane_locked(lanes)
+            enqueued_at, item = self._lanes[lane].popleft()
+            self._size -= 1
+            self._update_depth_locked(lane)
+
+        waited = time.monotonic() - enqueued_at
+        QUEUE_DELAY.labels(lane=lane).observe(waited)
+        budget = self.budgets.get(lane)
+        if budget is not None and waited > budget:
+            with self._cond:
+                self.over_budget[lane] += 1
+            QUEUE_BUDGET_EXCEEDED.labels(lane=lane).inc()
+        return item
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished = max(self._unfinished - 1, 0)
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every queued item has been got and marked done; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def unfinished(self):
+        """Items queued or handed out but not yet marked done"""
+        with self._cond:
+            return self._unfinished
+
+    def depth(self):
+        with self._cond:
+            return self._size
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._cond:
+            return {
+                lane: {
+                    'depth': len(self._lanes[lane]),
+                    'oldest_age': round(now - self._lanes[lane][0][0], 3) if self._lanes[lane] else 0,
+                    'budget': self.budgets.get(lane),
+                    'over_budget': self.over_budget[lane],
+                }
+                for lane in self.lanes
+            }
+
+
+class ConnectionStats:
+    """Counts new connections (TCP+TLS handshakes) against requests sent"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handshakes = 0
+        self.requests = 0
+        self.stale_reconnects = 0
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        CONNECTION_EVENTS.labels(event=name).inc()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'handshakes': self.handshakes,
+                'requests': self.requests,
+                'reused': max(self.requests - self.handshakes, 0),
+                'stale_reconnects': self.stale_reconnects,
+            }
+
+
+connection_stats = ConnectionStats()
+
+
+class _CountingHTTPConnection(urllib3.connection.HTTPConnection):
+    def connect(self):
+        super().connect()
+        connection_stats.incr('handshakes')
+
+
+class _CountingHTTPSConnection(urllib3.connection.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        connection_stats.incr('handshakes')
+
+
+class _CountingHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class DiscordClient:
+    """Keep-alive HTTP client for Discord, one per worker process
+
+    Wraps a requests.Session whose connection pool is sized for the sender
+    threads, recycles connections that sat idle past HTTP_IDLE_TIMEOUT and
+    retries once when a reused connection turns out to be dead.
+    """
+
+    def __init__(self, pool_size, connect_timeout, read_timeout, idle_timeout):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._last_used = time.monotonic()
+        self.session = self._new_session()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        adapter.poolmanager.pool_classes_by_scheme = {
+            'http': _CountingHTTPConnectionPool,
+            'https': _CountingHTTPSConnectionPool,
+        }
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _recycle_if_idle(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_used > self.idle_timeout:
+                # Closing the adapters drops pooled sockets; the next request reconnects
+                self.session.close()
+            self._last_used = now
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        self._recycle_if_idle()
+        kwargs.setdefault('timeout', self.timeout)
+        connection_stats.incr('requests')
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            # A keep-alive socket closed by the server surfaces as a ProtocolError
+            # on the first write/read; retry once on a fresh connection. Connect
+            # failures (MaxRetryError) are real outages and are not retried here.
+            if not (e.args and isinstance(e.args[0], urllib3.exceptions.ProtocolError)):
+                raise
+            logging.warning(f"Stale Discord connection, reconnecting: {e}")
+            connection_stats.incr('stale_reconnects')
+            connection_stats.incr('requests')
+            return self.session.request(method, url, **kwargs)
+
 
-        response = requests.post(
-            DISCORD_WEBHOOK_URL,
-            json=discord_payload,
-            timeout=10
+class RateLimitBucket:
+    """Token bucket mirrored from Discord's X-RateLimit-* response headers"""
+
+    def __init__(self):
+        self.limit = None        # unknown until the first response
+        self.remaining = None
+        self.reset_at = 0.0      # time.monotonic() when the bucket refills
+        self.inflight = 0
+        self.synced = False      # seen at least one response
+        self.waiting = {}        # priority -> senders waiting for a token
+
+
+class RateLimiter:
+    """Per-webhook send scheduler that stays under Discord's rate limits
+
+    acquire() blocks until the bucket for a webhook has a token, update()
+    re-syncs the bucket from each response. While a higher-priority sender
+    waits for a token, lower-priority senders hold back so it goes first. Tokens reserved by requests that
+    are still in flight are subtracted from the server's Remaining count so
+    concurrent sender threads don't overshoot the limit. A 429 empties the
+    bucket (or the global limit) for exactly retry_after seconds.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._buckets = {}
+        self._global_until = 0.0
+        self.throttled = 0
+        self.rate_limited = 0
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = RateLimitBucket()
+        return bucket
+
+    def _try_acquire_locked(self, key, waited, priority):
+        bucket = self._bucket(key)
+        now = time.monotonic()
+        if now < self._global_until:
+            return self._global_until - now
+        if any(count for rank, count in bucket.waiting.items() if rank > priority):
+            return 0.05
+        if bucket.reset_at and now >= bucket.reset_at:
+            bucket.remaining = bucket.limit
+            bucket.reset_at = 0.0
+        if (bucket.remaining is None and (bucket.synced or not bucket.inflight)) or \
+                (bucket.remaining is not None and bucket.remaining > 0):
+            # Until the first response reveals the limit, probe one request at a time
+            if bucket.remaining is not None:
+                bucket.remaining -= 1
+            bucket.inflight += 1
+            if waited:
+                self.throttled += 1
+                RATE_LIMIT_EVENTS.labels(event='throttled').inc()
+            return 0
+        if bucket.reset_at:
+            return bucket.reset_at - now
+        # Exhausted (or unprobed) with no reset known yet: an in-flight
+        # response will tell us
+        return None
+
+    def try_acquire(self, key, waited=False, priority=0):
+        """Take a token without blocking; returns 0 on success, else seconds
+        to wait (None if only an in-flight response can tell)
+
+        A caller that keeps polling should bracket its attempts with
+        wait_start()/wait_end() so lower priorities yield to it.
+        """
+        with self._cond:
+            return self._try_acquire_locked(key, waited, priority)
+
+    def wait_start(self, key, priority):
+        with self._cond:
+            waiting = self._bucket(key).waiting
+            waiting[priority] = waiting.get(priority, 0) + 1
+
+    def wait_end(self, key, priority):
+        with self._cond:
+            waiting = self._bucket(key).waiting
+            waiting[priority] = max(waiting.get(priority, 0) - 1, 0)
+            self._cond.notify_all()
+
+    def acquire(self, key, priority=0):
+        """Block until the webhook's bucket has a token and take it"""
+        with self._cond:
+            waited = False
+            wait = self._try_acquire_locked(key, waited, priority)
+            if wait == 0:
+                return
+            waiting = self._bucket(key).waiting
+            waiting[priority] = waiting.get(priority, 0) + 1
+            try:
+                while wait != 0:
+                    waited = True
+                    self._cond.wait(wait)
+                    wait = self._try_acquire_locked(key, waited, priority)
+            finally:
+                waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def update(self, key, status_code, headers, body=b''):
+        """Re-sync the bucket from a response; returns retry_after on a 429"""
+        with self._cond:
+            bucket = self._bucket(key)
+            bucket.inflight = max(bucket.inflight - 1, 0)
+            bucket.synced = True
+            now = time.monotonic()
+
+            if status_code == 429:
+                self.rate_limited += 1
+                RATE_LIMIT_EVENTS.labels(event='429').inc()
+                retry_after = _retry_after(headers, body)
+                if headers.get('X-RateLimit-Global', '').lower() == 'true':
+                    self._global_until = max(self._global_until, now + retry_after)
+                else:
+                    bucket.remaining = 0
+                    bucket.reset_at = now + retry_after
+                self._cond.notify_all()
+                return retry_after
+
+            try:
+                if 'X-RateLimit-Limit' in headers:
+                    bucket.limit = int(headers['X-RateLimit-Limit'])
+                if 'X-RateLimit-Remaining' in headers:
+                    remaining = max(int(headers['X-RateLimit-Remaining']) - bucket.inflight, 0)
+                    reset_at = now + float(headers.get('X-RateLimit-Reset-After', 0))
+                    same_window = bucket.reset_at and reset_at <= bucket.reset_at + 0.25
+                    if same_window and bucket.remaining is not None:
+                        # Responses can arrive out of order; within one window the
+                        # lowest Remaining we have seen is the truth
+                        bucket.remaining = min(bucket.remaining, remaining)
+                    else:
+                        bucket.remaining = remaining
+                        bucket.reset_at = reset_at
+            except ValueError:
+                logging.warning(f"Unparseable Discord rate-limit headers: {dict(headers)}")
+            self._cond.notify_all()
+            return None
+
+    def release(self, key):
+        """Return an in-flight slot when the request failed without a response"""
+        with self._cond:
+            bucket = self._bucket(key)
+            bucket.inflight = max(bucket.inflight - 1, 0)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'throttled': self.throttled,
+                'rate_limited': self.rate_limited,
+                'global_blocked': self._global_until > time.monotonic(),
+            }
+
+
+def _retry_after(headers, body):
+    """Seconds to wait after a 429, from the JSON body or the Retry-After header"""
+    try:
+        return float(json.loads(body)['retry_after'])
+    except (ValueError, KeyError, TypeError):
+        pass
+    try:
+        return float(headers.get('Retry-After', 1))
+    except ValueError:
+        return 1.0
+
+
+class CircuitBreaker:
+    """Stops calling Discord while it is failing
+
+    closed     sends go through; failure_threshold consecutive failed sends
+               open the breaker
+    open       sends wait for reset_timeout seconds
+    half-open  up to half_open_probes sends go through as probes; a success
+               closes the breaker, a failure opens it again
+
+    A failure is a send that ended 'failed' (5xx, timeout, connection error).
+    'rate_limited' (429s past the retries) and 4xx rejections prove Discord
+    is answering and count as success.
+    Like the delivery queue, the breaker is per process and per destination.
+    """
+
+    STATES = ('closed', 'half-open', 'open')
+
+    def __init__(self, failure_threshold, reset_timeout, half_open_probes, name='default'):
+        self._cond = threading.Condition()
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = max(half_open_probes, 1)
+        self.state = 'closed'
+        self.failures = 0        # consecutive
+        self.opened_at = 0.0
+        self.probes = 0          # half-open probes in flight
+        self.opened = 0
+        BREAKER_STATE.labels(destination=name).set(0)
+
+    def _set_state_locked(self, state):
+        if state == self.state:
+            return
+        if state == 'open':
+            self.opened_at = time.monotonic()
+            self.opened += 1
+            logging.warning(f"Discord circuit breaker for {self.name} open after {self.failures} failed sends, "
+                            f"pausing sends for {self.reset_timeout:.0f}s")
+        elif state == 'closed':
+            logging.info(f"Discord circuit breaker for {self.name} closed, sends resumed")
+        self.state = state
+        self.probes = 0
+        BREAKER_STATE.labels(destination=self.name).set(self.STATES.index(state))
+        BREAKER_TRANSITIONS.labels(destination=self.name, state=state).inc()
+        self._cond.notify_all()
+
+    def _try_acquire_locked(self):
+        if self.state == 'closed':
+            return 0
+        if self.state == 'open':
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if wait > 0:
+                return wait
+            self._set_state_locked('half-open')
+        if self.probes < self.half_open_probes:
+            self.probes += 1
+            return 0
+        # Probes are in flight; their outcome decides
+        return None
+
+    def try_acquire(self):
+        """Permission to send without blocking; returns 0 if granted, else
+        seconds to wait (None if only an in-flight probe can tell)"""
+        with self._cond:
+            return self._try_acquire_locked()
+
+    def acquire(self):
+        """Block until a send is allowed"""
+        with self._cond:
+            while True:
+                wait = self._try_acquire_locked()
+                if wait == 0:
+                    return
+                self._cond.wait(wait)
+
+    def record(self, ok):
+        """Report the outcome of a send allowed by acquire()"""
+        with self._cond:
+            if ok:
+                self.failures = 0
+                self._set_state_locked('closed')
+                return
+            self.failures += 1
+            if self.state == 'half-open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self._set_state_locked('open')
+
+    def shedding(self):
+        """True while lower-severity traffic should stay away from Discord
+
+        Once the open period is over and a probe slot is free, nothing is
+        shed, so that any notification can become the next probe.
+        """
+        with self._cond:
+            if self.state == 'closed':
+                return False
+            if self.state == 'open' and time.monotonic() < self.opened_at + self.reset_timeout:
+                return True
+            return self.probes >= self.half_open_probes
+
+    def snapshot(self):
+        with self._cond:
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic() if self.state == 'open' else 0
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'opened': self.opened,
+                'retry_in': round(max(retry_in, 0), 1),
+            }
+
+
+MATCHER_SYNTAX = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(=~|!~|!=|=)\s*(.*?)\s*$')
+DESTINATION_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+class Matcher:
+    """One Alertmanager-style label matcher: label = value, !=, =~ or !~
+
+    Regexes are fully anchored and a missing label matches as '', like
+    Alertmanager's matchers.
+    """
+
+    __slots__ = ('label', 'op', 'value', 'regex')
+
+    def __init__(self, text):
+        match = MATCHER_SYNTAX.match(text)
+        if not match:
+            raise ValueError(f"bad matcher {text!r}")
+        self.label, self.op, value = match.groups()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+        self.value = value
+        self.regex = re.compile(f'(?:{value})') if self.op in ('=~', '!~') else None
+
+    def matches(self, labels):
+        value = labels.get(self.label, '')
+        if self.op == '=':
+            return value == self.value
+        if self.op == '!=':
+            return value != self.value
+        return bool(self.regex.fullmatch(value)) == (self.op == '=~')
+
+
+class Route:
+    """Matchers plus the destinations that alerts matching all of them go to"""
+
+    __slots__ = ('matchers', 'destinations', 'continue_')
+
+    def __init__(self, matchers, destinations, continue_=False):
+        self.matchers = matchers
+        self.destinations = destinations
+        self.continue_ = continue_
+
+    def matches(self, labels):
+        return all(m.matches(labels) for m in self.matchers)
+
+
+def load_routes(path):
+    """Read a routing table; returns ({name: (url, pool size)}, routes, default destinations)
+
+    The file is JSON:
+
+        {
+          "destinations": {
+            "critical": {"url_env": "DISCORD_WEBHOOK_URL_CRITICAL"},
+            "media":    {"url_env": "DISCORD_WEBHOOK_URL_MEDIA", "pool_size": 2}
+          },
+          "routes": [
+            {"matchers": ["severity = critical"], "destinations": ["critical"], "continue": true},
+            {"matchers": ["service =~ immich|jellyfin"], "destinations": ["media"]}
+          ],
+          "default": ["default"]
+        }
+
+    Webhook URLs are secrets, so destinations normally name the environment
+    variable that holds theirs (url_env); a literal "url" works too. A
+    destination called "default" is implied by DISCORD_WEBHOOK_URL. Each
+    alert walks the routes in order like an Alertmanager route tree: a
+    matching route adds its destinations and stops the walk unless it has
+    "continue": true. Alerts no route matched go to "default" (which itself
+    defaults to the "default" destination).
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    targets = {}
+    if DISCORD_WEBHOOK_URL:
+        targets['default'] = (DISCORD_WEBHOOK_URL, HTTP_POOL_SIZE)
+    for name, spec in (config.get('destinations') or {}).items():
+        if not DESTINATION_NAME.match(name):
+            raise ValueError(f"{path}: destination name {name!r} may only use letters, digits, '-' and '_'")
+        url = spec.get('url') or os.environ.get(spec.get('url_env', ''))
+        if not url:
+            raise ValueError(f"{path}: destination {name!r} has no URL "
+                             f"(url, or url_env naming a set environment variable)")
+        targets[name] = (url, int(spec.get('pool_size', HTTP_POOL_SIZE)))
+
+    routes = []
+    for i, spec in enumerate(config.get('routes') or []):
+        names = spec.get('destinations') or []
+        unknown = [n for n in names if n not in targets]
+        if unknown:
+            raise ValueError(f"{path}: route {i} sends to unknown destinations {unknown}")
+        try:
+            matchers = [Matcher(text) for text in spec.get('matchers') or []]
+        except (ValueError, re.error) as e:
+            raise ValueError(f"{path}: route {i}: {e}") from None
+        routes.append(Route(matchers, names, bool(spec.get('continue', False))))
+
+    default = config.get('default', ['default'] if 'default' in targets else [])
+    unknown = [n for n in default if n not in targets]
+    if unknown:
+        raise ValueError(f"{path}: default sends to unknown destinations {unknown}")
+    return targets, routes, default
+
+
+def _message_index_path(name):
+    """The default destination keeps MESSAGE_INDEX_PATH, others get a sibling file"""
+    if not MESSAGE_INDEX_PATH or name == 'default':
+        return MESSAGE_INDEX_PATH
+    root, ext = os.path.splitext(MESSAGE_INDEX_PATH)
+    return f'{root}-{name}{ext}'
+
+
+class ReachabilityProbe:
+    """Cached answer to whether a webhook is reachable, for /ready
+
+    A send that Discord answered counts as a successful probe. Otherwise a
+    GET of the webhook URL (which returns the webhook object and posts
+    nothing) is made when the last answer is older than interval seconds.
+    One caller probes at a time; the others wait and reuse its answer.
+    """
+
+    def __init__(self, client, url, interval):
+        self.client = client
+        self.url = url.partition('?')[0] if url else url
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.checked_at = None
+        self.reachable = False
+        self.detail = 'not probed'
+
+    def note_answered(self):
+        """Record that Discord just answered a send"""
+        self.checked_at = time.monotonic()
+        self.reachable = True
+        self.detail = 'send answered'
+
+    def _fresh(self):
+        return self.checked_at is not None and time.monotonic() - self.checked_at < self.interval
+
+    def _probe(self):
+        if not self.url:
+            return False, 'no webhook URL'
+        try:
+            response = self.client.request('GET', self.url, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_CONNECT_TIMEOUT))
+        except Exception as e:
+            return False, f'unreachable: {e.__class__.__name__}'
+        # 429 still proves the path to Discord works
+        if response.status_code in (200, 429):
+            return True, f'HTTP {response.status_code}'
+        if response.status_code in (401, 403, 404):
+            return False, f'webhook rejected (HTTP {response.status_code})'
+        return False, f'HTTP {response.status_code}'
+
+    def check(self):
+        """(reachable, detail), probing only when the cached answer is stale"""
+        if self._fresh():
+            return self.reachable, self.detail
+        with self._lock:
+            if not self._fresh():
+                self.reachable, self.detail = self._probe()
+                self.checked_at = time.monotonic()
+            return self.reachable, self.detail
+
+    def snapshot(self):
+        return {
+            'reachable': self.reachable,
+            'detail': self.detail,
+            'age': round(time.monotonic() - self.checked_at, 1) if self.checked_at is not None else None,
+        }
+
+
+class Destination:
+    """One Discord webhook and everything that delivers to it
+
+    Every destination has its own delivery queue and sender threads, HTTP
+    connection pool (aiohttp session in asyncio mode), rate-limit buckets,
+    circuit breaker and message index. A slow or failing webhook therefore
+    only backs up its own queue while the others keep sending in parallel.
+    """
+
+    def __init__(self, name, url, pool_size):
+        self.name = name
+        self.url = url
+        self.client = DiscordClient(pool_size, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_IDLE_TIMEOUT)
+        self.session = None   # aiohttp.ClientSession, asyncio mode only
+        self.rate_limiter = RateLimiter()
+        self.breaker = CircuitBreaker(
+            BREAKER_FAILURES, BREAKER_RESET_TIMEOUT, BREAKER_HALF_OPEN_PROBES, name) if BREAKER_FAILURES > 0 else None
+        self.message_index = MessageIndex(
+            _message_index_path(name), MESSAGE_INDEX_SIZE,
+            MESSAGE_INDEX_FLUSH_INTERVAL) if MESSAGE_INDEX_SIZE > 0 else None
+        self.queue = DeliveryQueue(
+            QUEUE_MAXSIZE, QUEUE_DROP_POLICY, on_drop=_leg_dropped,
+            scheduling=QUEUE_SCHEDULING,
+            weights=parse_lane_map('RELAY_QUEUE_WEIGHTS', QUEUE_WEIGHTS, int),
+            budgets=parse_lane_map('RELAY_QUEUE_BUDGETS', QUEUE_BUDGETS, float),
+            name=name,
         )
+        self.probe = ReachabilityProbe(self.client, url, READY_PROBE_INTERVAL)
+
+    def snapshot(self):
+        return {
+            'queue_depth': self.queue.depth(),
+            'queue_dropped': self.queue.dropped,
+            'rate_limit': self.rate_limiter.snapshot(),
+            'breaker': self.breaker.snapshot() if self.breaker else None,
+            'message_index': self.message_index.snapshot() if self.message_index else None,
+        }
+
+
+def _leg_dropped(leg):
+    # Queue overflow only loses the leg from memory; the notification is
+    # parked in the spool (or the in-memory retry) for this destination
+    finish_legs([], [leg])
+
+
+dedup_cache = DedupCache(DEDUP_TTL, DEDUP_MAX_ENTRIES) if DEDUP_TTL > 0 else None
+spool = Spool(SPOOL_DIR, SPOOL_MAX_BYTES, SPOOL_FSYNC_INTERVAL) if SPOOL_DIR else None
+retry_queue = RetryQueue(RETRY_ATTEMPTS, RETRY_BACKOFF, RETRY_BACKOFF_MAX) if not spool and RETRY_ATTEMPTS > 0 else None
+storm_detector = StormDetector(STORM_WINDOW, STORM_WINDOW_ALERTS) if STORM_WINDOW_ALERTS > 0 else None
+payload_capture = PayloadCapture(CAPTURE_DIR, CAPTURE_MAX_BYTES, CAPTURE_FILES) if CAPTURE_DIR else None
+latency_tracker = LatencyTracker(
+    SLO_WINDOW, SLO_MAX_SAMPLES,
+    parse_lane_map('RELAY_SLO_TARGETS', SLO_TARGETS, float),
+    parse_lane_map('RELAY_SLO_RELAY_TARGETS', SLO_RELAY_TARGETS, float),
+    share_dir=os.environ.get('PROMETHEUS_MULTIPROC_DIR'),
+) if SLO_WINDOW > 0 else None
+
+if ROUTES_FILE:
+    _targets, ROUTES, DEFAULT_DESTINATIONS = load_routes(ROUTES_FILE)
+else:
+    _targets, ROUTES, DEFAULT_DESTINATIONS = {'default': (DISCORD_WEBHOOK_URL, HTTP_POOL_SIZE)}, [], ['default']
+destinations = {name: Destination(name, url, pool_size) for name, (url, pool_size) in _targets.items()}
+_legs_lock = threading.Lock()
+_workers = []
+_workers_lock = threading.Lock()
+_draining = threading.Event()
+_drain_lock = threading.Lock()
+_drain_result = None
+
+
+def _serialize_payload(payload):
+    body = json_bytes(payload)
+    EMBEDS_PER_MESSAGE.observe(len(payload.get('embeds', [])))
+    PAYLOAD_BYTES.observe(len(body))
+    return body
+
+
+# send_to_discord results whose notifications are retried later
+RETRY_RESULTS = ('failed', 'rate_limited')
+
+
+def _send_result(status_code, text):
+    """Map a final (non-retried) Discord response to a send_to_discord result"""
+    if status_code in [200, 204]:
+        logging.info(f"Successfully sent to Discord: {status_code}")
+        return 'sent'
+    logging.error(f"Discord returned {status_code}: {text}")
+    if status_code == 429:
+        return 'rate_limited'
+    if 400 <= status_code < 500:
+        return 'rejected'
+    return 'failed'
+
+
+def _message_id(status_code, content):
+    """ID of the message Discord returned for a ?wait=true send"""
+    if status_code != 200:
+        return None
+    try:
+        return str(json.loads(content)['id'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _discord_request(destination, message_id):
+    """(method, URL, rate-limit key) for a new message or an edit of message_id"""
+    if message_id is None:
+        url = destination.url
+        if destination.message_index:
+            url += ('&' if '?' in url else '?') + 'wait=true'
+        return 'POST', url, destination.url
+    base, _, query = destination.url.partition('?')
+    url = f'{base}/messages/{message_id}' + (f'?{query}' if query else '')
+    return 'PATCH', url, f'{base}/messages'
+
+
+def send_to_discord(destination, payload, priority=0, message_id=None):
+    """POST one payload to a destination's webhook, or PATCH it over message_id
+
+    Waits for the webhook's rate-limit bucket before each attempt and waits
+    out 429s up to RATE_LIMIT_MAX_RETRIES times; higher priority (a
+    SEVERITY_RANK) gets tokens first. Returns (result, message ID) where
+    result is 'sent', 'failed' (worth retrying later), 'rate_limited' (still
+    429 after the retries; also retried later, but Discord is answering) or
+    'rejected' (Discord refused the payload itself) and the ID is known for
+    new messages when the message index is on.
+    """
+    method, url, bucket = _discord_request(destination, message_id)
+    rate_limiter = destination.rate_limiter
+    body = _serialize_payload(payload)
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        rate_limiter.acquire(bucket, priority)
+        started = time.monotonic()
+        try:
+            response = destination.client.request(method, url, data=body, headers={'Content-Type': 'application/json'})
+        except Exception:
+            rate_limiter.release(bucket)
+            EXCEPTIONS.labels(stage='discord_post').inc()
+            raise
+        finally:
+            DISCORD_LATENCY.observe(time.monotonic() - started)
+        DISCORD_RESPONSES.labels(code=str(response.status_code)).inc()
+        retry_after = rate_limiter.update(bucket, response.status_code, response.headers, response.content)
+
+        if retry_after is None or response.status_code in [200, 204]:
+            break
+        logging.warning(f"Discord rate limited {destination.name}, retrying in {retry_after:.2f}s (attempt {attempt + 1})")
+
+    return (_send_result(response.status_code, response.text),
+            _message_id(response.status_code, response.content))
+
+
+class MessageEdit:
+    """Resolved embeds to swap into one already posted message"""
+
+    __slots__ = ('message_id', 'replacements', 'fingerprints', 'owners', 'embeds')
+
+    def __init__(self, message_id):
+        self.message_id = message_id
+        self.replacements = {}   # embed position -> resolved embed
+        self.fingerprints = []
+        self.owners = []
+        self.embeds = None       # the full edited message, set by prepare_delivery
+
+
+class DeliveryPlan:
+    """What one batch turns into: new messages and edits of earlier ones
+
+    owners[k] is the tuple of notifications behind the k-th embed across all
+    payloads and fingerprints[k] the alert to index it under (None for
+    embeds that will never be edited).
+    """
+
+    __slots__ = ('payloads', 'owners', 'fingerprints', 'edits')
+
+    def __init__(self, payloads, owners, fingerprints, edits):
+        self.payloads = payloads
+        self.owners = owners
+        self.fingerprints = fingerprints
+        self.edits = edits
+
+    def payload_slices(self):
+        """(payload, owners, fingerprints) for each new message"""
+        start = 0
+        for payload in self.payloads:
+            count = len(payload['embeds'])
+            yield payload, self.owners[start:start + count], self.fingerprints[start:start + count]
+            start += count
+
+
+def _plan_edits(message_index, edits, embeds, owners, fingerprints):
+    """Build each edited message; edits that cannot be applied become new embeds"""
+    planned = []
+    for edit in edits.values():
+        current = message_index.embeds(edit.message_id)
+        if current is not None:
+            updated = list(current)
+            for position, embed in edit.replacements.items():
+                if position < len(updated):
+                    updated[position] = clamp_embed(embed)
+            if sum(embed_length(e) for e in updated) <= MAX_EMBED_CHARS_PER_MESSAGE:
+                edit.embeds = updated
+                planned.append(edit)
+                continue
+        embeds.extend(edit.replacements.values())
+        owners.extend((owner,) for owner in edit.owners)
+        fingerprints.extend([None] * len(edit.replacements))
+    return planned
+
+
+def prepare_delivery(notifications, message_index=None):
+    """Format notifications into new Discord payloads and message edits
+
+    During an alert storm the whole batch collapses into one digest embed.
+    The most severe notifications go into the first payloads. With the
+    message index on, a resolved alert whose firing embed is indexed becomes
+    an edit of that message instead of a new embed.
+    """
+    started = time.monotonic()
+    embeds, owners, fingerprints = [], [], []
+    edits = {}
+    individual = sorted(notifications, key=lambda n: -SEVERITY_RANK[n.severity])
+    alert_count = sum(len(n.data.get('alerts', [])) for n in notifications)
+    if storm_detector and alert_count > 1 and storm_detector.active():
+        try:
+            embeds.append(format_storm_digest([n.data for n in notifications]))
+            owners.append(tuple(notifications))
+            fingerprints.append(None)
+            STORM_DIGESTS.labels(trigger='window').inc()
+            STORM_DIGESTED_ALERTS.inc(alert_count)
+            individual = []
+        except Exception as e:
+            logging.error(f"Storm digest failed, sending alerts individually: {e}")
+            EXCEPTIONS.labels(stage='format').inc()
+
+    for notification in individual:
+        alerts = notification.data.get('alerts', [])
+        try:
+            if STORM_ALERTS and len(alerts) >= STORM_ALERTS:
+                formatted = [format_storm_digest([notification.data])]
+                STORM_DIGESTS.labels(trigger='notification').inc()
+                STORM_DIGESTED_ALERTS.inc(len(alerts))
+            else:
+                formatted = format_discord_embed(notification.data)
+        except Exception as e:
+            logging.error(f"Dropping notification that cannot be formatted: {e}")
+            EXCEPTIONS.labels(stage='format').inc()
+            continue
+
+        if not message_index or len(formatted) != len(alerts):
+            embeds.extend(formatted)
+            owners.extend([(notification,)] * len(formatted))
+            fingerprints.extend([None] * len(formatted))
+            continue
+
+        status = notification.data.get('status', 'unknown')
+        for alert, embed in zip(alerts, formatted):
+            fingerprint = alert_fingerprint(alert)
+            if alert.get('status', status) == 'resolved':
+                location = message_index.lookup(fingerprint)
+                if location:
+                    edit = edits.setdefault(location[0], MessageEdit(location[0]))
+                    edit.replacements[location[1]] = embed
+                    edit.fingerprints.append(fingerprint)
+                    edit.owners.append(notification)
+                    continue
+                fingerprint = None
+            embeds.append(embed)
+            owners.append((notification,))
+            fingerprints.append(fingerprint)
+
+    planned = _plan_edits(message_index, edits, embeds, owners, fingerprints) if edits else []
+    payloads = pack_embeds(embeds)
+    FORMAT_LATENCY.observe(time.monotonic() - started)
+    if len(notifications) > 1 or len(payloads) > 1 or planned:
+        logging.info(f"Packed {len(notifications)} notifications / {len(embeds)} embeds into "
+                     f"{len(payloads)} Discord messages and {len(planned)} edits")
+    return DeliveryPlan(payloads, owners, fingerprints, planned)
+
+
+def settle_delivery(notifications, failed_groups):
+    """Split notifications into (done, failed)
+
+    failed_groups holds the owner tuples of every embed whose message could
+    not be sent. A notification is done once every message that carries one
+    of its embeds was sent, or when retrying cannot help (Discord rejected
+    the payload, or it could not be formatted).
+    """
+    failed_ids = {id(n) for group in failed_groups for n in group}
+    done = [n for n in notifications if id(n) not in failed_ids]
+    failed = [n for n in notifications if id(n) in failed_ids]
+    return done, failed
 
-        if response.status_code in [200, 204]:
-            logging.info(f"Successfully sent to Discord: {response.status_code}")
-            return jsonify({'status': 'success'}), 200
-        else:
-            logging.error(f"Discord returned {response.status_code}: {response.text}")
-            return jsonify({'error': f'Discord returned {response.status_code}'}), 500
 
+def _priority(groups):
+    """SEVERITY_RANK of the most severe notification in owner tuples"""
+    return max((SEVERITY_RANK[n.severity] for group in groups for n in group), default=0)
+
+
+def _stamp_acked(owners):
+    """Note when Discord acknowledged a message carrying these owner tuples"""
+    now = time.time()
+    for group in owners:
+        for leg in group:
+            leg.acked_at = now
+
+
+def _send_guarded(destination, payload, priority, message_id=None):
+    """send_to_discord() behind the destination's breaker; exceptions count as 'failed'"""
+    if destination.breaker:
+        destination.breaker.acquire()
+    try:
+        result, new_id = send_to_discord(destination, payload, priority, message_id)
     except Exception as e:
-        logging.error(f"Error processing webhook: {e}")
-        return jsonify({'error': str(e)}), 500
+        logging.error(f"Error delivering to Discord ({destination.name}): {e}")
+        result, new_id = 'failed', None
+    if destination.breaker:
+        destination.breaker.record(result != 'failed')
+    if result != 'failed':
+        destination.probe.note_answered()
+    DESTINATION_SENDS.labels(destination=destination.name, result=result).inc()
+    return result, new_id
+
+
+def deliver(destination, notifications):
+    """Format notifications, send them to destination as few Discord messages as possible
+
+    New messages go first, then edits of messages announcing now-resolved
+    alerts. An edit Discord refuses (usually because the message was
+    deleted) falls back to posting the resolved embeds as a new message.
+    Returns (done, failed) as settle_delivery() does.
+    """
+    message_index = destination.message_index
+    plan = prepare_delivery(notifications, message_index)
+    failed_groups = []
+    for payload, owners, fingerprints in plan.payload_slices():
+        result, message_id = _send_guarded(destination, payload, _priority(owners))
+        if result == 'sent':
+            _stamp_acked(owners)
+        if result in RETRY_RESULTS:
+            failed_groups.extend(owners)
+        elif message_id and message_index:
+            message_index.record(message_id, payload['embeds'], fingerprints)
+
+    for edit in plan.edits:
+        owners = [(owner,) for owner in edit.owners]
+        result, _ = _send_guarded(destination, {'embeds': edit.embeds}, _priority(owners), edit.message_id)
+        if result == 'sent':
+            _stamp_acked(owners)
+            message_index.edited(edit.message_id, edit.embeds, edit.fingerprints)
+            MESSAGE_EDITS.labels(outcome='edited').inc()
+            continue
+        if result == 'rejected':
+            message_index.forget(edit.message_id)
+            MESSAGE_EDITS.labels(outcome='reposted').inc()
+            for payload in pack_embeds(list(edit.replacements.values())):
+                result, _ = _send_guarded(destination, payload, _priority(owners))
+                if result in RETRY_RESULTS:
+                    break
+                if result == 'sent':
+                    _stamp_acked(owners)
+        if result in RETRY_RESULTS:
+            MESSAGE_EDITS.labels(outcome='failed').inc()
+            failed_groups.extend(owners)
+    return settle_delivery(notifications, failed_groups)
+
+
+def shed_low_severity(notifications, breaker):
+    """Split off notifications below BREAKER_SHED_BELOW while breaker sheds
+
+    Returns (keep, shed). The caller parks shed notifications in the spool
+    for replay once Discord recovers; without a spool they wait in the
+    in-memory retry, and without that they are dropped.
+    """
+    if not breaker or not breaker.shedding():
+        return notifications, []
+    keep, shed = [], []
+    for notification in notifications:
+        if SEVERITY_RANK[notification.severity] < SEVERITY_RANK[BREAKER_SHED_BELOW]:
+            shed.append(notification)
+        else:
+            keep.append(notification)
+    if shed:
+        action = 'deferred' if spool else 'retried' if retry_queue else 'dropped'
+        for notification in shed:
+            SHED_NOTIFICATIONS.labels(severity=notification.severity, action=action).inc()
+        logging.warning(f"Discord circuit breaker for {breaker.name} open, {action} {len(shed)} "
+                        f"lower-severity notifications")
+    return keep, shed
+
+
+def match_destinations(labels):
+    """Destination names for one alert's labels, walking ROUTES like Alertmanager"""
+    names, matched = [], False
+    for route in ROUTES:
+        if route.matches(labels):
+            matched = True
+            names.extend(name for name in route.destinations if name not in names)
+            if not route.continue_:
+                break
+    return names if matched else DEFAULT_DESTINATIONS
+
+
+def route(notification):
+    """One Leg per destination the notification's alerts are routed to
+
+    Destinations that already have the notification are skipped.
+    """
+    data = notification.data
+    alerts = data.get('alerts', [])
+    if not ROUTES:
+        routed = {name: alerts for name in DEFAULT_DESTINATIONS}
+    else:
+        routed = {}
+        common = data.get('commonLabels') or {}
+        for alert in alerts:
+            labels = dict(common, **alert.get('labels', {}))
+            names = match_destinations(labels)
+            if not names:
+                logging.warning(f"Alert {labels.get('alertname', '?')} matches no route, not relayed")
+            for name in names:
+                routed.setdefault(name, []).append(alert)
+        if not alerts:
+            routed = {name: alerts for name in DEFAULT_DESTINATIONS}
+    return [Leg(notification, destinations[name], data if len(items) == len(alerts) else dict(data, alerts=items))
+            for name, items in routed.items() if name not in notification.delivered]
+
+
+def finish_legs(done, failed, shed=()):
+    """Settle legs; a notification is acked once all its legs are in, or
+    parked for retry if any of them failed or was shed"""
+    if latency_tracker:
+        for leg in done:
+            if leg.acked_at is not None:
+                latency_tracker.observe(leg, leg.acked_at)
+    acked, parked = [], []
+    with _legs_lock:
+        for leg, outcome in ([(leg, 'done') for leg in done] + [(leg, 'failed') for leg in failed]
+                             + [(leg, 'shed') for leg in shed]):
+            notification = leg.notification
+            if outcome == 'done':
+                notification.delivered.add(leg.destination.name)
+            elif outcome == 'failed':
+                notification.failed = True
+            else:
+                notification.shed = True
+            notification.pending -= 1
+            if notification.pending == 0:
+                (parked if notification.failed or notification.shed else acked).append(notification)
+    if spool:
+        spool.ack(acked)
+        spool.park(parked)
+    elif parked:
+        lost = parked
+        if retry_queue:
+            # Shed legs were never sent: hold them until the breaker
+            # half-opens, without charging a delivery attempt
+            lost = retry_queue.park([n for n in parked if n.failed])
+            retry_queue.park([n for n in parked if not n.failed], delay=BREAKER_RESET_TIMEOUT)
+        if lost:
+            logging.error(f"Lost {len(lost)} notifications after {RETRY_ATTEMPTS} retries (no spool configured)")
+
+
+def dispatch(notification):
+    """Route a notification onto the delivery queue of each destination it goes to
+
+    Legs for a destination whose breaker is shedding are parked right away.
+    Returns 'queued' if any leg was queued, 'rejected' if every destination's
+    queue refused it (nothing was settled), 'dropped' or 'shed' if none was
+    queued, or 'unrouted' if no destination wants it.
+    """
+    legs = route(notification)
+    if not legs:
+        return 'unrouted'
+    with _legs_lock:
+        notification.pending = len(legs)
+        notification.failed = False
+        notification.shed = False
+
+    results, unqueued, shed_legs = [], [], []
+    for leg in legs:
+        _, shed = shed_low_severity([leg], leg.destination.breaker)
+        result = 'shed' if shed else leg.destination.queue.put(leg)
+        results.append(result)
+        if result == 'shed':
+            shed_legs.append(leg)
+        elif result == 'rejected':
+            unqueued.append(leg)
+
+    if all(result == 'rejected' for result in results):
+        return 'rejected'
+    if unqueued or shed_legs:
+        finish_legs([], unqueued, shed_legs)
+    for result in ('queued', 'dropped'):
+        if result in results:
+            return result
+    return 'shed'
+
+
+def _collect_batch(delivery_queue, lanes=None):
+    """Block for one leg, then gather more for up to COALESCE_WINDOW
+
+    lanes restricts the batch to those severity lanes.
+    """
+    batch = [delivery_queue.get(lanes=lanes)]
+    deadline = time.monotonic() + COALESCE_WINDOW
+    while len(batch) < COALESCE_MAX_NOTIFICATIONS:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(delivery_queue.get(timeout=remaining, lanes=lanes))
+        except queue.Empty:
+            break
+    return batch
+
+
+def finish_batch(destination, batch, done, failed, shed=()):
+    """Settle a batch's legs and release their queue slots"""
+    finish_legs(done, failed, shed)
+    for _ in batch:
+        destination.queue.task_done()
+
+
+def _sender_loop(destination, lanes=None):
+    while True:
+        batch = _collect_batch(destination.queue, lanes)
+        keep, shed = shed_low_severity(batch, destination.breaker)
+        done, failed = keep, []
+        try:
+            if keep:
+                done, failed = deliver(destination, keep)
+        except Exception as e:
+            logging.error(f"Error delivering to Discord ({destination.name}): {e}")
+            EXCEPTIONS.labels(stage='deliver').inc()
+        finally:
+            finish_batch(destination, batch, done, failed, shed)
+
+
+def queue_depth():
+    """Legs waiting across all destination queues"""
+    return sum(d.queue.depth() for d in destinations.values())
+
+
+def _spool_replayer():
+    """Route parked spool entries again as queue room allows"""
+    while not _draining.is_set():
+        if all(d.breaker and d.breaker.shedding() for d in destinations.values()):
+            time.sleep(SPOOL_RETRY_INTERVAL)
+            continue
+        room = min(d.queue.maxsize - d.queue.depth() for d in destinations.values())
+        parked = spool.take_parked(room)
+        rejected = []
+        for notification in parked:
+            result = dispatch(notification)
+            if result == 'rejected':
+                rejected.append(notification)
+            elif result == 'unrouted':
+                spool.ack([notification])
+        if rejected:
+            spool.park(rejected)
+        if parked:
+            logging.info(f"Re-queued {len(parked) - len(rejected)} spooled notifications")
+        time.sleep(SPOOL_RETRY_INTERVAL)
+
+
+def _memory_retrier():
+    """Route notifications from retry_queue again once their backoff is over"""
+    while not _draining.is_set():
+        rejected = []
+        for notification in retry_queue.take_due(timeout=1.0):
+            result = dispatch(notification)
+            if result == 'rejected':
+                rejected.append(notification)
+        lost = retry_queue.park(rejected)
+        if lost:
+            logging.error(f"Lost {len(lost)} notifications after {RETRY_ATTEMPTS} retries (no spool configured)")
+
+
+def start_workers(senders=None):
+    """Open the spool and start the background threads (idempotent, per process)
+
+    Each gunicorn worker calls it after fork from the post_worker_init hook
+    (the webhook handler calls it too, for test clients and embedding).
+    senders replaces the default sender threads as (name, target) pairs.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+        targets = senders
+        if targets is None:
+            targets = []
+            for destination in destinations.values():
+                targets += [(f'discord-sender-{destination.name}-{i}',
+                             lambda d=destination: _sender_loop(d))
+                            for i in range(SENDER_WORKERS)]
+                targets += [(f'discord-sender-{destination.name}-critical-{i}',
+                             lambda d=destination: _sender_loop(d, lanes=('critical',)))
+                            for i in range(CRITICAL_SENDERS)]
+        for destination in destinations.values():
+            if destination.message_index:
+                destination.message_index.open()
+        if latency_tracker:
+            latency_tracker.start()
+        if spool:
+            recovered = spool.open()
+            if recovered:
+                logging.info(f"Spool holds {recovered} undelivered notifications, replaying")
+            targets.append(('spool-replayer', _spool_replayer))
+        elif retry_queue:
+            targets.append(('memory-retrier', _memory_retrier))
+        for name, target in targets:
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def drain(timeout=DRAIN_TIMEOUT):
+    """Stop taking webhooks and wait for queued and in-flight sends to settle
+
+    Called on SIGTERM: from gunicorn's worker_exit hook, the aiohttp app's
+    shutdown and `python relay.py`. Notifications still pending at the
+    deadline stay in the spool for the next start. Returns True if every
+    destination queue settled; later calls return the first result.
+    """
+    global _drain_result
+    _draining.set()
+    with _drain_lock:
+        if _drain_result is not None:
+            return _drain_result
+        started = time.monotonic()
+        pending = sum(d.queue.unfinished() for d in destinations.values())
+        if pending:
+            logging.info(f"Draining {pending} queued and in-flight deliveries (up to {timeout:.0f}s)")
+        deadline = started + timeout
+        settled = all(d.queue.join(max(deadline - time.monotonic(), 0)) for d in destinations.values())
+        if settled:
+            logging.info(f"Drained in {time.monotonic() - started:.2f}s")
+        else:
+            left = sum(d.queue.unfinished() for d in destinations.values())
+            where = 'kept in the spool' if spool else 'lost, no spool configured'
+            logging.warning(f"Drain deadline hit, {left} deliveries unsettled ({where})")
+        if retry_queue and retry_queue.pending():
+            logging.warning(f"{retry_queue.pending()} notifications awaiting retry are lost (no spool configured)")
+        for destination in destinations.values():
+            if destination.message_index:
+                destination.message_index.flush()
+        if spool and spool.path:
+            spool.sync()
+        _drain_result = settled
+        return settled
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.monotonic()
+
+
+@app.after_request
+def _record_request(response):
+    endpoint = request.endpoint or 'unknown'
+    started = g.get('request_started')
+    if started is not None:
+        INBOUND_LATENCY.labels(endpoint=endpoint).observe(time.monotonic() - started)
+    INBOUND_REQUESTS.labels(endpoint=endpoint, code=str(response.status_code)).inc()
+    return response
+
+
+@app.teardown_request
+def _record_exception(exc):
+    if exc is not None:
+        EXCEPTIONS.labels(stage='request').inc()
+
+
+def accept_notification(alert_data):
+    """Validate, dedup, spool and enqueue one Alertmanager notification
+
+    Shared by the Flask and asyncio servers. Returns (response body, status).
+    """
+    if _draining.is_set():
+        return {'error': 'Relay is shutting down'}, 503
+    if not alert_data:
+        return {'error': 'No data received'}, 400
+    if not isinstance(alert_data, dict) or not isinstance(alert_data.get('alerts', []), list):
+        return {'error': 'Payload is not an Alertmanager notification'}, 400
+
+    logging.info(f"Received alert: {alert_data.get('status')} - {len(alert_data.get('alerts', []))} alerts")
+    if payload_capture:
+        payload_capture.write(alert_data)
+    ALERTS_PER_NOTIFICATION.observe(len(alert_data.get('alerts', [])))
+    for alert in alert_data.get('alerts', []):
+        ALERTS_RECEIVED.labels(
+            severity=alert.get('labels', {}).get('severity', 'none'),
+            status=alert.get('status', alert_data.get('status', 'unknown')),
+        ).inc()
+
+    if dedup_cache and alert_data.get('alerts'):
+        received = len(alert_data['alerts'])
+        alert_data = dedup_cache.filter(alert_data)
+        if not alert_data['alerts']:
+            logging.info(f"Suppressed duplicate notification ({received} alerts already relayed)")
+            return {'status': 'duplicate'}, 202
+
+    # filter() recorded the alerts as relayed. Alertmanager retries a 5xx or
+    # a failed request with the same payload, so anything short of accepting
+    # the notification must forget them again.
+    try:
+        body, status = _enqueue_notification(alert_data)
+    except BaseException:
+        if dedup_cache:
+            dedup_cache.forget(alert_data)
+        raise
+    if status != 202 and dedup_cache:
+        dedup_cache.forget(alert_data)
+    return body, status
+
+
+def _enqueue_notification(alert_data):
+    """Spool and dispatch a deduplicated notification; (response body, status)"""
+    if storm_detector:
+        storm_detector.observe(len(alert_data.get('alerts', [])))
+    start_workers()
+    notification = Notification(alert_data)
+    if spool:
+        spool.append(notification)
+    result = dispatch(notification)
+
+    if result in ('rejected', 'unrouted'):
+        if spool:
+            spool.ack([notification])
+        if result == 'unrouted':
+            return {'status': 'unrouted'}, 202
+        logging.error(f"Delivery queue full ({QUEUE_MAXSIZE}), rejecting notification")
+        return {'error': 'Delivery queue full'}, 503
+    if result == 'shed':
+        return {'status': 'deferred' if spool or retry_queue else 'shed'}, 202
+    if result == 'dropped':
+        logging.warning(f"Delivery queue full ({QUEUE_MAXSIZE}), dropped incoming notification")
+    return {'status': result, 'queue_depth': queue_depth()}, 202
+
+
+@app.route('/webhook', methods=['POST'])
+def webhook():
+    """Receive Alertmanager webhook and queue it for delivery to Discord"""
+    body, status = accept_notification(request.get_json(silent=True))
+    return jsonify(body), status
+
+
+def _merged_lanes():
+    """Per-lane queue stats summed over destinations (oldest_age is the max)"""
+    merged = {}
+    for destination in destinations.values():
+        for lane, stats in destination.queue.snapshot().items():
+            total = merged.setdefault(lane, dict(stats, depth=0, oldest_age=0, over_budget=0))
+            total['depth'] += stats['depth']
+            total['oldest_age'] = max(total['oldest_age'], stats['oldest_age'])
+            total['over_budget'] += stats['over_budget']
+    return merged
+
+
+def health_status():
+    """Health payload shared by the Flask and asyncio servers"""
+    per_destination = {name: d.snapshot() for name, d in destinations.items()}
+    degraded = any(d['breaker'] and d['breaker']['state'] != 'closed' for d in per_destination.values())
+    return {
+        'status': 'draining' if _draining.is_set() else 'degraded' if degraded else 'healthy',
+        'queue_depth': queue_depth(),
+        'queue_dropped': sum(d.queue.dropped for d in destinations.values()),
+        'queue_lanes': _merged_lanes(),
+        'connections': connection_stats.snapshot(),
+        'spool': spool.snapshot() if spool else None,
+        'retry': retry_queue.snapshot() if retry_queue else None,
+        'dedup': dedup_cache.snapshot() if dedup_cache else None,
+        'storm': storm_detector.snapshot() if storm_detector else None,
+        'capture': payload_capture.snapshot() if payload_capture else None,
+        'destinations': per_destination,
+    }
+
+
+def readiness_status():
+    """(payload, ready) for /ready, shared by the Flask and asyncio servers
+
+    May block for a reachability probe, at most once per
+    RELAY_READY_PROBE_INTERVAL per destination.
+    """
+    draining = _draining.is_set()
+    reasons = ['draining'] if draining else []
+    per_destination = {}
+    for name, destination in destinations.items():
+        depth = destination.queue.depth()
+        limit = max(int(destination.queue.maxsize * READY_QUEUE_RATIO), 1)
+        state = destination.breaker.state if destination.breaker else 'closed'
+        if depth >= limit:
+            reasons.append(f'{name}: queue depth {depth} >= {limit}')
+        if state == 'open':
+            reasons.append(f'{name}: circuit breaker open')
+        elif not draining:
+            reachable, detail = destination.probe.check()
+            if not reachable:
+                reasons.append(f'{name}: {detail}')
+        per_destination[name] = {
+            'queue_depth': depth,
+            'queue_limit': limit,
+            'breaker': state,
+            'probe': destination.probe.snapshot(),
+        }
+    ready = not reasons
+    return {
+        'status': 'ready' if ready else 'not ready',
+        'reasons': reasons,
+        'queue_depth': queue_depth(),
+        'destinations': per_destination,
+    }, ready
+
+
+def metrics_payload():
+    """Prometheus exposition, aggregated across gunicorn workers when multiprocess"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy'}), 200
+    return jsonify(health_status()), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 when this worker can take and deliver alerts, else 503"""
+    body, ok = readiness_status()
+    return jsonify(body), 200 if ok else 503
+
+@app.route('/slo', methods=['GET'])
+def slo():
+    """Rolling alert latency summary by severity"""
+    if not latency_tracker:
+        return jsonify({'error': 'SLO window disabled (RELAY_SLO_WINDOW=0)'}), 404
+    return jsonify(latency_tracker.summary()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics"""
+    return Response(metrics_payload(), mimetype=CONTENT_TYPE_LATEST)
+
+
+# asyncio server mode. Ingest, queue, spool, dedup, formatting and packing are
+# the same code as the Flask path; only the HTTP server and the Discord client
+# differ. Per destination, a dispatcher thread pulls coalesced batches off its
+# delivery queue and hands them to the event loop.
+
+async def _acquire_async(rate_limiter, url, priority):
+    wait = rate_limiter.try_acquire(url, False, priority)
+    if wait == 0:
+        return
+    rate_limiter.wait_start(url, priority)
+    try:
+        while wait != 0:
+            await asyncio.sleep(wait if wait is not None else 0.05)
+            wait = rate_limiter.try_acquire(url, True, priority)
+    finally:
+        rate_limiter.wait_end(url, priority)
+
+
+async def _acquire_breaker_async(breaker):
+    while True:
+        wait = breaker.try_acquire()
+        if wait == 0:
+            return
+        await asyncio.sleep(min(wait, 1.0) if wait is not None else 0.05)
+
+
+async def send_to_discord_async(destination, payload, priority=0, message_id=None):
+    """asyncio twin of send_to_discord() on the destination's aiohttp session"""
+    method, url, bucket = _discord_request(destination, message_id)
+    rate_limiter = destination.rate_limiter
+    body = _serialize_payload(payload)
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        await _acquire_async(rate_limiter, bucket, priority)
+        started = time.monotonic()
+        try:
+            async with destination.session.request(method, url, data=body, headers={'Content-Type': 'application/json'}) as response:
+                status = response.status
+                headers = response.headers
+                content = await response.read()
+        except Exception:
+            rate_limiter.release(bucket)
+            EXCEPTIONS.labels(stage='discord_post').inc()
+            raise
+        finally:
+            DISCORD_LATENCY.observe(time.monotonic() - started)
+        DISCORD_RESPONSES.labels(code=str(status)).inc()
+        retry_after = rate_limiter.update(bucket, status, headers, content)
+
+        if retry_after is None or status in [200, 204]:
+            break
+        logging.warning(f"Discord rate limited {destination.name}, retrying in {retry_after:.2f}s (attempt {attempt + 1})")
+
+    return _send_result(status, content.decode(errors='replace')), _message_id(status, content)
+
+
+async def _send_guarded_async(destination, payload, priority, message_id=None):
+    """asyncio twin of _send_guarded()"""
+    if destination.breaker:
+        await _acquire_breaker_async(destination.breaker)
+    try:
+        result, new_id = await send_to_discord_async(destination, payload, priority, message_id)
+    except Exception as e:
+        logging.error(f"Error delivering to Discord ({destination.name}): {e}")
+        result, new_id = 'failed', None
+    if destination.breaker:
+        destination.breaker.record(result != 'failed')
+    if result != 'failed':
+        destination.probe.note_answered()
+    DESTINATION_SENDS.labels(destination=destination.name, result=result).inc()
+    return result, new_id
+
+
+async def deliver_async(destination, notifications):
+    """asyncio twin of deliver()"""
+    message_index = destination.message_index
+    plan = prepare_delivery(notifications, message_index)
+    failed_groups = []
+    for payload, owners, fingerprints in plan.payload_slices():
+        result, message_id = await _send_guarded_async(destination, payload, _priority(owners))
+        if result == 'sent':
+            _stamp_acked(owners)
+        if result in RETRY_RESULTS:
+            failed_groups.extend(owners)
+        elif message_id and message_index:
+            message_index.record(message_id, payload['embeds'], fingerprints)
+
+    for edit in plan.edits:
+        owners = [(owner,) for owner in edit.owners]
+        result, _ = await _send_guarded_async(destination, {'embeds': edit.embeds}, _priority(owners), edit.message_id)
+        if result == 'sent':
+            _stamp_acked(owners)
+            message_index.edited(edit.message_id, edit.embeds, edit.fingerprints)
+            MESSAGE_EDITS.labels(outcome='edited').inc()
+            continue
+        if result == 'rejected':
+            message_index.forget(edit.message_id)
+            MESSAGE_EDITS.labels(outcome='reposted').inc()
+            for payload in pack_embeds(list(edit.replacements.values())):
+                result, _ = await _send_guarded_async(destination, payload, _priority(owners))
+                if result in RETRY_RESULTS:
+                    break
+                if result == 'sent':
+                    _stamp_acked(owners)
+        if result in RETRY_RESULTS:
+            MESSAGE_EDITS.labels(outcome='failed').inc()
+            failed_groups.extend(owners)
+    return settle_delivery(notifications, failed_groups)
+
+
+async def _deliver_batch_async(destination, batch):
+    keep, shed = shed_low_severity(batch, destination.breaker)
+    done, failed = keep, []
+    try:
+        if keep:
+            done, failed = await deliver_async(destination, keep)
+    except Exception as e:
+        logging.error(f"Error delivering to Discord ({destination.name}): {e}")
+        EXCEPTIONS.labels(stage='deliver').inc()
+    finally:
+        finish_batch(destination, batch, done, failed, shed)
+
+
+def _async_dispatcher(loop, destination, slots, lanes=None):
+    """Feed a destination's queued batches to the event loop, at most len(slots) at once"""
+    while True:
+        slots.acquire()
+        batch = _collect_batch(destination.queue, lanes)
+        future = asyncio.run_coroutine_threadsafe(_deliver_batch_async(destination, batch), loop)
+        future.add_done_callback(lambda _: slots.release())
+
+
+async def create_async_app():
+    """aiohttp application for RELAY_SERVER_MODE=asyncio
+
+    Used as the gunicorn app for aiohttp.GunicornWebWorker (see
+    gunicorn.conf.py) and by `python relay.py` in asyncio mode.
+    """
+    import aiohttp
+    from aiohttp import web
+
+    @web.middleware
+    async def instrument(request, handler):
+        started = time.monotonic()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        except Exception:
+            EXCEPTIONS.labels(stage='request').inc()
+            raise
+        finally:
+            endpoint = request.match_info.route.name or 'unknown'
+            INBOUND_LATENCY.labels(endpoint=endpoint).observe(time.monotonic() - started)
+            INBOUND_REQUESTS.labels(endpoint=endpoint, code=str(status)).inc()
+
+    async def handle_webhook(request):
+        try:
+            alert_data = await request.json()
+        except ValueError:
+            alert_data = None
+        if spool:
+            # spool.append() blocks until its group commit is fsynced
+            body, status = await asyncio.get_running_loop().run_in_executor(
+                None, accept_notification, alert_data)
+        else:
+            body, status = accept_notification(alert_data)
+        return web.json_response(body, status=status)
+
+    async def handle_health(request):
+        return web.json_response(health_status())
+
+    async def handle_ready(request):
+        # A stale probe is a blocking HTTP call
+        body, ok = await asyncio.get_running_loop().run_in_executor(None, readiness_status)
+        return web.json_response(body, status=200 if ok else 503)
+
+    async def handle_slo(request):
+        if not latency_tracker:
+            return web.json_response({'error': 'SLO window disabled (RELAY_SLO_WINDOW=0)'}, status=404)
+        return web.json_response(latency_tracker.summary())
+
+    async def handle_metrics(request):
+        return web.Response(body=metrics_payload(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+    async def on_request_start(session, ctx, params):
+        connection_stats.incr('requests')
+
+    async def on_connection_create_end(session, ctx, params):
+        connection_stats.incr('handshakes')
+
+    async def start_delivery(application):
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        loop = asyncio.get_running_loop()
+        senders = []
+        for destination in destinations.values():
+            # One session per destination: its own connection pool
+            destination.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=ASYNC_MAX_INFLIGHT, keepalive_timeout=HTTP_IDLE_TIMEOUT),
+                timeout=aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT),
+                trace_configs=[trace],
+            )
+            slots = threading.Semaphore(ASYNC_MAX_INFLIGHT)
+            senders.append((f'async-dispatcher-{destination.name}',
+                            lambda d=destination, s=slots: _async_dispatcher(loop, d, s)))
+            if CRITICAL_SENDERS:
+                critical_slots = threading.Semaphore(CRITICAL_SENDERS)
+                senders.append((f'async-dispatcher-{destination.name}-critical',
+                                lambda d=destination, s=critical_slots: _async_dispatcher(
+                                    loop, d, s, lanes=('critical',))))
+        start_workers(senders=senders)
+
+    async def drain_delivery(application):
+        # Runs after the listener closed and before the sessions are; the
+        # loop keeps serving in-flight sends while drain() waits
+        await asyncio.get_running_loop().run_in_executor(None, drain)
+
+    async def stop_delivery(application):
+        for destination in destinations.values():
+            if destination.session:
+                await destination.session.close()
+
+    application = web.Application(middlewares=[instrument])
+    application.router.add_post('/webhook', handle_webhook, name='webhook')
+    application.router.add_get('/health', handle_health, name='health')
+    application.router.add_get('/ready', handle_ready, name='ready')
+    application.router.add_get('/slo', handle_slo, name='slo')
+    application.router.add_get('/metrics', handle_metrics, name='metrics')
+    application.on_startup.append(start_delivery)
+    application.on_shutdown.append(drain_delivery)
+    application.on_cleanup.append(stop_delivery)
+    return application
+
 
 if __name__ == '__main__':
-    if not DISCORD_WEBHOOK_URL:
-        raise ValueError("DISCORD_WEBHOOK_URL environment variable must be set")
+    if not any(d.url for d in destinations.values()):
+        raise ValueError("DISCORD_WEBHOOK_URL environment variable (or RELAY_ROUTES_FILE) must be set")
+
+    if SERVER_MODE == 'asyncio':
+        from aiohttp import web
+        web.run_app(create_async_app(), host='0.0.0.0', port=9095)
+    else:
+        def _on_sigterm(signum, frame):
+            drain()
+            raise SystemExit(0)
 
-    app.run(host='0.0.0.0', port=9095)
+        signal.signal(signal.SIGTERM, _on_sigterm)
+        start_workers()
+        app.run(host='0.0.0.0', port=9095)
@@ -33,6 +33,8 @@ Usage:
     ./scripts/security/posture-local.py                  # full run
     ./scripts/security/posture-local.py --pretty         # also print to stdout
     ./scripts/security/posture-local.py --category chain # single category
+    ./scripts/security/posture-local.py --jobs 1         # collectors one at a time
+    ./scripts/security/posture-local.py --bench-podman 20 # REST API vs CLI per call
 
 Exit codes:
     0  run completed (findings may exist)
@@ -46,6 +48,7 @@ from __future__ import annotations
 
 import argparse
 import datetime as dt
+import http.client
 import json
 import os
 import re
@@ -54,8 +57,13 @@ import socket
 import ssl
 import subprocess
 import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Any, Iterable
+from urllib.parse import quote, urlencode, urlsplit
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 REPO_ROOT = SCRIPT_DIR.parent.parent
@@ -88,6 +96,7 @@ LAN_CIDRS = ("192.168.1.", "192.168.100.", "10.89.")
 class FindingStore:
     def __init__(self) -> None:
         self._items: list[dict[str, Any]] = []
+        self._prefixes: list[str] = []
         self._counters: dict[str, int] = {}
 
     def add(
@@ -105,6 +114,7 @@ class FindingStore:
         fid = f"L{prefix}-{self._counters[prefix]:04d}"
         if isinstance(evidence, str):
             evidence = [evidence]
+        self._prefixes.append(prefix)
         self._items.append(
             {
                 "id": fid,
@@ -117,6 +127,13 @@ class FindingStore:
             }
         )
 
+    def extend(self, other: FindingStore) -> None:
+        """Append another store's findings, renumbering their IDs into this store's sequence."""
+        for prefix, item in zip(other._prefixes, other._items):
+            self._counters[prefix] = self._counters.get(prefix, 0) + 1
+            self._prefixes.append(prefix)
+            self._items.append({**item, "id": f"L{prefix}-{self._counters[prefix]:04d}"})
+
     def all(self) -> list[dict[str, Any]]:
         return list(self._items)
 
@@ -152,9 +169,319 @@ def read_text(path: Path) -> str:
 
 
 def podman(*args: str, timeout: int = 15) -> tuple[int, str, str]:
+    """Run a podman command through the REST API if it covers it, else the CLI."""
+    api = podman_api()
+    if api is not None:
+        result = api.call(args, timeout)
+        if result is not None:
+            return result
     return run(["podman", *args], timeout=timeout)
 
 
+# ---------------------------------------------------------------------------
+# Podman REST backend
+# ---------------------------------------------------------------------------
+
+# auto: libpod REST API when the rootless socket answers, CLI otherwise;
+# cli: always fork the podman binary (--podman-backend)
+PODMAN_BACKEND = "auto"
+PODMAN_API_VERSION = "v4.0.0"
+
+
+def podman_socket_path() -> str | None:
+    """The libpod socket: CONTAINER_HOST if it is unix://, else the rootless default."""
+    host = os.environ.get("CONTAINER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://"):]
+    if host:
+        return None  # ssh:// or tcp:// connection; left to the CLI
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or f"/run/user/{os.getuid()}"
+    return f"{runtime_dir}/podman/podman.sock"
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def _api_message(body: bytes) -> str:
+    try:
+        return str(json.loads(body).get("message", "")) or body.decode(errors="replace")
+    except (ValueError, AttributeError):
+        return body.decode(errors="replace").strip()
+
+
+def _demux(stream: bytes) -> tuple[str, str]:
+    """Split an attach stream (8-byte frame headers, 1 = stdout, 2 = stderr)."""
+    out, err = bytearray(), bytearray()
+    pos = 0
+    while pos + 8 <= len(stream) and stream[pos] in (0, 1, 2) and stream[pos + 1:pos + 4] == b"\0\0\0":
+        size = int.from_bytes(stream[pos + 4:pos + 8], "big")
+        (err if stream[pos] == 2 else out).extend(stream[pos + 8:pos + 8 + size])
+        pos += 8 + size
+    out.extend(stream[pos:])  # a tty stream has no frames at all
+    return out.decode(errors="replace"), err.decode(errors="replace")
+
+
+class PodmanAPI:
+    """libpod REST client over the rootless unix socket.
+
+    Answers the podman calls collectors make (ps, network ls, inspect and
+    exec, in the argument shapes used here) with the CLI's (rc, stdout,
+    stderr), so collectors parse the same JSON either way. Each thread keeps
+    one connection open for the run instead of forking podman per call.
+    call() returns None for anything else, and when the socket stops
+    answering, so the caller can fall back to the CLI.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self, timeout: float) -> _UnixHTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _UnixHTTPConnection(self.path, timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def request(
+        self, method: str, path: str, body: Any = None, timeout: float = 15
+    ) -> tuple[int, bytes]:
+        """(status, body) of one libpod call on this thread's connection."""
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        while True:
+            conn = self._conn(timeout)
+            reused = conn.sock is not None
+            try:
+                conn.request(method, f"/{PODMAN_API_VERSION}/libpod{path}", payload, headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The service exits when idle and drops kept-alive connections;
+                # a fresh connection re-activates it through the socket unit
+                conn.close()
+                if not reused:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def ping(self) -> bool:
+        try:
+            return self.request("GET", "/_ping", timeout=5)[0] == 200
+        except (OSError, http.client.HTTPException):
+            return False
+
+    def call(self, args: tuple[str, ...], timeout: float) -> tuple[int, str, str] | None:
+        try:
+            if args in (("ps", "--format", "json"), ("network", "ls", "--format", "json")):
+                return self._list("/containers/json" if args[0] == "ps" else "/networks/json", timeout)
+            if len(args) > 1 and args[0] == "inspect" and not any(a.startswith("-") for a in args):
+                return self._inspect(args[1:], timeout)
+            if len(args) > 2 and args[0] == "exec" and not args[1].startswith("-"):
+                return self._exec(args[1], list(args[2:]), timeout)
+        except socket.timeout:
+            return 124, "", f"timeout after {timeout}s"
+        except (OSError, http.client.HTTPException, ValueError, KeyError):
+            return None
+        return None
+
+    def _list(self, path: str, timeout: float) -> tuple[int, str, str]:
+        status, body = self.request("GET", path, timeout=timeout)
+        if status != 200:
+            return 125, "", f"Error: {_api_message(body)}\n"
+        return 0, body.decode(errors="replace"), ""
+
+    def _inspect(self, ids: tuple[str, ...], timeout: float) -> tuple[int, str, str]:
+        # Like `podman inspect a b c`: what exists is printed, anything
+        # missing is an error line and rc 125
+        found: list[Any] = []
+        rc, err = 0, ""
+        for cid in ids:
+            status, body = self.request("GET", f"/containers/{quote(cid, safe='')}/json", timeout=timeout)
+            if status == 200:
+                found.append(json.loads(body))
+            else:
+                rc = 125
+                msg = f"no such object: \"{cid}\"" if status == 404 else _api_message(body)
+                err += f"Error: {msg}\n"
+        return rc, json.dumps(found, indent=4) + "\n", err
+
+    def _exec(self, container: str, cmd: list[str], timeout: float) -> tuple[int, str, str]:
+        status, body = self.request(
+            "POST",
+            f"/containers/{quote(container, safe='')}/exec",
+            {"AttachStdout": True, "AttachStderr": True, "Cmd": cmd},
+            timeout,
+        )
+        if status != 201:
+            return 125, "", f"Error: {_api_message(body)}\n"
+        exec_id = json.loads(body)["Id"]
+        # The start call streams the output and closes the connection when
+        # the command exits; the next request opens a new one
+        status, body = self.request("POST", f"/exec/{exec_id}/start", {"Detach": False, "Tty": False}, timeout)
+        if status != 200:
+            msg = _api_message(body)
+            rc = 127 if "not found" in msg or "no such file" in msg else 126 if "permission denied" in msg else 125
+            return rc, "", f"Error: {msg}\n"
+        out, err = _demux(body)
+        status, body = self.request("GET", f"/exec/{exec_id}/json", timeout=timeout)
+        exit_code = json.loads(body).get("ExitCode") if status == 200 else None
+        return exit_code if isinstance(exit_code, int) else 125, out, err
+
+
+_api_lock = threading.Lock()
+_api_probed: list[PodmanAPI | None] = []
+
+
+def podman_api() -> PodmanAPI | None:
+    """The REST backend if PODMAN_BACKEND allows it and the socket answers; probed once."""
+    if PODMAN_BACKEND == "cli":
+        return None
+    with _api_lock:
+        if not _api_probed:
+            path = podman_socket_path()
+            api = PodmanAPI(path) if path and os.path.exists(path) else None
+            _api_probed.append(api if api is not None and api.ping() else None)
+        return _api_probed[0]
+
+
+# podman inspect takes many containers per call; chunks bound the argv size and
+# the time one call holds libpod's storage lock
+INSPECT_CHUNK = 32
+INSPECT_PARALLEL = 2
+
+
+def _inspect_chunk(ids: list[str]) -> list[dict[str, Any]]:
+    rc, out, _ = podman("inspect", *ids, timeout=30)
+    try:
+        data = json.loads(out)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, list):
+        # A container that exited between ps and inspect fails the call
+        # (rc 125) but the others are still printed
+        return [d for d in data if isinstance(d, dict)]
+    if rc != 0 and len(ids) > 1:
+        return [d for cid in ids for d in _inspect_chunk([cid])]
+    return []
+
+
+def podman_inspect(ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Inspect data for many containers in a few batched calls, keyed by full ID."""
+    chunks = [ids[i:i + INSPECT_CHUNK] for i in range(0, len(ids), INSPECT_CHUNK)]
+    if not chunks:
+        return {}
+    with ThreadPoolExecutor(max_workers=INSPECT_PARALLEL) as pool:
+        results = list(pool.map(_inspect_chunk, chunks))
+    return {d.get("Id", ""): d for batch in results for d in batch}
+
+
+# Traefik files read by collectors; the first read fetches all of them in one exec
+TRAEFIK_FILES = ("/letsencrypt/acme.json", "/etc/hosts", "/etc/traefik/traefik.yml")
+
+
+class HostSnapshot:
+    """Run-scoped memo of the expensive host queries collectors share.
+
+    Every input is fetched on first use and then served from memory for the
+    rest of the run, so concurrent collectors trigger one `podman ps`, one
+    batched inspect and one traefik exec between them and all see the same
+    point in time. Thread-safe: a second caller waits for the first fetch.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._slots: dict[Any, list[Any]] = {}  # key -> [lock, done, value]
+        self.fetches = 0
+        self.hits = 0
+
+    def _memo(self, key: Any, fetch: Any) -> Any:
+        with self._lock:
+            slot = self._slots.setdefault(key, [threading.Lock(), False, None])
+        with slot[0]:
+            if slot[1]:
+                with self._lock:
+                    self.hits += 1
+            else:
+                slot[2] = fetch()
+                slot[1] = True
+                with self._lock:
+                    self.fetches += 1
+            return slot[2]
+
+    def podman(self, *args: str, timeout: int = 15) -> tuple[int, str, str]:
+        """podman(*args), run once per run."""
+        return self._memo(("podman", args), lambda: podman(*args, timeout=timeout))
+
+    def containers(self) -> list[dict[str, Any]]:
+        """Parsed `podman ps`; [] if it failed."""
+        rc, out, _ = self.podman("ps", "--format", "json")
+        try:
+            containers = json.loads(out) if rc == 0 else []
+        except json.JSONDecodeError:
+            containers = []
+        return containers if isinstance(containers, list) else []
+
+    def inspect(self) -> dict[str, dict[str, Any]]:
+        """Inspect data of every running container, keyed by full ID."""
+        return self._memo(
+            "inspect",
+            lambda: podman_inspect([c.get("Id", "") for c in self.containers() if c.get("Id")]),
+        )
+
+    def traefik_file(self, path: str) -> tuple[int, str]:
+        """(rc, content) of a TRAEFIK_FILES entry inside the traefik container."""
+        return self._memo("traefik_files", self._fetch_traefik_files).get(path, (1, ""))
+
+    @staticmethod
+    def _fetch_traefik_files() -> dict[str, tuple[int, str]]:
+        marker = f"@@posture-{uuid.uuid4().hex}@@"
+        script = (
+            'for f in "$@"; do if [ -r "$f" ]; then echo "%s $f 0"; cat "$f"; echo; '
+            'else echo "%s $f 1"; fi; done' % (marker, marker)
+        )
+        rc, out, _ = podman("exec", "traefik", "sh", "-c", script, "sh", *TRAEFIK_FILES, timeout=10)
+        if rc != 0:
+            # No shell in the image (or traefik is down): one cat per file
+            files: dict[str, tuple[int, str]] = {}
+            for path in TRAEFIK_FILES:
+                rc_f, out_f, _ = podman("exec", "traefik", "cat", path, timeout=10)
+                files[path] = (rc_f, out_f)
+            return files
+        files = {p: (1, "") for p in TRAEFIK_FILES}
+        # Each file is "<marker> <path> <rc>\n<content>\n". Splitting on
+        # "\n<marker> " eats the newline echo added after every file but the last
+        sections = ("\n" + out).split(f"\n{marker} ")[1:]
+        for i, section in enumerate(sections):
+            header, _, content = section.partition("\n")
+            path, _, file_rc = header.rpartition(" ")
+            if file_rc == "0":
+                if i == len(sections) - 1:
+                    content = content[:-1]
+                files[path] = (0, content)
+        return files
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"fetches": self.fetches, "hits": self.hits}
+
+
 def have(bin_name: str) -> bool:
     rc, _, _ = run(["which", bin_name], timeout=3)
     return rc == 0
@@ -190,7 +517,7 @@ def collect_meta() -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_bind_surface(f: FindingStore) -> dict[str, Any]:
+def collect_bind_surface(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     """Every TCP/UDP listener, cross-checked against firewalld open ports."""
     raw: dict[str, Any] = {}
 
@@ -290,10 +617,282 @@ def collect_bind_surface(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_container_egress(f: FindingStore) -> dict[str, Any]:
+# Egress probes: networks probed at once, and the wall-clock budget for all
+# of them (each exec is capped at 10s and at what is left of the budget)
+EGRESS_PARALLEL = 4
+EGRESS_DEADLINE = 30.0
+EGRESS_SKIPPED = "skipped: egress probe deadline passed"
+# auto: netns probes of every container, exec probes of one container per
+# network if the netns helper cannot run; netns / exec: that mode only
+# (--egress-probe)
+EGRESS_PROBE_MODE = "auto"
+# Per-check timeout of the netns probes
+EGRESS_NETNS_TIMEOUT = 2.0
+
+# Runs under `podman unshare`: the rootless user namespace owns every
+# container's network namespace, so in there a thread may setns() into
+# /proc/<pid>/ns/net. One thread per container does a DNS query to the
+# container's own nameserver and a TCP connect to 1.1.1.1:443 from inside its
+# namespace; nothing runs in the container, so distroless images are covered.
+# argv: JSON {name: pid}, per-check timeout. Prints JSON {name: result}.
+_EGRESS_NETNS_HELPER = r"""
+import ctypes, json, os, random, socket, struct, sys, threading, time
+
+targets, timeout = json.loads(sys.argv[1]), float(sys.argv[2])
+CLONE_NEWNET = 0x40000000
+libc = ctypes.CDLL(None, use_errno=True)
+
+
+def setns(fd):
+    if hasattr(os, "setns"):
+        os.setns(fd, CLONE_NEWNET)
+    elif libc.setns(fd, CLONE_NEWNET) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def nameserver(pid):
+    try:
+        with open(f"/proc/{pid}/root/etc/resolv.conf") as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) > 1 and parts[0] == "nameserver":
+                    return parts[1]
+    except OSError:
+        pass
+    return None
+
+
+def check_dns(pid):
+    server = nameserver(pid)
+    if server is None:
+        return 1, "can't resolve example.com: no nameserver in resolv.conf"
+    qid = random.randrange(1 << 16)
+    query = struct.pack(">HHHHHH", qid, 0x0100, 1, 0, 0, 0) + b"\x07example\x03com\x00" + struct.pack(">HH", 1, 1)
+    family = socket.AF_INET6 if ":" in server else socket.AF_INET
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            deadline = time.monotonic() + timeout
+            sock.sendto(query, (server, 53))
+            while True:
+                # Stray datagrams must not restart the timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise socket.timeout("timed out")
+                sock.settimeout(remaining)
+                reply = sock.recv(512)
+                if len(reply) >= 12 and struct.unpack(">H", reply[:2])[0] == qid:
+                    break
+    except OSError as e:
+        return 1, f"can't resolve example.com via {server}: {e or type(e).__name__}"
+    rcode = struct.unpack(">H", reply[2:4])[0] & 0xF
+    answers = struct.unpack(">H", reply[6:8])[0]
+    if rcode or not answers:
+        return 1, f"can't resolve example.com via {server}: rcode={rcode} answers={answers}"
+    return 0, f"example.com resolved via {server} ({answers} answers)"
+
+
+def check_tcp():
+    try:
+        with socket.create_connection(("1.1.1.1", 443), timeout=timeout):
+            return 0, "connected to 1.1.1.1:443"
+    except OSError as e:
+        return 1, f"BLOCKED: {e or type(e).__name__}"
+
+
+def probe(name, pid):
+    try:
+        fd = os.open(f"/proc/{pid}/ns/net", os.O_RDONLY)
+        try:
+            setns(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        finish(name, {"error": f"setns into pid {pid}: {e}"})
+        return
+    result = {}
+    for check, fn in (("dns", lambda: check_dns(pid)), ("tcp_out", check_tcp)):
+        started = time.monotonic()
+        rc, out = fn()
+        result[check] = {"rc": rc, "out": out, "elapsed_s": round(time.monotonic() - started, 3)}
+    finish(name, result)
+
+
+def finish(name, result):
+    with lock:
+        results[name] = result
+
+
+# Threads still running past the join are abandoned; the dump is a snapshot
+# taken under the lock so a late finisher can't change it mid-serialization.
+results, lock = {}, threading.Lock()
+threads = [threading.Thread(target=probe, args=(n, p), daemon=True) for n, p in targets.items()]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join(timeout * 3)
+with lock:
+    done = dict(results)
+print(json.dumps(done))
+"""
+
+
+def _has_way_out(c_nets: list[str], internal_flags: dict[str, bool]) -> bool:
+    """Whether any of c_nets is a network that is meant to reach the internet.
+
+    reverse_proxy, systemd-restricted-egress and the like: a container on one
+    of them reaches out through it, so probing it says nothing about the
+    isolation of its internal networks.
+    """
+    return any(
+        n.replace("systemd-", "") not in EXPECTED_INTERNAL_NETWORKS and not internal_flags.get(n, False)
+        for n in c_nets
+    )
+
+
+def _egress_exec(c_name: str, script: str, deadline: float) -> tuple[tuple[int, str, str], float]:
+    """podman exec c_name sh -c script within the deadline; (result, seconds)."""
+    started = time.monotonic()
+    remaining = int(deadline - started)
+    if remaining < 1:
+        return (124, "", EGRESS_SKIPPED), 0.0
+    result = podman("exec", c_name, "sh", "-c", script, timeout=min(10, remaining))
+    return result, time.monotonic() - started
+
+
+def _egress_probe(
+    c_name: str, net_name: str, deadline: float, t0: float
+) -> tuple[dict[str, Any], tuple[int, str, str], tuple[int, str, str]]:
+    """DNS and direct-TCP egress checks from c_name: (probe record, dns result, tcp result)."""
+    probe: dict[str, Any] = {
+        "container": c_name,
+        "network": net_name,
+        "mode": "exec",
+        "checks": {},
+        "start_s": round(time.monotonic() - t0, 3),
+    }
+    # DNS probe — expect failure on Internal=true
+    (rc_d, out_d, err_d), dns_s = _egress_exec(
+        c_name, "getent hosts example.com || nslookup example.com 2>&1 | head -5", deadline
+    )
+    probe["checks"]["dns"] = {
+        "rc": rc_d,
+        "out": (out_d + err_d).strip()[:400],
+        "elapsed_s": round(dns_s, 3),
+    }
+    # Connect probe (port 443 to a public host by IP to bypass DNS)
+    (rc_c, out_c, err_c), tcp_s = _egress_exec(
+        c_name,
+        # 1.1.1.1 is stable; timeout quickly
+        "timeout 3 sh -c '(echo > /dev/tcp/1.1.1.1/443) 2>&1' || echo BLOCKED",
+        deadline,
+    )
+    probe["checks"]["tcp_out"] = {
+        "rc": rc_c,
+        "out": (out_c + err_c).strip()[:400],
+        "elapsed_s": round(tcp_s, 3),
+    }
+    probe["elapsed_s"] = round(dns_s + tcp_s, 3)
+    return probe, (rc_d, out_d, err_d), (rc_c, out_c, err_c)
+
+
+def _egress_exec_probes(
+    containers: list[dict[str, Any]], internal_flags: dict[str, bool], started: float
+) -> list[tuple[str, str, dict[str, Any], tuple[int, str, str], tuple[int, str, str]]]:
+    """podman exec probes of one container per expected-internal network."""
+    tested_nets: set[str] = set()
+    targets: list[tuple[str, str]] = []
+    for c in containers:
+        c_name = c.get("Names", [""])[0] if c.get("Names") else c.get("Name", "")
+        c_nets = c.get("Networks") or []
+        for net_name in c_nets:
+            short = net_name.replace("systemd-", "")
+            if short not in EXPECTED_INTERNAL_NETWORKS or net_name in tested_nets:
+                continue
+            # Only test if this container has no network with a legitimate way out
+            if _has_way_out(c_nets, internal_flags):
+                continue
+            tested_nets.add(net_name)
+            targets.append((c_name, net_name))
+    if not targets:
+        return []
+
+    # Networks are probed concurrently; every exec is cut off at the shared
+    # deadline so a degraded host costs EGRESS_DEADLINE, not minutes.
+    deadline = started + EGRESS_DEADLINE
+    with ThreadPoolExecutor(max_workers=EGRESS_PARALLEL) as pool:
+        results = list(pool.map(lambda t: _egress_probe(*t, deadline, started), targets))
+    return [(c_name, net_name, *result) for (c_name, net_name), result in zip(targets, results)]
+
+
+def _egress_netns_probes(
+    containers: list[dict[str, Any]], inspected: dict[str, dict[str, Any]], internal_flags: dict[str, bool]
+) -> tuple[list[tuple[str, str, dict[str, Any], tuple[int, str, str], tuple[int, str, str]]] | None, str]:
+    """netns probes of every container on an expected-internal network.
+
+    One probe per container, reported once for each of its internal
+    networks. (None, error) if the helper could not run or entered no
+    namespace at all.
+    """
+    targets: list[tuple[str, str]] = []
+    pids: dict[str, int] = {}
+    for c in containers:
+        c_name = c.get("Names", [""])[0] if c.get("Names") else c.get("Name", "")
+        c_nets = c.get("Networks") or []
+        # Containers also on a non-internal network have a legitimate way out
+        if _has_way_out(c_nets, internal_flags):
+            continue
+        internal = [n for n in c_nets if n.replace("systemd-", "") in EXPECTED_INTERNAL_NETWORKS]
+        if not internal:
+            continue
+        targets.extend((c_name, n) for n in internal)
+        pid = ((inspected.get(c.get("Id", "")) or {}).get("State") or {}).get("Pid") or 0
+        if pid:
+            pids[c_name] = pid
+    if not targets:
+        return [], ""
+
+    results: dict[str, Any] = {}
+    if pids:
+        rc, out, err = run(
+            ["podman", "unshare", sys.executable, "-c", _EGRESS_NETNS_HELPER,
+             json.dumps(pids), str(EGRESS_NETNS_TIMEOUT)],
+            timeout=int(EGRESS_DEADLINE),
+        )
+        try:
+            results = json.loads(out) if rc == 0 else None
+        except json.JSONDecodeError:
+            results = None
+        if not isinstance(results, dict):
+            return None, (err or out).strip() or f"rc={rc}"
+        errors = [r["error"] for r in results.values() if isinstance(r, dict) and "error" in r]
+        if len(errors) == len(pids):
+            # Entered no namespace at all: a setup problem, not a container one
+            return None, errors[0]
+
+    probes = []
+    for c_name, net_name in targets:
+        result = results.get(c_name) or {}
+        if c_name not in pids:
+            result = {"error": "no PID in inspect data"}
+        probe: dict[str, Any] = {"container": c_name, "network": net_name, "mode": "netns", "checks": {}}
+        checks = []
+        for check in ("dns", "tcp_out"):
+            data = result.get(check)
+            if not isinstance(data, dict):
+                # setns failed, or the check did not finish
+                data = {"rc": 125, "out": f"skipped: {result.get('error', 'netns probe did not finish')}"}
+            probe["checks"][check] = data
+            checks.append((int(data.get("rc", 125)), str(data.get("out", "")), ""))
+        probe["elapsed_s"] = round(sum(c.get("elapsed_s", 0) for c in probe["checks"].values()), 3)
+        probes.append((c_name, net_name, probe, checks[0], checks[1]))
+    return probes, ""
+
+
+def collect_container_egress(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {"networks": {}, "probes": []}
 
-    rc, nets_json, _ = podman("network", "ls", "--format", "json")
+    rc, nets_json, _ = snap.podman("network", "ls", "--format", "json")
     if rc != 0:
         f.add(
             "egress",
@@ -331,74 +930,79 @@ def collect_container_egress(f: FindingStore) -> dict[str, Any]:
                 ),
             )
 
-    # Active probe: pick one container per internal network and attempt DNS + HTTPS out.
-    _, ps_json, _ = podman("ps", "--format", "json")
-    try:
-        containers = json.loads(ps_json)
-    except json.JSONDecodeError:
-        containers = []
-
-    tested_nets: set[str] = set()
-    for c in containers:
-        c_name = c.get("Names", [""])[0] if c.get("Names") else c.get("Name", "")
-        c_nets = c.get("Networks") or []
-        for net_name in c_nets:
-            short = net_name.replace("systemd-", "")
-            if short not in EXPECTED_INTERNAL_NETWORKS or net_name in tested_nets:
-                continue
-            # Only test if this container is NOT also on reverse_proxy (which is the escape hatch).
-            if any(n.replace("systemd-", "") == "reverse_proxy" for n in c_nets):
-                continue
-            tested_nets.add(net_name)
-            probe = {"container": c_name, "network": net_name, "checks": {}}
-            # DNS probe — expect failure on Internal=true
-            rc_d, out_d, err_d = podman(
-                "exec",
-                c_name,
-                "sh",
-                "-c",
-                "getent hosts example.com || nslookup example.com 2>&1 | head -5",
-                timeout=10,
-            )
-            probe["checks"]["dns"] = {
-                "rc": rc_d,
-                "out": (out_d + err_d).strip()[:400],
-            }
-            # Connect probe (port 443 to a public host by IP to bypass DNS)
-            rc_c, out_c, err_c = podman(
-                "exec",
-                c_name,
-                "sh",
-                "-c",
-                # 1.1.1.1 is stable; timeout quickly
-                "timeout 3 sh -c '(echo > /dev/tcp/1.1.1.1/443) 2>&1' || echo BLOCKED",
-                timeout=10,
-            )
-            probe["checks"]["tcp_out"] = {
-                "rc": rc_c,
-                "out": (out_c + err_c).strip()[:400],
-            }
-            raw["probes"].append(probe)
-
-            # Analyse
-            dns_reached = (
-                rc_d == 0 and "example.com" in out_d and "can't" not in (out_d + err_d)
-            )
-            tcp_reached = "BLOCKED" not in (out_c + err_c) and rc_c == 0
-            short = net_name.replace("systemd-", "")
-            expected_isolated = short in EXPECTED_INTERNAL_NETWORKS
-            if expected_isolated and (dns_reached or tcp_reached):
+    internal_flags = {name: bool(n["internal"]) for name, n in raw["networks"].items()}
+
+    # Active probe: attempt DNS + HTTPS out from containers on internal networks,
+    # every one of them from the host side (netns), else one per network (exec).
+    containers = snap.containers()
+    started = time.monotonic()
+    probes = None
+    if EGRESS_PROBE_MODE != "exec":
+        probes, netns_error = _egress_netns_probes(containers, snap.inspect(), internal_flags)
+        if probes is None:
+            raw["netns_error"] = netns_error[:400]
+            if EGRESS_PROBE_MODE == "netns":
                 f.add(
                     "egress",
-                    "critical",
-                    f"{c_name} on {net_name} reached the internet — egress isolation broken",
-                    evidence=[
-                        f"dns_rc={rc_d} dns_out={out_d.strip()[:200]}",
-                        f"tcp_rc={rc_c} tcp_out={out_c.strip()[:200]}",
-                    ],
+                    "medium",
+                    "netns egress probe helper failed — no egress probes ran",
+                    evidence=[netns_error[:400]],
                     adr_refs=["#141"],
-                    hint="Expected Internal=true. Investigate podman network flags and container multi-network membership.",
+                    hint="Needs `podman unshare` and readable /proc/<pid>/ns/net. Use --egress-probe exec meanwhile.",
                 )
+                probes = []
+    raw["probe_mode"] = "netns" if probes is not None else "exec"
+    if probes is None:
+        probes = _egress_exec_probes(containers, internal_flags, started)
+    raw["probe_deadline_s"] = EGRESS_DEADLINE
+    raw["probe_wall_s"] = round(time.monotonic() - started, 3)
+
+    # A netns probe covers every internal network of its container at once, so
+    # a breach is reported once per container.
+    breaches: dict[str, tuple[list[str], list[str]]] = {}
+    for c_name, net_name, probe, (rc_d, out_d, err_d), (rc_c, out_c, err_c) in probes:
+        raw["probes"].append(probe)
+
+        # Analyse
+        dns_reached = (
+            rc_d == 0 and "example.com" in out_d and "can't" not in (out_d + err_d)
+        )
+        tcp_reached = "BLOCKED" not in (out_c + err_c) and rc_c == 0
+        short = net_name.replace("systemd-", "")
+        expected_isolated = short in EXPECTED_INTERNAL_NETWORKS
+        if expected_isolated and (dns_reached or tcp_reached):
+            nets, _ = breaches.setdefault(
+                c_name,
+                ([], [
+                    f"dns_rc={rc_d} dns_out={out_d.strip()[:200]}",
+                    f"tcp_rc={rc_c} tcp_out={out_c.strip()[:200]}",
+                ]),
+            )
+            nets.append(net_name)
+    for c_name, (nets, evidence) in breaches.items():
+        f.add(
+            "egress",
+            "critical",
+            f"{c_name} on {', '.join(nets)} reached the internet — egress isolation broken",
+            evidence=evidence,
+            adr_refs=["#141"],
+            hint="Expected Internal=true. Investigate podman network flags and container multi-network membership.",
+        )
+
+    untested = []
+    for p in raw["probes"]:
+        skipped = [c["out"] for c in p["checks"].values() if c["out"].startswith("skipped:")]
+        if skipped:
+            untested.append(f"{p['network']} ({p['container']}): {skipped[0][:200]}")
+    if untested:
+        f.add(
+            "egress",
+            "medium",
+            f"Egress checks incomplete for {len(untested)} probe(s) (deadline {EGRESS_DEADLINE:.0f}s or netns entry failed)",
+            evidence=untested,
+            adr_refs=["#141"],
+            hint="Isolation of these networks was not fully tested. podman is hanging, the host is overloaded, or a container exited mid-run.",
+        )
     return raw
 
 
@@ -413,7 +1017,7 @@ MIDDLEWARE_MIN_CHAIN = {
 }
 
 
-def collect_traefik_chain(f: FindingStore) -> dict[str, Any]:
+def collect_traefik_chain(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     routers_yml = read_text(DYNAMIC / "routers.yml")
     middleware_yml = read_text(DYNAMIC / "middleware.yml")
@@ -551,7 +1155,7 @@ def collect_traefik_chain(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_crowdsec(f: FindingStore) -> dict[str, Any]:
+def collect_crowdsec(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     rc_ps, _, _ = podman("exec", "crowdsec", "true", timeout=5)
     if rc_ps != 0:
@@ -640,16 +1244,115 @@ def collect_crowdsec(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_loki_liveness(f: FindingStore) -> dict[str, Any]:
+class HttpPool:
+    """Keep-alive HTTP connections, one per thread and host:port."""
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def get(self, url: str, timeout: float, connect_timeout: float | None = None) -> tuple[int, bytes]:
+        """(status, body) of GET url; raises OSError / HTTPException on transport errors.
+
+        connect_timeout, if given, bounds only the TCP connect of a new
+        connection; timeout covers every read.
+        """
+        parts = urlsplit(url)
+        conns = self._local.__dict__.setdefault("conns", {})
+        key = (parts.hostname, parts.port or 80)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        while True:
+            conn = conns.get(key)
+            if conn is None:
+                conn = conns[key] = http.client.HTTPConnection(*key, timeout=timeout)
+            reused = conn.sock is not None
+            try:
+                if not reused:
+                    conn.timeout = connect_timeout or timeout
+                    conn.connect()
+                conn.timeout = timeout
+                conn.sock.settimeout(timeout)
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if not reused:
+                    raise
+            except BaseException:
+                conn.close()
+                raise
+
+
+HTTP_POOL = HttpPool()
+
+# Loki's HTTP API, from the host when it can reach Loki (POSTURE_LOKI_URL,
+# else a published 3100/tcp), otherwise through `podman exec prometheus wget`.
+# Container IPs are not used: a rootless host can't route to the bridge.
+LOKI_URL_ENV = "POSTURE_LOKI_URL"
+LOKI_CONNECT_TIMEOUT = 2.0
+# Bucket of the per-job activity query; last-ingest times are this coarse
+LOKI_ACTIVITY_STEP = 60
+
+
+class LokiAPI:
+    """GETs against Loki, host-side through HTTP_POOL with podman exec as fallback.
+
+    The first host-side transport error switches the rest of the run to exec.
+    """
+
+    def __init__(self, snap: HostSnapshot) -> None:
+        self.base = os.environ.get(LOKI_URL_ENV, "").rstrip("/") or self._published_url(snap)
+        self.via = "host" if self.base else "exec"
+        self.host_error: str | None = None
+
+    @staticmethod
+    def _published_url(snap: HostSnapshot) -> str | None:
+        inspected = snap.inspect()
+        for c in snap.containers():
+            if "loki" not in (c.get("Names") or []):
+                continue
+            ports = ((inspected.get(c.get("Id", "")) or {}).get("NetworkSettings") or {}).get("Ports") or {}
+            for binding in ports.get("3100/tcp") or []:
+                host_port = (binding or {}).get("HostPort")
+                if host_port:
+                    host_ip = binding.get("HostIp") or "127.0.0.1"
+                    if host_ip in ("0.0.0.0", "::"):
+                        host_ip = "127.0.0.1"
+                    elif ":" in host_ip:
+                        host_ip = f"[{host_ip}]"
+                    return f"http://{host_ip}:{host_port}"
+        return None
+
+    def get(self, path: str, params: dict[str, Any] | None = None, timeout: int = 10) -> tuple[int, str, str]:
+        """(rc, body, err) like the wget exec: rc 0 only for HTTP 200."""
+        query = f"?{urlencode(params)}" if params else ""
+        if self.via == "host":
+            try:
+                # Short connect timeout so an unreachable Loki costs
+                # LOKI_CONNECT_TIMEOUT before the fallback; slow queries keep
+                # the full read timeout
+                status, body = HTTP_POOL.get(
+                    f"{self.base}{path}{query}", timeout=timeout, connect_timeout=LOKI_CONNECT_TIMEOUT
+                )
+                text = body.decode(errors="replace")
+                return (0, text, "") if status == 200 else (8, text, f"HTTP {status}")
+            except (OSError, http.client.HTTPException) as e:
+                self.via = "exec"
+                self.host_error = f"{self.base}: {type(e).__name__}: {e}"
+        return podman("exec", "prometheus", "wget", "-qO-", f"http://loki:3100{path}{query}", timeout=timeout)
+
+
+def collect_loki_liveness(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     # Loki is on reverse_proxy + monitoring networks, bound to 3100 internally.
-    # Use Traefik's /etc/hosts shim: resolve via container exec.
-    # Probe via prometheus container (has wget; shares reverse_proxy network with loki).
-    # promtail is distroless — no shell/wget available.
-    rc, labels, err = podman(
-        "exec", "prometheus", "wget", "-qO-",
-        "http://loki:3100/loki/api/v1/labels", timeout=10,
-    )
+    # Host-side if reachable; else probe via prometheus container (has wget;
+    # shares reverse_proxy network with loki). promtail is distroless — no
+    # shell/wget available.
+    loki = LokiAPI(snap)
+    rc, labels, err = loki.get("/loki/api/v1/labels")
+    raw["loki_via"] = loki.via
+    if loki.host_error:
+        raw["loki_host_error"] = loki.host_error[:200]
     if rc != 0:
         f.add(
             "loki",
@@ -665,10 +1368,7 @@ def collect_loki_liveness(f: FindingStore) -> dict[str, Any]:
         raw["labels"] = []
 
     # Per-job last-ingest probe
-    _, jobs_out, _ = podman(
-        "exec", "prometheus", "wget", "-qO-",
-        "http://loki:3100/loki/api/v1/label/job/values", timeout=10,
-    )
+    _, jobs_out, _ = loki.get("/loki/api/v1/label/job/values")
     try:
         jobs = json.loads(jobs_out).get("data", [])
     except json.JSONDecodeError:
@@ -677,33 +1377,34 @@ def collect_loki_liveness(f: FindingStore) -> dict[str, Any]:
 
     now = int(dt.datetime.now(dt.timezone.utc).timestamp() * 1_000_000_000)
     window = 30 * 60 * 1_000_000_000  # 30 minutes
-    per_job_last: dict[str, int | None] = {}
-    for job in jobs:
-        # Query last entry timestamp
-        q = f'{{job="{job}"}}'
-        url = (
-            f"http://loki:3100/loki/api/v1/query_range?"
-            f"query={q}&limit=1&start={now - window}&end={now}&direction=backward"
-        )
-        rc_q, out_q, _ = podman("exec", "prometheus", "wget", "-qO-", url, timeout=10)
-        if rc_q != 0:
-            per_job_last[job] = None
-            continue
+    # One metric query for every job: entries per step, so the last step of a
+    # job's series is its latest activity (to LOKI_ACTIVITY_STEP resolution)
+    rc_q, out_q, _ = loki.get(
+        "/loki/api/v1/query_range",
+        {
+            "query": f'sum by (job) (count_over_time({{job=~".+"}}[{LOKI_ACTIVITY_STEP}s]))',
+            "start": now - window,
+            "end": now,
+            "step": LOKI_ACTIVITY_STEP,
+        },
+        timeout=15,
+    )
+    latest: dict[str, int] = {}
+    if rc_q == 0:
         try:
-            data = json.loads(out_q)
-            results = data.get("data", {}).get("result", [])
-            last_ts = None
-            for stream in results:
-                values = stream.get("values", [])
-                if values:
-                    last_ts = int(values[0][0])
-                    break
-            per_job_last[job] = last_ts
-        except json.JSONDecodeError:
-            per_job_last[job] = None
+            for series in json.loads(out_q).get("data", {}).get("result", []):
+                job = (series.get("metric") or {}).get("job")
+                active = [float(ts) for ts, count in series.get("values", []) if float(count) > 0]
+                if job and active:
+                    latest[job] = int(max(active) * 1_000_000_000)
+        except (json.JSONDecodeError, TypeError, ValueError):
+            latest = {}
+    per_job_last: dict[str, int | None] = {job: latest.get(job) for job in jobs}
 
     raw["per_job_last_ingest_ns"] = per_job_last
+    raw["last_ingest_resolution_s"] = LOKI_ACTIVITY_STEP
     raw["now_ns"] = now
+    raw["loki_via"] = loki.via
 
     for job, last in per_job_last.items():
         if last is None:
@@ -726,9 +1427,9 @@ def collect_loki_liveness(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_certs(f: FindingStore) -> dict[str, Any]:
+def collect_certs(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
-    rc, acme, _ = podman("exec", "traefik", "cat", "/letsencrypt/acme.json", timeout=10)
+    rc, acme = snap.traefik_file("/letsencrypt/acme.json")
     if rc != 0 or not acme.strip():
         f.add(
             "cert",
@@ -814,25 +1515,15 @@ SENSITIVE_MOUNT_PATTERNS = [
 ]
 
 
-def collect_container_hardening(f: FindingStore) -> dict[str, Any]:
+def collect_container_hardening(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {"containers": []}
-    rc, ps_json, _ = podman("ps", "--format", "json")
-    if rc != 0:
-        return raw
-    try:
-        containers = json.loads(ps_json)
-    except json.JSONDecodeError:
-        return raw
-
+    containers = snap.containers()
+    inspected = snap.inspect()
     for c in containers:
         names = c.get("Names") or [c.get("Name", "")]
         name = names[0] if names else ""
-        rc_i, insp, _ = podman("inspect", name, timeout=15)
-        if rc_i != 0:
-            continue
-        try:
-            data = json.loads(insp)[0]
-        except (json.JSONDecodeError, IndexError):
+        data = inspected.get(c.get("Id", ""))
+        if data is None:
             continue
         hc = data.get("HostConfig", {}) or {}
         cfg = data.get("Config", {}) or {}
@@ -944,12 +1635,31 @@ def _parse_sshd_config() -> dict[str, str]:
     return effective
 
 
-def collect_ssh_surface(f: FindingStore) -> dict[str, Any]:
+def collect_ssh_surface(
+    f: FindingStore, snap: HostSnapshot, deps: dict[str, dict[str, Any]]
+) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     effective = _parse_sshd_config()
     raw["sshd_effective"] = effective
     raw["sshd_note"] = "Parsed from sshd_config + sshd_config.d/*.conf (no sudo). Match blocks not expanded."
 
+    # A ListenAddress that sshd is not honouring (config edited, sshd not
+    # reloaded) leaves it on every interface
+    port = effective.get("port", "22").split()[0]
+    ssh_listeners = [
+        l for l in deps.get("bind", {}).get("listeners", []) if l["proto"] == "tcp" and str(l["port"]) == port
+    ]
+    raw["sshd_listeners"] = [f"{l['host']}:{l['port']}" for l in ssh_listeners]
+    wildcard = [l for l in ssh_listeners if l["host"] in ("0.0.0.0", "::", "*")]
+    if "listenaddress" in effective and wildcard:
+        f.add(
+            "auth",
+            "medium",
+            f"sshd listens on {wildcard[0]['host']}:{port} although sshd_config sets ListenAddress",
+            evidence=[f"ListenAddress {effective['listenaddress']}", *raw["sshd_listeners"][:5]],
+            hint="sshd_config change not applied — `sudo systemctl reload sshd`, then re-run.",
+        )
+
     defaults_if_missing = {
         "permitrootlogin": "prohibit-password",
         "passwordauthentication": "yes",
@@ -1010,7 +1720,7 @@ def collect_ssh_surface(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_drift(f: FindingStore) -> dict[str, Any]:
+def collect_drift(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     # Working tree
     rc, wt, _ = run(
@@ -1060,7 +1770,7 @@ def collect_drift(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_journal(f: FindingStore) -> dict[str, Any]:
+def collect_journal(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     # SELinux denials in last 24h
     rc, denials, _ = run(
@@ -1134,14 +1844,10 @@ def collect_journal(f: FindingStore) -> dict[str, Any]:
 # ---------------------------------------------------------------------------
 
 
-def collect_adr_compliance(f: FindingStore) -> dict[str, Any]:
+def collect_adr_compliance(f: FindingStore, snap: HostSnapshot) -> dict[str, Any]:
     raw: dict[str, Any] = {}
     # ADR-018: multi-network containers get static IPs + /etc/hosts shim
-    rc, ps_json, _ = podman("ps", "--format", "json")
-    try:
-        containers = json.loads(ps_json)
-    except (json.JSONDecodeError, TypeError):
-        containers = []
+    containers = snap.containers()
 
     multi_net = []
     for c in containers:
@@ -1152,7 +1858,7 @@ def collect_adr_compliance(f: FindingStore) -> dict[str, Any]:
     raw["multi_network_containers"] = multi_net
 
     # Check for /etc/hosts overrides in traefik container (where the shim lives)
-    rc, hosts, _ = podman("exec", "traefik", "cat", "/etc/hosts", timeout=5)
+    rc, hosts = snap.traefik_file("/etc/hosts")
     raw["traefik_etc_hosts"] = hosts.splitlines() if rc == 0 else []
     static_ip_entries = [
         l for l in raw["traefik_etc_hosts"] if "10.89." in l and not l.startswith("#")
@@ -1160,7 +1866,7 @@ def collect_adr_compliance(f: FindingStore) -> dict[str, Any]:
     raw["static_ip_entries"] = static_ip_entries
 
     # ADR-016: labels=false for Traefik provider (no routing in container labels)
-    rc, trfk_yml, _ = podman("exec", "traefik", "cat", "/etc/traefik/traefik.yml", timeout=5)
+    rc, trfk_yml = snap.traefik_file("/etc/traefik/traefik.yml")
     if rc == 0 and "exposedByDefault: false" not in trfk_yml:
         f.add(
             "adr",
@@ -1193,38 +1899,196 @@ COLLECTORS: dict[str, Any] = {
     "adr": collect_adr_compliance,
 }
 
+# Every collector is called as fn(findings, snapshot). Collectors that need
+# another collector's raw output are listed here (name -> names it waits for)
+# and called as fn(findings, snapshot, deps), deps mapping each dependency to
+# its raw dict. Everything else runs concurrently.
+COLLECTOR_DEPS: dict[str, tuple[str, ...]] = {
+    # sshd's actual listeners, from bind's `ss` output
+    "auth": ("bind",),
+}
+
+DEFAULT_JOBS = 6
+
+
+def _with_deps(cats: list[str]) -> list[str]:
+    """cats plus everything they depend on, in COLLECTORS order."""
+    wanted: set[str] = set()
+    stack = list(cats)
+    while stack:
+        cat = stack.pop()
+        if cat not in wanted:
+            wanted.add(cat)
+            stack.extend(COLLECTOR_DEPS.get(cat, ()))
+    return [c for c in COLLECTORS if c in wanted]
+
+
+def _run_collector(
+    cat: str, snap: HostSnapshot, deps: dict[str, dict[str, Any]] | None
+) -> tuple[dict[str, Any], FindingStore, float]:
+    """One collector into its own FindingStore; a crash becomes a finding."""
+    store = FindingStore()
+    started = time.monotonic()
+    try:
+        fn = COLLECTORS[cat]
+        raw = (fn(store, snap, deps) if deps is not None else fn(store, snap)) or {}
+    except Exception as e:
+        raw = {}
+        store.add(
+            cat,
+            "medium",
+            f"collector '{cat}' crashed: {type(e).__name__}",
+            evidence=[str(e)[:400]],
+            hint="Collector bug — does not invalidate other categories.",
+        )
+    return raw, store, time.monotonic() - started
+
+
+def run_collectors(
+    cats: list[str], jobs: int, snap: HostSnapshot | None = None
+) -> tuple[dict[str, dict[str, Any]], FindingStore, dict[str, float]]:
+    """Run cats on up to jobs threads, each as soon as its dependencies are done.
+
+    All collectors share snap (a fresh HostSnapshot by default).
+
+    Findings are merged in cats order once everything finished, so IDs come
+    out the same as a sequential run whatever the completion order.
+    Returns (raw per category, findings, wall seconds per category).
+    """
+    raw: dict[str, dict[str, Any]] = {}
+    stores: dict[str, FindingStore] = {}
+    wall: dict[str, float] = {}
+    snap = snap or HostSnapshot()
+    waiting = {c: [d for d in COLLECTOR_DEPS.get(c, ()) if d in cats] for c in cats}
+    with ThreadPoolExecutor(max_workers=max(jobs, 1), thread_name_prefix="collector") as pool:
+        running: dict[Any, str] = {}
+        while waiting or running:
+            for cat in [c for c in cats if c in waiting and all(d in raw for d in waiting[c])]:
+                needs = waiting.pop(cat)
+                deps = {d: raw[d] for d in needs} if cat in COLLECTOR_DEPS else None
+                running[pool.submit(_run_collector, cat, snap, deps)] = cat
+            if not running:
+                raise RuntimeError(f"COLLECTOR_DEPS cycle among {sorted(waiting)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                cat = running.pop(fut)
+                raw[cat], stores[cat], wall[cat] = fut.result()
+
+    findings = FindingStore()
+    for cat in cats:
+        findings.extend(stores[cat])
+    return {c: raw[c] for c in cats}, findings, {c: round(wall[c], 3) for c in cats}
+
+
+def bench_podman(n: int) -> int:
+    """Median wall time per call of each podman query, CLI vs REST API."""
+    api = podman_api()
+    if api is None:
+        print(f"ERROR: podman API socket not answering ({podman_socket_path()})", file=sys.stderr)
+        return 2
+    rc, out, _ = run(["podman", "ps", "--format", "json"])
+    containers = json.loads(out) if rc == 0 else []
+    if not containers:
+        print("ERROR: no running containers to benchmark against", file=sys.stderr)
+        return 2
+    names = [(c.get("Names") or [""])[0] for c in containers]
+    target = "traefik" if "traefik" in names else names[0]
+    queries = [
+        ("ps", ("ps", "--format", "json")),
+        ("network ls", ("network", "ls", "--format", "json")),
+        ("inspect x1", ("inspect", containers[0]["Id"])),
+        (f"inspect x{min(len(containers), INSPECT_CHUNK)}",
+         ("inspect", *[c["Id"] for c in containers[:INSPECT_CHUNK]])),
+        (f"exec {target} true", ("exec", target, "true")),
+    ]
+    print(f"{'query':<24} {'cli ms':>9} {'api ms':>9} {'saved':>7}  same")
+    for label, args in queries:
+        timings: dict[str, list[float]] = {"cli": [], "api": []}
+        results: dict[str, Any] = {}
+        for _ in range(n):
+            for backend in ("cli", "api"):
+                started = time.perf_counter()
+                rc, out, _ = run(["podman", *args], timeout=30) if backend == "cli" else api.call(args, 30)
+                timings[backend].append((time.perf_counter() - started) * 1000)
+                results[backend] = (rc, out)
+        cli_ms, api_ms = (sorted(t)[len(t) // 2] for t in timings.values())
+        print(
+            f"{label:<24} {cli_ms:>9.1f} {api_ms:>9.1f} {1 - api_ms / cli_ms:>7.0%}  "
+            f"{_same_output(args[0], results['cli'], results['api'])}"
+        )
+    return 0
+
+
+def _same_output(cmd: str, cli: tuple[int, str], api: tuple[int, str]) -> bool:
+    """Whether both backends gave collectors the same thing to parse."""
+    if cmd == "exec":
+        return cli == api
+    if cli[0] != api[0]:
+        return False
+    a, b = json.loads(cli[1]), json.loads(api[1])
+    if cmd == "ps":
+        # The CLI renders Created/CreatedAt/Status for humans; collectors use none of them
+        keep = ("Id", "Names", "Networks", "Image", "State", "Labels", "Pid")
+        a, b = ([{k: c.get(k) for k in keep} for c in x] for x in (a, b))
+    return a == b
+
 
 def main(argv: list[str] | None = None) -> int:
     ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
     ap.add_argument("--category", choices=sorted(COLLECTORS.keys()), help="run one only")
     ap.add_argument("--pretty", action="store_true", help="also print JSON to stdout")
     ap.add_argument("--stdout-only", action="store_true", help="don't write report file")
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"collectors to run at once (default {DEFAULT_JOBS}; 1 = sequential)",
+    )
+    ap.add_argument(
+        "--podman-backend",
+        choices=("auto", "cli"),
+        default="auto",
+        help="auto: libpod REST socket when it answers, else the podman CLI (default auto)",
+    )
+    ap.add_argument(
+        "--egress-probe",
+        choices=("auto", "netns", "exec"),
+        default="auto",
+        help="netns: every internal-network container from the host side; exec: podman exec into "
+        "one container per network; auto: netns, else exec (default auto)",
+    )
+    ap.add_argument(
+        "--bench-podman",
+        type=int,
+        metavar="N",
+        help="time N calls of each podman query on both backends, print and exit",
+    )
     args = ap.parse_args(argv)
 
+    global PODMAN_BACKEND, EGRESS_PROBE_MODE
+    PODMAN_BACKEND = args.podman_backend
+    EGRESS_PROBE_MODE = args.egress_probe
+    if args.bench_podman:
+        return bench_podman(args.bench_podman)
+
     if not (REPO_ROOT / "CLAUDE.md").exists():
         print(f"ERROR: not in repo root ({REPO_ROOT})", file=sys.stderr)
         return 2
-    if not have("podman"):
+    if podman_api() is None and not have("podman"):
         print("ERROR: podman not found", file=sys.stderr)
         return 2
 
-    findings = FindingStore()
-    raw: dict[str, Any] = {}
-
-    cats = [args.category] if args.category else list(COLLECTORS.keys())
-    for cat in cats:
-        try:
-            raw[cat] = COLLECTORS[cat](findings) or {}
-        except Exception as e:
-            findings.add(
-                cat,
-                "medium",
-                f"collector '{cat}' crashed: {type(e).__name__}",
-                evidence=[str(e)[:400]],
-                hint="Collector bug — does not invalidate other categories.",
-            )
+    cats = _with_deps([args.category]) if args.category else list(COLLECTORS.keys())
+    started = time.monotonic()
+    snap = HostSnapshot()
+    raw, findings, wall = run_collectors(cats, args.jobs, snap)
 
     meta = collect_meta()
+    meta["jobs"] = args.jobs
+    meta["run_wall_s"] = round(time.monotonic() - started, 3)
+    meta["collector_wall_s"] = wall
+    meta["snapshot"] = snap.stats()
+    meta["podman_backend"] = "api" if podman_api() is not None else "cli"
     items = findings.all()
     summary: dict[str, int] = {}
     for it in items: